@@ -1,173 +1,64 @@
-import os
-import pickle
-import numpy as np
-import requests
-import re
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from bs4 import BeautifulSoup
-from googlesearch import search
-import urllib3
+from onnxencoder import load_query_encoder
+from startup import prewarm
+from metrics import start_metrics_server
+from sites import ShardRouter, load_registry
+from asyncpipeline import answer_query
+from ingestqueue import start_ingest_worker
 import streamlit as st
 
-# Disable insecure request warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# The query pipeline lives in asyncpipeline.py and imp.py. Their heavy
+# dependencies (sentence_transformers/torch, sklearn, bs4, requests,
+# googlesearch, groq) are imported on first use; prewarm() loads them before
+# the first query.
 
 # ------------------------------
-# VECTOR DATABASE FUNCTIONS
-# ------------------------------
-
-def load_vector_database(pickle_file=r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"):
-    with open(pickle_file, "rb") as f:
-        vector_db = pickle.load(f)
-    return vector_db
-
-def save_vector_database(vector_db, pickle_file=r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"):
-    with open(pickle_file, "wb") as f:
-        pickle.dump(vector_db, f)
-
-def query_vector_database(query, model, doc_vectors, metadata, threshold=0.5, top_n=5):
-    """
-    Encode the query, compute cosine similarities, and return top_n records
-    if the maximum similarity is above the threshold; else return None.
-    """
-    query_vec = model.encode([query])
-    similarities = cosine_similarity(query_vec, doc_vectors).flatten()
-    max_sim = np.max(similarities)
-    if max_sim < threshold:
-        return None, max_sim
-    else:
-        sorted_idx = np.argsort(similarities)[::-1]
-        results = []
-        for idx in sorted_idx[:top_n]:
-            results.append({
-                "url": metadata[idx]["url"],
-                "content": metadata[idx]["content"],
-                "similarity": similarities[idx]
-            })
-        return results, max_sim
-
-def update_vector_database(vector_db, new_records, model):
-    """
-    Compute embeddings for new_records and append them to the existing vector database.
-    Each new record should have 'url' and 'content'.
-    """
-    new_contents = [rec["content"] for rec in new_records]
-    new_embeddings = model.encode(new_contents)
-    vector_db["doc_vectors"] = np.vstack([vector_db["doc_vectors"], new_embeddings])
-    for rec in new_records:
-        vector_db["metadata"].append({"url": rec["url"], "content": rec["content"]})
-        vector_db["corpus"].append(rec["content"])
-    return vector_db
-
-# ------------------------------
-# GOOGLE SEARCH & SCRAPING FUNCTIONS
-# ------------------------------
-
-def scrape_content(url):
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        response = requests.get(url, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
-            return soup.get_text(separator=" ", strip=True)
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-    return ""
-
-def simple_summary(text, word_limit=1000):
-    words = text.split()
-    if len(words) <= word_limit:
-        return text
-    return " ".join(words[:word_limit]) + "..."
-
-def google_search_and_scrape(query, domain="acg-world.com", num_results=2):
-    search_query = f"site:{domain} {query}"
-    raw_urls = list(search(search_query, num_results=num_results))
-    urls = [u for u in raw_urls if u.startswith("http")]
-    results = []
-    for url in urls:
-        content = scrape_content(url)
-        if content:
-            results.append({"url": url, "content": content})
-    return results
-
-# ------------------------------
-# GROQ CLOUD API FUNCTIONS
+# STREAMLIT UI
 # ------------------------------
 
-def query_groq_api(prompt, model="llama-3.3-70b-versatile"):
-    """
-    Use Groq Cloud API to process a prompt.
-    Returns the API's text response.
-    """
-    from groq import Groq, GroqError
-    api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
-        raise Exception("GROQ_API_KEY not set in environment variables.")
-    client = Groq(api_key=api_key)
-    try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            model=model,
-            temperature=0.1,
-            max_completion_tokens=3000,
-            top_p=1,
-            stream=False,
-            stop=None
-        )
-        return chat_completion.choices[0].message.content
-    except GroqError as e:
-        print(f"Groq API Error: {e}")
-        return "NO CONTENT"
-    except Exception as e:
-        print(f"Unexpected error in Groq API: {e}")
-        return "NO CONTENT"
+# Cache the model to avoid reloading on each run
+@st.cache_resource
+def load_model(model_name):
+    # PyTorch by default; QUERY_ENCODER=onnx switches to the int8 ONNX Runtime backend.
+    return load_query_encoder(model_name)
 
-def summarize_text(text):
-    """
-    Summarize text using Groq Cloud API.
-    """
-    prompt = f"Please summarize the following content concisely:\n\n{text}"
-    summary = query_groq_api(prompt)
-    if len(summary.strip()) < 20 or not re.search(r"[a-zA-Z]", summary):
-        return "NO CONTENT"
-    return summary.strip()
+# Pre-warm once per server process, before the first query is handled.
+@st.cache_resource
+def warm_up(model_name):
+    return prewarm(model=load_model(model_name))
 
-def generate_final_answer(query, context):
-    """
-    Generate a final answer using Groq Cloud API with a system prompt.
-    """
-    system_prompt = (
-        "You are an official representative of ACG World, a global leader in pharmaceutical and nutraceutical solutions. "
-        "Speak confidently in the first-person plural (using 'we', 'our', and 'us') and avoid repeating information. "
-        "Ensure that your response reflects our commitment to quality, innovation, and customer satisfaction while addressing the query professionally."
-    )
-    prompt = f"{system_prompt}\n\nQuestion: {query}\n\nContext:\n{context}"
-    answer = query_groq_api(prompt)
-    return answer
+# Prometheus-style /metrics endpoint, started once per server process.
+@st.cache_resource
+def metrics_server():
+    return start_metrics_server()
 
-# ------------------------------
-# STREAMLIT UI
-# ------------------------------
+# One router per server process: a site's shard is opened on its first query
+# and stays in memory until it is idle or pushed out by other sites.
+@st.cache_resource
+def shard_router():
+    return ShardRouter(load_registry(), load_model=load_model)
 
-# Cache the model to avoid reloading on each run
+# Background worker that summarizes and indexes fallback pages into the
+# shards this process has open; queued jobs survive a restart.
 @st.cache_resource
-def load_model(model_name):
-    return SentenceTransformer(model_name)
+def ingest_worker():
+    return start_ingest_worker(shard_router())
+
+metrics_server()
+router = shard_router()
+ingest_queue, _ = ingest_worker()
 
 # Streamlit app
 st.title("ACG World Query System")
 st.write("Enter your query below to get information from ACG World's knowledge base.")
 
-pickle_file = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+sites = list(router.registry["sites"])
+site = router.registry["default"]
+if len(sites) > 1:
+    site = st.selectbox("Site", sites, index=sites.index(site))
 
-# Load vector database (fresh each run to reflect updates)
-vector_db = load_vector_database(pickle_file)
-model_name = vector_db.get("model_name", "all-MiniLM-L6-v2")
-model = load_model(model_name)
+# Open (or reuse) the site's shard; fallback updates are saved back to it.
+site, site_config, vector_db, model = router.route(site)
+warm_up(vector_db.get("model_name", "all-MiniLM-L6-v2"))
 
 # Form for query input
 with st.form(key='query_form'):
@@ -176,33 +67,16 @@ with st.form(key='query_form'):
 
 # Process query on submission
 if submit_button and query.strip():
-    results, max_sim = query_vector_database(query, model, vector_db["doc_vectors"], vector_db["metadata"], threshold=0.5, top_n=5)
-    context = ""
-    ref_links = []
-    source_label = ""
-
-    if results is not None:
-        source_label = "retrieved"
-        for res in results:
-            snippet = res["content"][:1000]
-            context += f"URL: {res['url']}\nSummary: {snippet}\n\n"
-            ref_links.append(res["url"])
-    else:
-        google_results = google_search_and_scrape(query)
-        if google_results:
-            source_label = "googled"
-            top_google = google_results[0]
-            summarized = summarize_text(top_google["content"])
-            if summarized != "NO CONTENT":
-                new_record = {"url": top_google["url"], "content": summarized}
-                context += f"URL: {new_record['url']}\nSummary: {new_record['content']}\n\n"
-                ref_links.append(new_record["url"])
-                vector_db = update_vector_database(vector_db, [new_record], model)
-                save_vector_database(vector_db, pickle_file)
-
-    # Limit reference links to 2
-    ref_links = ref_links[:2]
-    final_answer = generate_final_answer(query, context)
+    # Retrieval, the Google fallback and the answer as one asyncio pipeline
+    # within QUERY_BUDGET seconds; see asyncpipeline.py. Fallback pages go
+    # to the ingest queue instead of being summarized and indexed inline.
+    final_answer, ref_links, report = answer_query(
+        query, vector_db, model, domain=site_config["domain"], threshold=0.5, top_n=5,
+        enqueue=lambda url, text: ingest_queue.enqueue(site, url, text)
+    )
+    source_label = report["source"]
+    if report["degraded"]:
+        print(f"Degraded answer: timed out {report['timed_out']}")
 
     # Display results
     st.write("### Final Answer")
@@ -0,0 +1,179 @@
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from retrieval import search as retrieval_search
+from contextpacker import build_context
+from metrics import incr, observe
+from imp import scrape_content, generate_final_answer
+
+# The query path as an asyncio pipeline with one deadline per request. The
+# blocking stages (encode + search, Google search, scraping, the answer call)
+# run on a thread pool and are awaited with whatever is left of the budget,
+# so a slow stage costs at most the remaining time instead of its own 10 s
+# timeout. Independent work overlaps: the result pages are scraped
+# concurrently and a hit that only just clears the threshold starts the
+# Google fallback speculatively. A fallback page is packed into the context
+# with the store's results (contextpacker.py) and, on a miss or when it is
+# used, handed to the ingest queue (ingestqueue.py), whose worker summarizes
+# and indexes it off the request path. An answer that misses the
+# deadline is degraded to an extract of the context.
+
+DEFAULT_BUDGET = float(os.environ.get("QUERY_BUDGET", "15"))
+SPECULATIVE_MARGIN = 0.05   # hits below threshold + margin also start the fallback
+SPECULATIVE_WAIT = 3.0      # how long a weak hit waits for the speculative page
+ANSWER_RESERVE = 4.0        # seconds kept back for the final LLM answer
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="query")
+
+class Deadline:
+    def __init__(self, budget):
+        self.budget = budget
+        self.end = time.monotonic() + budget
+
+    def remaining(self, reserve=0.0):
+        return max(self.end - time.monotonic() - reserve, 0.0)
+
+    def allows(self, seconds):
+        return self.remaining() >= seconds
+
+def _run(fn, *args, **kwargs):
+    return asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+async def _stage(report, name, awaitable, timeout):
+    """Await one stage within timeout; records its time, or the stage as timed out."""
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        report["timed_out"].append(name)
+        incr("stage_timeouts", stage=name)
+        raise
+    finally:
+        report["stages"][name] = round(time.perf_counter() - start, 3)
+
+def _retrieve(query, model, vector_db, threshold, top_n):
+    # RETRIEVAL_MODE picks the engine's strategy; passage stores are scored
+    # by their best passage in every mode (see retrieval.py).
+    return retrieval_search(query, model, vector_db, threshold=threshold, top_n=top_n)
+
+def _google_urls(query, domain, num_results):
+    from googlesearch import search
+    raw_urls = list(search(f"site:{domain} {query}", num_results=num_results))
+    return [u for u in raw_urls if u.startswith("http")]
+
+async def _fallback(query, domain, deadline, report, num_results=2):
+    """
+    Google search + concurrent scrape. Returns {"url", "content"} for the
+    top result with any text (content is the full scraped text) or None.
+    """
+    try:
+        urls = await _stage(report, "google_search", _run(_google_urls, query, domain, num_results),
+                            deadline.remaining(ANSWER_RESERVE))
+    except asyncio.TimeoutError:
+        return None
+    except Exception as e:
+        print(f"Google search failed: {e}")
+        return None
+    if not urls:
+        return None
+    scrapes = [_run(scrape_content, url) for url in urls]
+    try:
+        pages = await _stage(report, "scrape", asyncio.gather(*scrapes, return_exceptions=True),
+                             deadline.remaining(ANSWER_RESERVE))
+    except asyncio.TimeoutError:
+        return None
+    # Google's order: the top result that yielded any text.
+    top = next(((url, page) for url, page in zip(urls, pages) if isinstance(page, str) and page), None)
+    if top is None:
+        return None
+    return {"url": top[0], "content": top[1]}
+
+def _extract_answer(context, sentences=3):
+    """Answer of last resort when the LLM misses the deadline: the top of the context."""
+    lines = [line for line in context.splitlines() if line and not line.startswith("URL:")]
+    text = " ".join(lines)
+    parts = text.split(". ")
+    return ". ".join(parts[:sentences]).strip() or "Currently, we don't have information about it."
+
+async def answer_query_async(query, vector_db, model, domain="acg-world.com", budget=None, threshold=0.5,
+                             top_n=5, enqueue=None):
+    """
+    Answer query within budget seconds. enqueue(url, text) receives the page
+    a fallback scraped, for background indexing, when the store missed or
+    the page made it into the context. Returns (answer, ref_links,
+    report) where report has the source, per-stage seconds and the stages
+    that timed out.
+    """
+    deadline = Deadline(budget or DEFAULT_BUDGET)
+    report = {"source": "", "stages": {}, "timed_out": [], "degraded": False}
+    start = time.perf_counter()
+
+    try:
+        results, max_sim = await _stage(report, "retrieve", _run(_retrieve, query, model, vector_db, threshold, top_n),
+                                        deadline.remaining())
+    except asyncio.TimeoutError:
+        results, max_sim = None, 0.0
+
+    # Misses need the fallback; weak hits start it speculatively.
+    fallback = None
+    if results is None or max_sim < threshold + SPECULATIVE_MARGIN:
+        fallback = asyncio.ensure_future(_fallback(query, domain, deadline, report))
+
+    page = None
+    if results is not None:
+        report["source"] = "retrieved"
+        incr("cache_hits")
+        if fallback is not None:
+            done, _ = await asyncio.wait({fallback}, timeout=min(SPECULATIVE_WAIT, deadline.remaining(ANSWER_RESERVE)))
+            if done:
+                page = fallback.result()
+                incr("speculative_fallbacks", used="yes" if page else "no")
+            else:
+                fallback.cancel()
+                incr("speculative_fallbacks", used="late")
+    else:
+        incr("fallbacks")
+        page = await fallback
+        if page is not None:
+            report["source"] = "googled"
+
+    candidates = list(results or [])
+    if page is not None and page["url"] in {res["url"] for res in candidates}:
+        # The speculative page is one the store already returned.
+        page = None
+    if page is not None:
+        # Answered from the page text now, packed under the same token budget
+        # as the store's results; the summary is made in the background.
+        candidates.append(page)
+
+    context = ""
+    ref_links = []
+    if candidates:
+        context, ref_links, pack_stats = build_context(candidates)
+        if pack_stats["tokens_used"] > pack_stats["baseline_tokens"]:
+            incr("context_over_baseline")
+        else:
+            incr("context_tokens_saved", pack_stats["baseline_tokens"] - pack_stats["tokens_used"])
+
+    # Index the page only when the store missed or the page made it into the
+    # context; a speculative page that was packed out is not worth a summary.
+    if page is not None and enqueue is not None and (report["source"] == "googled" or page["url"] in ref_links):
+        enqueue(page["url"], page["content"])
+        incr("ingest_enqueued")
+
+    ref_links = ref_links[:2]
+    try:
+        answer = await _stage(report, "answer", _run(generate_final_answer, query, context), deadline.remaining())
+    except asyncio.TimeoutError:
+        answer = _extract_answer(context)
+        report["degraded"] = True
+
+    report["total"] = round(time.perf_counter() - start, 3)
+    observe("query_total", report["total"], source=report["source"] or "none")
+    return answer, ref_links, report
+
+def answer_query(query, vector_db, model, **kwargs):
+    """Blocking wrapper for callers without an event loop."""
+    return asyncio.run(answer_query_async(query, vector_db, model, **kwargs))
@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import numpy as np
+
+# Offline component benchmarks. Pages come from a local HTTP server, the LLM
+# is a stub Groq endpoint with a configurable delay, and the vector stores are
+# synthetic, so runs are repeatable and comparable between commits.
+
+DEFAULT_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_data_final.json")
+
+# ------------------------------
+# LOCAL STAND-INS
+# ------------------------------
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{title}</title></head>
+<body>
+<nav><a href="/">Home</a> <a href="/capsules">Capsules</a> <a href="/engineering">Engineering</a> <a href="/contact-us">Contact</a></nav>
+<main><h1>{title}</h1>{paragraphs}</main>
+<footer>Copyright ACG. All rights reserved. Privacy Policy | Cookie Policy | Terms of Use</footer>
+</body></html>"""
+
+def load_pages(html_dir=None, json_file=DEFAULT_JSON):
+    """
+    Return {path: html bytes}. Saved acg-world.com pages from html_dir are
+    used as they are (file name -> path); without them, pages are rendered
+    from the summarized records so the benchmark still runs offline.
+    """
+    pages = {}
+    if html_dir and os.path.isdir(html_dir):
+        for name in sorted(os.listdir(html_dir)):
+            if name.endswith((".html", ".htm")):
+                with open(os.path.join(html_dir, name), "rb") as f:
+                    pages["/" + os.path.splitext(name)[0]] = f.read()
+    if not pages:
+        with open(json_file, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        for i, record in enumerate(records):
+            paragraphs = "".join(f"<p>{line}</p>" for line in record.get("content", "").split("\n") if line.strip())
+            title = urlparse(record.get("url", "")).path.strip("/") or "home"
+            pages[f"/page-{i}"] = PAGE_TEMPLATE.format(title=title, paragraphs=paragraphs).encode("utf-8")
+    return pages
+
+def start_page_server(pages):
+    """Serve pages on 127.0.0.1 from a background thread; returns (server, base_url)."""
+    class PageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(urlparse(self.path).path)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def start_llm_stub(latency_ms=200, completion_tokens=150):
+    """
+    OpenAI-compatible chat completions endpoint that answers after
+    latency_ms. Point the Groq client at it with GROQ_BASE_URL.
+    """
+    class LLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            prompt = " ".join(m.get("content", "") for m in request.get("messages", []))
+            time.sleep(latency_ms / 1000.0)
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "Stub answer. " * (completion_tokens // 3)}
+                }],
+                "usage": {
+                    "prompt_tokens": len(prompt.split()), "completion_tokens": completion_tokens,
+                    "total_tokens": len(prompt.split()) + completion_tokens
+                }
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+class RandomEncoder:
+    """Stands in for the embedding model where only the search cost matters."""
+
+    def __init__(self, dim, seed=0):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    def encode(self, sentences, **kwargs):
+        vectors = self.rng.standard_normal((len(sentences), self.dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def synthetic_store(rows, dim, seed=0):
+    """A store shaped like sentembeed's output with random unit vectors."""
+    rng = np.random.default_rng(seed)
+    doc_vectors = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 100000):
+        block = rng.standard_normal((min(100000, rows - start), dim)).astype(np.float32)
+        doc_vectors[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    corpus = [f"Synthetic record {i} about capsules, machinery and packaging." for i in range(rows)]
+    metadata = [{"url": f"https://www.acg-world.com/synthetic/{i}", "content": corpus[i]} for i in range(rows)]
+    return {"model_name": "synthetic", "doc_vectors": doc_vectors, "metadata": metadata, "corpus": corpus}
+
+# ------------------------------
+# MEASUREMENT
+# ------------------------------
+
+def measure(fn, inputs, warmup=2):
+    """Run fn over inputs; returns throughput and latency percentiles in ms."""
+    for item in inputs[:warmup]:
+        fn(item)
+    timings = []
+    start_all = time.perf_counter()
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    total = time.perf_counter() - start_all
+    timings = np.asarray(timings)
+    return {
+        "n": len(timings),
+        "ops_per_sec": len(timings) / total if total > 0 else 0.0,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99))
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+def run_benchmarks(args):
+    import requests
+    from bs4 import BeautifulSoup
+    import imp as pipeline  # the local imp.py query pipeline (shadows the deprecated stdlib module)
+    import startup
+    from retrieval import search, ensure_retrieval_index
+    from rawupdate import apply_patches, ensure_url_row_index, save_vector_database, load_vector_database
+    from contentmaker import clean_text
+    from contextpacker import build_context
+
+    results = {"commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "stages": {}}
+    stages = results["stages"]
+
+    pages = load_pages(args.html_dir)
+    page_server, base_url = start_page_server(pages)
+    llm_server, llm_url = start_llm_stub(args.llm_latency_ms)
+    os.environ["GROQ_BASE_URL"] = llm_url
+    os.environ["GROQ_API_KEY"] = "offline-benchmark"
+    startup._groq_client = None
+    urls = [base_url + path for path in pages][:args.pages]
+    print(f"Serving {len(pages)} pages at {base_url}; LLM stub at {llm_url} ({args.llm_latency_ms} ms)")
+
+    session = requests.Session()
+    html_by_url = {}
+    def fetch(url):
+        html_by_url[url] = session.get(url, timeout=10).text
+    stages["fetch"] = measure(fetch, urls)
+
+    text_by_url = {}
+    def extract(url):
+        text_by_url[url] = BeautifulSoup(html_by_url[url], "html.parser").get_text(separator=" ", strip=True)
+    stages["extract"] = measure(extract, urls)
+    texts = [text_by_url[url] for url in urls]
+    stages["clean"] = measure(clean_text, texts)
+
+    queries = [" ".join(random.Random(i).sample(text.split(), min(6, len(text.split())))) or "capsules"
+               for i, text in enumerate(texts[:args.queries])]
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+        stages["encode"] = measure(lambda q: model.encode([q]), queries)
+        dim = model.get_sentence_embedding_dimension()
+    else:
+        model = None
+        dim = args.dim
+    search_encoder = RandomEncoder(dim)
+
+    for rows in args.sizes:
+        label = f"{rows // 1000}k" if rows < 1000000 else f"{rows // 1000000}M"
+        print(f"Building synthetic store with {rows} rows x {dim} dims...")
+        vector_db = synthetic_store(rows, dim)
+        # BM25 postings, norms and the URL index are built once, outside the timings.
+        ensure_retrieval_index(vector_db)
+        ensure_url_row_index(vector_db)
+        stages[f"search[{label}]"] = measure(
+            lambda q: search(q, search_encoder, vector_db, mode="dense", threshold=-1.0, top_n=5), queries
+        )
+        new_records = [{"url": f"{base_url}/new/{i}", "content": texts[i % len(texts)]} for i in range(args.updates)]
+        stages[f"apply_patches[{label}]"] = measure(
+            lambda rec: apply_patches(vector_db, [rec], search_encoder), new_records, warmup=0
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pickle_file = os.path.join(tmp_dir, "store.pkl")
+            stages[f"store_save[{label}]"] = measure(
+                lambda _: save_vector_database(vector_db, pickle_file), list(range(args.io_repeats)), warmup=0
+            )
+            stages[f"store_load[{label}]"] = measure(
+                lambda _: load_vector_database(pickle_file), list(range(args.io_repeats)), warmup=0
+            )
+        del vector_db
+
+    # End to end over the real summarized records: encode, search, pack the
+    # context and ask the stub LLM. Without --model the encode is random.
+    vector_db = synthetic_store(min(args.sizes), dim)
+    encoder = model or search_encoder
+    if model is not None:
+        with open(DEFAULT_JSON, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        corpus = [r["content"] for r in records]
+        vector_db = {"model_name": args.model, "doc_vectors": np.asarray(model.encode(corpus)),
+                     "metadata": [{"url": r["url"], "content": r["content"]} for r in records], "corpus": corpus}
+    def end_to_end(query):
+        hits, _ = search(query, encoder, vector_db, mode="dense", threshold=-1.0, top_n=5)
+        context, _, _ = build_context(hits)
+        pipeline.generate_final_answer(query, context)
+    stages["end_to_end_query"] = measure(end_to_end, queries)
+
+    page_server.shutdown()
+    llm_server.shutdown()
+    return results
+
+def print_report(results):
+    print(f"\nCommit {results.get('commit') or '?'} at {results.get('created')}")
+    print(f"{'stage':<34}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<34}{stats['ops_per_sec']:>10.1f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+def compare(baseline_file, candidate_file):
+    """Print the p50/p95 change per stage between two saved runs."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(candidate_file, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"{'stage':<34}{'p50 base':>10}{'p50 new':>10}{'change':>9}{'p95 change':>12}")
+    for stage, new in candidate["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            print(f"{stage:<34}{'-':>10}{new['p50_ms']:>10.2f}{'new':>9}")
+            continue
+        p50_change = (new["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+        p95_change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        print(f"{stage:<34}{old['p50_ms']:>10.2f}{new['p50_ms']:>10.2f}{p50_change:>8.1f}%{p95_change:>11.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline component benchmarks for the crawl/query pipeline.")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="run the benchmarks and save the results as JSON")
+    run.add_argument("--html-dir", help="directory of saved acg-world.com HTML pages")
+    run.add_argument("--pages", type=int, default=100, help="pages to fetch/extract/clean")
+    run.add_argument("--queries", type=int, default=50, help="queries per search/end-to-end stage")
+    run.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 100000, 1000000],
+                     help="synthetic store sizes, comma separated")
+    run.add_argument("--dim", type=int, default=768, help="vector size when no --model is given")
+    run.add_argument("--model", help="SentenceTransformer name to benchmark encode with (e.g. all-mpnet-base-v2)")
+    run.add_argument("--updates", type=int, default=5, help="apply_patches inserts per store size")
+    run.add_argument("--io-repeats", type=int, default=3, help="store save/load repetitions per store size")
+    run.add_argument("--llm-latency-ms", type=float, default=200.0, help="stub Groq response delay")
+    run.add_argument("--output", help="results file (default: bench_results/<commit>.json)")
+    cmp_parser = sub.add_parser("compare", help="compare two saved runs")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args.baseline, args.candidate)
+        return
+    if args.command != "run":
+        parser.print_help()
+        return
+
+    results = run_benchmarks(args)
+    print_report(results)
+    output = args.output or os.path.join("bench_results", f"{results['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import re
+import sys
+import json
+import hashlib
+from urllib.parse import urlparse
+
+# Site-wide boilerplate removal. Nav menus, footers and cookie notices repeat
+# on nearly every page of a site, so a block (a line of extracted text, or a
+# run of SHINGLE_WORDS words once the text has been flattened) that occurs on
+# more than max_share of a site's pages is dropped. Pages are counted one at
+# a time and only block hashes are kept, so a whole crawl can be streamed
+# through count_page() before strip_boilerplate() is applied.
+
+SHINGLE_WORDS = 8
+MAX_SHARE = 0.5
+MIN_PAGES = 5   # below this many pages per site nothing counts as boilerplate
+
+def new_boilerplate_stats(mode="lines", shingle_words=SHINGLE_WORDS):
+    """mode "lines" for text extracted with newline separators, "shingles" for flattened text."""
+    return {"mode": mode, "shingle_words": shingle_words, "pages": {}, "counts": {}}
+
+def _site(url):
+    return urlparse(url or "").netloc.lower()
+
+def _key(block):
+    normalized = re.sub(r"\s+", " ", block).strip().lower()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+def _lines(text):
+    return [line for line in (text or "").splitlines() if line.strip()]
+
+def _shingle_keys(words, size):
+    # Pages shorter than one shingle (e.g. "NO CONTENT") are left alone.
+    return [_key(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)]
+
+def _page_keys(stats, text):
+    if stats["mode"] == "lines":
+        return [_key(line) for line in _lines(text)]
+    return _shingle_keys((text or "").split(), stats["shingle_words"])
+
+def count_page(stats, url, text):
+    """Add one page: every distinct block counts once per page."""
+    site = _site(url)
+    stats["pages"][site] = stats["pages"].get(site, 0) + 1
+    counts = stats["counts"].setdefault(site, {})
+    for key in set(_page_keys(stats, text)):
+        counts[key] = counts.get(key, 0) + 1
+    return stats
+
+def _is_common(stats, site, key, max_share, min_pages):
+    pages = stats["pages"].get(site, 0)
+    if pages < min_pages:
+        return False
+    return stats["counts"][site].get(key, 0) > max_share * pages
+
+def strip_boilerplate(stats, url, text, max_share=MAX_SHARE, min_pages=MIN_PAGES):
+    """
+    Remove the blocks of text that occur on more than max_share of its
+    site's pages. Returns (stripped text, bytes removed).
+    """
+    text = text or ""
+    site = _site(url)
+    if site not in stats["counts"]:
+        return text, 0
+    if stats["mode"] == "lines":
+        kept = [line for line in _lines(text) if not _is_common(stats, site, _key(line), max_share, min_pages)]
+        stripped = "\n".join(kept)
+    else:
+        tokens = list(re.finditer(r"\S+", text))
+        words = [token.group() for token in tokens]
+        size = stats["shingle_words"]
+        covered = [False] * len(words)
+        for i, key in enumerate(_shingle_keys(words, size)):
+            if _is_common(stats, site, key, max_share, min_pages):
+                for j in range(i, min(i + size, len(words))):
+                    covered[j] = True
+        if not any(covered):
+            return text, 0
+        # Cut each covered word together with the whitespace after it, so the
+        # rest of the page keeps its original layout.
+        pieces = []
+        pos = 0
+        for i, token in enumerate(tokens):
+            if covered[i]:
+                pieces.append(text[pos:token.start()])
+                pos = tokens[i + 1].start() if i + 1 < len(tokens) else len(text)
+        pieces.append(text[pos:])
+        stripped = "".join(pieces).strip()
+    return stripped, len(text.encode("utf-8")) - len(stripped.encode("utf-8"))
+
+def remove_site_boilerplate(records, max_share=MAX_SHARE, min_pages=MIN_PAGES, mode="lines", field="content"):
+    """
+    Two passes over records (dicts with "url" and field): count, then strip in
+    place. Returns the total bytes removed.
+    """
+    stats = new_boilerplate_stats(mode)
+    for record in records:
+        count_page(stats, record.get("url", ""), record.get(field, ""))
+    removed = 0
+    for record in records:
+        record[field], page_removed = strip_boilerplate(stats, record.get("url", ""), record.get(field, ""),
+                                                        max_share, min_pages)
+        removed += page_removed
+    return removed
+
+def main():
+    # python boilerplate.py input.json output.json [max_share]
+    # Works on already flattened content (contentmaker output), so shingles.
+    if len(sys.argv) < 3:
+        print("Usage: python boilerplate.py input.json output.json [max_share]")
+        return
+    input_file, output_file = sys.argv[1], sys.argv[2]
+    max_share = float(sys.argv[3]) if len(sys.argv) > 3 else MAX_SHARE
+    with open(input_file, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    before = sum(len(record.get("content", "").encode("utf-8")) for record in records)
+    removed = remove_site_boilerplate(records, max_share=max_share, mode="shingles")
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    share = removed / before * 100 if before else 0.0
+    print(f"Removed {removed} of {before} bytes ({share:.1f}%) of boilerplate from {len(records)} records -> {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,17 @@ from urllib3.exceptions import InsecureRequestWarning
 warnings.simplefilter("ignore", InsecureRequestWarning)
 
 import xml.etree.ElementTree as ET
-import requests
 from bs4 import BeautifulSoup
 import re
 import json
+import sys
 import time
 from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from boilerplate import remove_site_boilerplate, MAX_SHARE
+from politeness import PolitenessScheduler
+from webarchive import ArchiveWriter, latest_entries, iter_records, DEFAULT_ARCHIVE
+from streamfetch import fetch_report, detect_charset
 
 def parse_filtered_sitemap(file_path):
     """Parse the filtered sitemap.xml and return a list of URLs."""
@@ -31,36 +36,111 @@ def clean_text(text):
     cleaned = re.sub(r'\s+', ' ', cleaned)
     return cleaned.strip()
 
-def crawl_urls(urls, delay=1):
+def extract_page(url, body, headers, encoding=None):
+    """
+    Title and text of one HTML response. Used for live fetches and for
+    archive replays alike, so both produce the same records. encoding is the
+    charset the fetch decoded the page with (response.encoding after
+    stream_get); without it the charset is found the same way stream_get
+    does, from the headers or a <meta charset>, defaulting to UTF-8.
+    """
+    encoding = encoding or detect_charset(headers, body) or "utf-8"
+    try:
+        text = body.decode(encoding, errors="replace")
+    except LookupError:
+        text = body.decode("utf-8", errors="replace")
+    soup = BeautifulSoup(text, "html.parser")
+    title = soup.title.string.strip() if soup.title and soup.title.string else ""
+    # One line per text node, so repeated blocks can be found across pages.
+    raw_text = soup.get_text(separator="\n", strip=True)
+    return {
+        "url": url,
+        "title": title,
+        "content": raw_text
+    }
+
+def fetch_page(scheduler, url):
+    """Fetch and extract one page; returns a record or None."""
+    try:
+        response = scheduler.fetch(url)
+        if response is None:
+            return None
+        if response.skip_reason:
+            print(f"Skipped {url} ({response.skip_reason})")
+            return None
+        if response.truncated:
+            print(f"Truncated {url} at {len(response.content)} bytes")
+        if response.status_code == 200:
+            return extract_page(url, response.content, response.headers, response.encoding)
+        print(f"Non-200 response for {url}: {response.status_code}")
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+    return None
+
+def finish_records(results, boilerplate_share=MAX_SHARE):
+    """Site-wide boilerplate removal, then clean_text, on extracted records."""
+    if boilerplate_share is not None:
+        before = sum(len(r["content"].encode("utf-8")) for r in results)
+        removed = remove_site_boilerplate(results, max_share=boilerplate_share)
+        print(f"Boilerplate: removed {removed} of {before} bytes across {len(results)} pages")
+    for record in results:
+        record["content"] = clean_text(record["content"])
+    return results
+
+def crawl_urls(urls, delay=1, boilerplate_share=MAX_SHARE, workers=8, archive_path=None):
     """
     Crawl each URL in the list, extract the title (if available) and page text,
     clean the text, and return a list of dictionaries containing the URL,
     title, and cleaned content.
+    Lines that repeat on more than boilerplate_share of the site's pages (nav
+    menus, footers, cookie notices) are removed before cleaning; pass None to
+    keep them.
+    Requests go through a PolitenessScheduler: robots.txt is honoured, delay
+    is only the starting spacing per host, and up to workers pages are
+    fetched in parallel once the server keeps up (backing off on 429/503 or
+    slow responses).
+    With archive_path set, every raw response is also appended to that
+    .warc.gz archive so the pages can be re-extracted later without the network.
     Also, prints progress logs in the format "x/997 done".
     """
-    headers = {"User-Agent": "Mozilla/5.0"}
+    archive = ArchiveWriter(archive_path) if archive_path else None
+    scheduler = PolitenessScheduler(initial_delay=delay, max_concurrency=workers, verify=False, archive=archive)
     results = []
     total = len(urls)
-    for idx, url in enumerate(urls, start=1):
-        print(f"{idx}/{total} done - Fetching: {url}")
-        try:
-            response = requests.get(url, headers=headers, timeout=10, verify=False)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, "html.parser")
-                title = soup.title.string.strip() if soup.title and soup.title.string else ""
-                raw_text = soup.get_text(separator=" ", strip=True)
-                neat_text = clean_text(raw_text)
-                results.append({
-                    "url": url,
-                    "title": title,
-                    "content": neat_text
-                })
-            else:
-                print(f"Non-200 response for {url}: {response.status_code}")
-        except Exception as e:
-            print(f"Error fetching {url}: {e}")
-        time.sleep(delay)
-    return results
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() keeps the input order.
+        for idx, (url, record) in enumerate(zip(urls, pool.map(lambda u: fetch_page(scheduler, u), urls)), start=1):
+            print(f"{idx}/{total} done - Fetched: {url}")
+            if record is not None:
+                results.append(record)
+    print(f"Per-host rate: {scheduler.stats()}")
+    print(f"Streaming fetch: {fetch_report()}")
+    return finish_records(results, boilerplate_share)
+
+def _extract_archived(record):
+    return extract_page(record["url"], record["body"], record["headers"], record.get("charset"))
+
+def reprocess_archive(archive_path=DEFAULT_ARCHIVE, urls=None, boilerplate_share=MAX_SHARE, processes=None):
+    """
+    Re-run extraction on the newest 200 response of every archived URL (or
+    only urls) without touching the network. The archive is read front to
+    back and HTML parsing is spread over processes worker processes.
+    """
+    entries = latest_entries(archive_path)
+    if urls is not None:
+        wanted = set(urls)
+        entries = [entry for entry in entries if entry["url"] in wanted]
+    print(f"Re-extracting {len(entries)} archived pages from {archive_path}")
+    start = time.perf_counter()
+    records = iter_records(archive_path, entries)
+    if processes == 1:
+        results = [_extract_archived(record) for record in records]
+    else:
+        from multiprocessing import Pool
+        with Pool(processes) as pool:
+            results = list(pool.imap(_extract_archived, records, chunksize=8))
+    print(f"Extracted {len(results)} pages in {time.perf_counter() - start:.1f}s")
+    return finish_records(results, boilerplate_share)
 
 def save_to_json(data, output_file="vector_data.json"):
     """Save the list of crawled records to a JSON file."""
@@ -69,12 +149,18 @@ def save_to_json(data, output_file="vector_data.json"):
     print(f"Saved {len(data)} records to {output_file}")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "reprocess":
+        # python contentmaker.py reprocess [archive.warc.gz]: offline re-extraction
+        archive_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ARCHIVE
+        save_to_json(reprocess_archive(archive_path), output_file="vector_data.json")
+        sys.exit(0)
+    
     sitemap_file = r"C:\Users\surya\Desktop\webcrawling\filtered_sitemap.xml"  # Your filtered XML file with ~997 URLs
     urls = parse_filtered_sitemap(sitemap_file)
     print(f"Parsed {len(urls)} URLs from filtered sitemap.")
     
     # Crawl the URLs, printing progress as "x/997 done"
-    crawled_data = crawl_urls(urls, delay=1)
+    crawled_data = crawl_urls(urls, delay=1, archive_path=DEFAULT_ARCHIVE)
     
     # Save the crawled and cleaned content to a JSON file
     save_to_json(crawled_data, output_file="vector_data.json")
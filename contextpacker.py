@@ -0,0 +1,122 @@
+import os
+import re
+from functools import lru_cache
+
+# Tokenizer used to count prompt tokens for each Groq model. Override with
+# CONTEXT_TOKENIZER (any Hugging Face tokenizer id) if the model changes.
+# Only a tokenizer already in the local Hugging Face cache is used; set
+# CONTEXT_TOKENIZER_DOWNLOAD=1 once (with access to the gated repo) to fetch
+# it. Without it, token counts are approximated, with no network attempt.
+MODEL_TOKENIZERS = {
+    "llama-3.3-70b-versatile": "meta-llama/Llama-3.3-70B-Instruct",
+}
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1200"))
+ALLOW_TOKENIZER_DOWNLOAD = os.environ.get("CONTEXT_TOKENIZER_DOWNLOAD") == "1"
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD_PATTERN = re.compile(r"\w+")
+
+@lru_cache(maxsize=None)
+def get_token_counter(model="llama-3.3-70b-versatile"):
+    """
+    Return a function text -> token count for model. Uses the model's own
+    tokenizer when transformers and the cached tokenizer files are available,
+    else an approximation of one token per word piece / 4 characters.
+    Loaded once per process; startup.prewarm() calls it before serving.
+    """
+    tokenizer_name = os.environ.get("CONTEXT_TOKENIZER") or MODEL_TOKENIZERS.get(model)
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, local_files_only=not ALLOW_TOKENIZER_DOWNLOAD)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            print(f"Tokenizer {tokenizer_name} unavailable ({e}); using approximate token counts.")
+    return approximate_token_count
+
+def approximate_token_count(text):
+    count = 0
+    for word in re.findall(r"\w+|[^\w\s]", text):
+        count += max(1, (len(word) + 3) // 4)
+    return count
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if s and s.strip()]
+
+def _shingles(sentence, size=3):
+    words = WORD_PATTERN.findall(sentence.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _is_redundant(shingles, kept, overlap=0.8):
+    if not shingles:
+        return True
+    for other in kept:
+        common = len(shingles & other)
+        if common and common / min(len(shingles), len(other)) >= overlap:
+            return True
+    return False
+
+def naive_context(results, snippet_chars=1000):
+    """The old context: a fixed-length snippet of every result."""
+    context = ""
+    for res in results:
+        context += f"URL: {res['url']}\nSummary: {res['content'][:snippet_chars]}\n\n"
+    return context
+
+def build_context(results, token_budget=None, model="llama-3.3-70b-versatile", count_tokens=None):
+    """
+    Pack results into a context string of at most token_budget tokens.
+
+    Results are taken in the order given (the retriever's ranking, e.g. the
+    hybrid RRF order), sentences already covered by a kept sentence (80%
+    shingle overlap) are dropped, and packing stops at the budget. No result takes more tokens than its old fixed-length snippet,
+    so the context is never longer than the old one. Returns (context,
+    ref_links, stats) where stats reports the tokens used, the tokens the old
+    fixed-snippet context would have used and the difference.
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    count_tokens = count_tokens or get_token_counter(model)
+    kept_shingles = []
+    blocks = []
+    ref_links = []
+    used = 0
+    dropped = 0
+    for res in results:
+        header = f"URL: {res['url']}\nSummary: "
+        header_tokens = count_tokens(header)
+        if used + header_tokens >= token_budget:
+            break
+        result_cap = count_tokens(naive_context([res]))
+        sentences = []
+        block_tokens = header_tokens
+        for sentence in split_sentences(res["content"]):
+            shingles = _shingles(sentence)
+            if _is_redundant(shingles, kept_shingles):
+                dropped += 1
+                continue
+            sentence_tokens = count_tokens(sentence + " ")
+            if used + block_tokens + sentence_tokens > token_budget or block_tokens + sentence_tokens > result_cap:
+                # Too long for what is left; a shorter later sentence may still fit.
+                continue
+            sentences.append(sentence)
+            kept_shingles.append(shingles)
+            block_tokens += sentence_tokens
+        if sentences:
+            blocks.append(header + " ".join(sentences) + "\n\n")
+            ref_links.append(res["url"])
+            used += block_tokens
+
+    context = "".join(blocks)
+    baseline_tokens = count_tokens(naive_context(results))
+    context_tokens = count_tokens(context)
+    stats = {
+        "tokens_used": context_tokens,
+        "baseline_tokens": baseline_tokens,
+        # Blocks are capped at their snippet's size; joining them can still
+        # tokenize a token or two differently, which is not a saving to report.
+        "tokens_saved": max(baseline_tokens - context_tokens, 0),
+        "sentences_dropped": dropped
+    }
+    return context, ref_links, stats
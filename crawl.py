@@ -1,8 +1,12 @@
+import sys
 import requests
 from urllib.parse import urlparse, urljoin
 from bs4 import BeautifulSoup
 import xml.etree.ElementTree as ET
 from typing import Set
+from politeness import PolitenessScheduler
+from frontier import CrawlFrontier, reset_frontier
+from streamfetch import page_text
 
 class SimpleLinkCrawler:
     """A simple web crawler to find URLs not listed in a sitemap."""
@@ -18,6 +22,8 @@ class SimpleLinkCrawler:
         self.domain = urlparse(self.base_url).netloc
         self.sitemap_urls = self._parse_sitemap(sitemap_path)
         self.discovered_urls = set()
+        # robots.txt rules, Crawl-delay and per-host adaptive spacing.
+        self.scheduler = PolitenessScheduler(user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64)')
 
     def _parse_sitemap(self, sitemap_path: str) -> Set[str]:
         """
@@ -69,13 +75,17 @@ class SimpleLinkCrawler:
         :return: Set of valid extracted links
         """
         try:
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.scheduler.fetch(url)
+            if response is None:
+                return set()
+            if response.skip_reason:
+                print(f"Skipped {url} ({response.skip_reason})")
+                return set()
             if response.status_code != 200:
                 print(f"Non-200 status code for {url}: {response.status_code}")
                 return set()
 
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(page_text(response), 'html.parser')
             links = set()
             for anchor in soup.find_all('a', href=True):
                 full_url = urljoin(url, anchor['href'])
@@ -86,39 +96,46 @@ class SimpleLinkCrawler:
             print(f"Error fetching {url}: {e}")
             return set()
 
-    def find_new_links(self) -> Set[str]:
+    def find_new_links(self, max_links_per_page: int = 10, max_depth: int = None,
+                       frontier_path: str = "crawl_frontier.db", fresh: bool = False) -> Set[str]:
         """
         Crawl the website and find URLs not in the sitemap.
         
+        The queue is a persistent CrawlFrontier, so an interrupted crawl
+        resumes where it stopped when run again with the same frontier_path.
+        A finished frontier has nothing left to crawl; pass fresh=True to
+        discard it and crawl the site again.
+        
+        :param max_links_per_page: New links queued per crawled page
+        :param max_depth: Maximum link depth from the base URL (None for no limit)
+        :param frontier_path: SQLite file holding the crawl queue
+        :param fresh: Delete the frontier first instead of resuming it
         :return: Set of URLs discovered during crawl but not in sitemap
         """
-        to_crawl = [self.base_url]
-        crawled = set()
-        
-        while to_crawl:
-            url = to_crawl.pop(0)
-            if url in crawled:
-                continue
-                
-            crawled.add(url)
-            new_links = self.extract_links(url)
-            self.discovered_urls.update(new_links)
-            
-            # Add new links to crawl queue (up to 10 per page)
-            to_crawl.extend(
-                link for link in new_links 
-                if link not in crawled and link not in to_crawl
-            )[:10]
+        if fresh:
+            reset_frontier(frontier_path)
+        with CrawlFrontier(frontier_path, max_depth=max_depth,
+                           max_links_per_page=max_links_per_page) as frontier:
+            frontier.add_seeds([self.base_url])
+            while True:
+                item = frontier.pop()
+                if item is None:
+                    break
+                url, depth = item
+                new_links = self.extract_links(url)
+                # Sorted so the per-page cap picks the same links on every run.
+                frontier.complete(url, sorted(new_links), depth)
+            self.discovered_urls.update(frontier.urls())
         
         return self.discovered_urls - self.sitemap_urls
 
 def main():
-    """Main function to run the crawler."""
+    """Main function to run the crawler. Pass --fresh to ignore the previous crawl."""
     crawler = SimpleLinkCrawler(
         base_url='https://www.acg-world.com',
         sitemap_path=r"C:\Users\surya\Downloads\sitemap.xml"
     )
-    new_urls = crawler.find_new_links()
+    new_urls = crawler.find_new_links(fresh="--fresh" in sys.argv[1:])
     print("URLs found but not in sitemap:")
     for url in sorted(new_urls):
         print(url)
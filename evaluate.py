@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import pickle
+import random
+import argparse
+import numpy as np
+
+# Retrieval regression harness: a labeled query -> URL set built from the
+# summarized records, run through every retrieval backend, reporting
+# recall@k, MRR, fallback rate and latency so thresholds and index types can
+# be tuned against measured quality instead of picked by hand.
+
+DEFAULT_JSON = r"C:\Users\surya\Desktop\webcrawling\vector_data_final.json"
+DEFAULT_STORE = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+DEFAULT_QUERIES = "eval_queries.json"
+RANK_DEPTH = 10
+
+# ------------------------------
+# LABELED QUERIES
+# ------------------------------
+
+def _url_words(url):
+    path = url.split("://", 1)[-1].split("/", 1)[-1].split("#")[0]
+    return [w for w in re.split(r"[/\-_?=.%0-9]+", path) if w.isalpha() and len(w) > 1]
+
+def build_labeled_queries(records, seed=13, span_words=10):
+    """
+    Two queries per record, labeled with the record's URL:
+    - "url": the words of the URL path, roughly what a user types;
+    - "content": a random span of span_words words from the summary.
+    The result is written to a JSON file so it can be reviewed and edited.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for record in records:
+        url = record["url"]
+        words = _url_words(url)
+        if words:
+            queries.append({"query": " ".join(words), "url": url, "kind": "url"})
+        content_words = record.get("content", "").split()
+        if len(content_words) >= span_words:
+            start = rng.randrange(0, len(content_words) - span_words + 1)
+            queries.append({"query": " ".join(content_words[start:start + span_words]), "url": url, "kind": "content"})
+    return queries
+
+def load_or_build_queries(queries_file, records):
+    if os.path.exists(queries_file):
+        with open(queries_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    queries = build_labeled_queries(records)
+    with open(queries_file, "w", encoding="utf-8") as f:
+        json.dump(queries, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {len(queries)} labeled queries to {queries_file}")
+    return queries
+
+# ------------------------------
+# BACKENDS
+# Each backend is query -> (ranked URLs, best score); thresholds are applied
+# afterwards so one run covers every threshold.
+# ------------------------------
+
+def _dedup(urls):
+    seen = set()
+    return [u for u in urls if not (u in seen or seen.add(u))]
+
+def tfidf_backend(records):
+    """The TF-IDF store used by main.py, fitted in memory on the same records."""
+    from sklearn.metrics.pairwise import cosine_similarity
+    from sparseindex import HashedTfidfIndex
+    corpus = [r.get("content", "") for r in records]
+    urls = [r["url"] for r in records]
+    vectorizer = HashedTfidfIndex(stop_words="english").add(corpus)
+    doc_vectors = vectorizer.doc_vectors
+
+    def run(query):
+        similarities = cosine_similarity(vectorizer.transform([query]), doc_vectors).flatten()
+        order = np.argsort(-similarities, kind="stable")[:RANK_DEPTH]
+        return _dedup([urls[i] for i in order]), float(similarities.max())
+    return run
+
+def engine_backend(vector_db, model, mode):
+    """
+    retrieval.search in sparse, dense (brute force) or hybrid mode, on the
+    whole-page vectors; the passages backend measures the passage index.
+    """
+    from retrieval import search, ensure_retrieval_index
+    ensure_retrieval_index(vector_db)
+
+    def run(query):
+        results, best = search(query, model, vector_db, mode=mode, threshold=float("-inf"), top_n=RANK_DEPTH,
+                               passages=False)
+        return _dedup([r["url"] for r in results or []]), float(best)
+    return run
+
+def passage_backend(vector_db, model):
+    """sentembeed.query_passages: best passage per page."""
+    from sentembeed import query_passages, create_passage_index
+    if "passages" not in vector_db:
+        create_passage_index(vector_db, model)
+
+    def run(query):
+        results, best = query_passages(query, model, vector_db, threshold=float("-inf"), top_n=RANK_DEPTH)
+        return [r["url"] for r in results or []], float(best)
+    return run
+
+# ------------------------------
+# METRICS
+# ------------------------------
+
+def evaluate_backend(run, queries, thresholds, ks=(1, 3, 5)):
+    """
+    Run every query once and compute, per threshold, recall@k, MRR and the
+    fallback rate (queries whose best score is below the threshold and would
+    go to the Google fallback instead of being answered locally). The sparse
+    backend scores with BM25 rather than cosine, so its thresholds are not on
+    the same scale.
+    """
+    rankings = []
+    latencies = []
+    for item in queries:
+        start = time.perf_counter()
+        ranked, best = run(item["query"])
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        rank = ranked.index(item["url"]) + 1 if item["url"] in ranked else None
+        rankings.append((rank, best))
+    latencies = np.asarray(latencies)
+    report = {
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "latency_mean_ms": float(latencies.mean()),
+        "by_threshold": {}
+    }
+    n = max(len(rankings), 1)
+    for threshold in thresholds:
+        answered = [(rank, best) for rank, best in rankings if best >= threshold]
+        metrics = {"fallback_rate": 1.0 - len(answered) / n}
+        for k in ks:
+            metrics[f"recall@{k}"] = sum(1 for rank, _ in answered if rank is not None and rank <= k) / n
+        metrics["mrr"] = sum(1.0 / rank for rank, _ in answered if rank is not None) / n
+        report["by_threshold"][str(threshold)] = metrics
+    return report
+
+def print_report(report):
+    header = f"{'backend':<12}{'threshold':>10}{'R@1':>7}{'R@3':>7}{'R@5':>7}{'MRR':>7}{'fallback':>10}{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, result in report.items():
+        for threshold, m in result["by_threshold"].items():
+            print(f"{name:<12}{threshold:>10}{m['recall@1']:>7.3f}{m['recall@3']:>7.3f}{m['recall@5']:>7.3f}"
+                  f"{m['mrr']:>7.3f}{m['fallback_rate']:>10.3f}{result['latency_p50_ms']:>9.2f}{result['latency_p95_ms']:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k / MRR / fallback rate / latency per retrieval backend.")
+    parser.add_argument("--json", default=DEFAULT_JSON, help="summarized records (vector_data_final.json)")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="dense store (vector_store_final.pkl)")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="labeled query file (built if missing)")
+    parser.add_argument("--backends", default="tfidf,sparse,dense,hybrid,passages,onnx",
+                        help="comma separated subset of tfidf,sparse,dense,hybrid,passages,onnx")
+    parser.add_argument("--thresholds", default="0.0,0.3,0.4,0.5,0.6",
+                        help="score thresholds to report (0.5 is the app.py/imp.py default)")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    with open(args.json, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    queries = load_or_build_queries(args.queries, records)
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    vector_db = None
+    model = None
+    if any(b != "tfidf" for b in backends):
+        from textarena import relocate_store_texts
+        with open(args.store, "rb") as f:
+            vector_db = relocate_store_texts(pickle.load(f), args.store)
+        if any(b in ("dense", "hybrid", "passages") for b in backends):
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(vector_db.get("model_name", "all-MiniLM-L6-v2"))
+
+    report = {}
+    for name in backends:
+        if name == "tfidf":
+            run = tfidf_backend(records)
+        elif name in ("sparse", "dense", "hybrid"):
+            run = engine_backend(vector_db, model, name)
+        elif name == "passages":
+            run = passage_backend(vector_db, model)
+        elif name == "onnx":
+            from onnxencoder import OnnxQueryEncoder, onnx_dir_for, has_onnx_export
+            model_name = vector_db.get("model_name", "all-MiniLM-L6-v2")
+            onnx_dir = onnx_dir_for(model_name)
+            if not has_onnx_export(onnx_dir):
+                print(f"Skipping onnx: no exported encoder in {onnx_dir} (run onnxencoder.py export)")
+                continue
+            run = engine_backend(vector_db, OnnxQueryEncoder(onnx_dir, model_name=model_name), "dense")
+        else:
+            print(f"Unknown backend {name!r}, skipping.")
+            continue
+        print(f"Evaluating {name} on {len(queries)} queries...")
+        report[name] = evaluate_backend(run, queries, thresholds)
+
+    print()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,10 @@ def filter_sitemap(input_file, output_file):
     tree = ET.parse(input_file)
     root = tree.getroot()
     
-    # Use a set to collect unique URLs
+    # Use a set to collect unique URLs (keeping each URL's first <url> entry)
     seen = set()
     unique_urls = []
+    entries = {}
     
     # The sitemap namespace
     ns = {"sm": "http://www.sitemaps.org/schemas/sitemap/0.9"}
@@ -20,6 +21,7 @@ def filter_sitemap(input_file, output_file):
             if url_text not in seen:
                 seen.add(url_text)
                 unique_urls.append(url_text)
+                entries[url_text] = url_element
     
     print(f"Found {len(unique_urls)} unique URLs.")
     
@@ -29,6 +31,11 @@ def filter_sitemap(input_file, output_file):
         url_el = ET.SubElement(urlset, "url")
         loc_el = ET.SubElement(url_el, "loc")
         loc_el.text = url
+        # Keep <lastmod>, <changefreq> and <priority> for the recrawl scheduler.
+        for field in ("lastmod", "changefreq", "priority"):
+            value = entries[url].findtext(f"sm:{field}", namespaces=ns)
+            if value:
+                ET.SubElement(url_el, field).text = value.strip()
     
     # Write the new XML to a file
     new_tree = ET.ElementTree(urlset)
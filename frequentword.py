@@ -6,8 +6,11 @@ import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import requests
 from bs4 import BeautifulSoup
+from streamfetch import stream_get, page_text
 import warnings
 from googlesearch import search
+from invertedindex import build_inverted_index, match_all_terms
+from urlindex import build_url_row_index, resolve_rows
 
 # Suppress SSL warnings for testing only
 warnings.filterwarnings("ignore", message="Unverified HTTPS request")
@@ -17,10 +20,24 @@ def load_json(json_file):
         data = json.load(f)
     return data
 
-def filter_records_by_url(data, query):
+def build_url_index(data):
+    """
+    Build a token inverted index over the record URLs, row-aligned with data.
+    The URLs are kept with it for confirming terms with punctuation.
+    """
+    urls = [record.get("url", "") for record in data]
+    url_index = build_inverted_index(urls)
+    url_index["urls"] = urls
+    return url_index
+
+def filter_records_by_url(data, query, url_index=None):
     """
     Returns records where every word in the query appears as an exact match in the URL.
+    If url_index (from build_url_index(data)) is given, the match is answered
+    by intersecting its posting lists instead of scanning every URL.
     """
+    if url_index is not None:
+        return [data[row] for row in match_all_terms(url_index, query, url_index["urls"])]
     query_terms = query.lower().split()
     matching_records = []
     for record in data:
@@ -32,38 +49,52 @@ def filter_records_by_url(data, query):
 def load_vector_database(pickle_file):
     with open(pickle_file, "rb") as f:
         vector_store = pickle.load(f)
-    # Expected keys: "vectorizer", "doc_vectors", "metadata", "corpus"
-    return (vector_store["vectorizer"], 
-            vector_store["doc_vectors"], 
+    # Expected keys: "vectorizer", "metadata", "corpus" (and "doc_vectors" in older stores)
+    # Stores built before the URL row index existed get one built on load.
+    url_row_index = vector_store.get("url_row_index") or build_url_row_index(vector_store["metadata"])
+    # Hashed-index stores (tfidf.py) derive their document vectors on load.
+    vectorizer = vector_store["vectorizer"]
+    doc_vectors = vector_store["doc_vectors"] if "doc_vectors" in vector_store else vectorizer.doc_vectors
+    return (vectorizer, 
+            doc_vectors, 
             vector_store["metadata"], 
-            vector_store["corpus"])
+            vector_store["corpus"],
+            url_row_index)
 
-def query_vector_subset(query, vectorizer, doc_vectors, metadata, corpus, valid_urls, top_n=2):
+def query_vector_subset(query, vectorizer, doc_vectors, metadata, corpus, valid_urls=None, top_n=2,
+                        url_row_index=None, prefix=None, section=None, domain=None):
     """
-    Filters the vector database to only those documents whose URL is in valid_urls,
-    then computes cosine similarity for the query on that subset and returns the top_n.
+    Filters the vector database to only those documents matching the URL
+    predicates (valid_urls, URL prefix, path section, domain), then computes
+    cosine similarity for the query on that subset and returns the top_n.
+    The predicates are resolved to rows through url_row_index first, so only
+    the matching rows are scored.
     """
-    # Compute similarity scores for all documents
-    query_vec = vectorizer.transform([query])
-    similarities = cosine_similarity(query_vec, doc_vectors).flatten()
+    if url_row_index is None:
+        url_row_index = build_url_row_index(metadata)
+    rows = resolve_rows(url_row_index, urls=valid_urls, prefix=prefix, section=section, domain=domain)
+    if rows is None:
+        rows = np.arange(doc_vectors.shape[0])
+    else:
+        rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return []
     
-    # Gather candidate indices whose URL is in the valid set
-    candidates = []
-    for idx in range(len(metadata)):
-        record_url = metadata[idx]["url"].lower()
-        if record_url in valid_urls:
-            candidates.append((idx, similarities[idx]))
+    # Compute similarity scores for the matching rows only
+    query_vec = vectorizer.transform([query])
+    similarities = cosine_similarity(query_vec, doc_vectors[rows]).flatten()
     
-    # Sort candidates by similarity in descending order
-    candidates = sorted(candidates, key=lambda x: x[1], reverse=True)
+    # Sort by similarity in descending order (ties keep row order)
+    order = np.argsort(-similarities, kind="stable")[:top_n]
     
     results = []
-    for idx, sim in candidates[:top_n]:
+    for pos in order:
+        idx = rows[pos]
         results.append({
             "url": metadata[idx]["url"],
             "title": metadata[idx].get("title", "No Title"),
             "content": corpus[idx],
-            "similarity": sim
+            "similarity": similarities[pos]
         })
     return results
 
@@ -71,9 +102,9 @@ def query_vector_subset(query, vectorizer, doc_vectors, metadata, corpus, valid_
 def scrape_content(url):
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
+        response = stream_get(requests.get, url, headers=headers, timeout=10, verify=False)
+        if response.status_code == 200 and not response.skip_reason:
+            soup = BeautifulSoup(page_text(response), "html.parser")
             return soup.get_text(separator=" ", strip=True)
     except Exception as e:
         print(f"Error scraping {url}: {e}")
@@ -107,10 +138,11 @@ if __name__ == "__main__":
     # Load local JSON data file
     json_file = r"C:\Users\surya\Desktop\webcrawling\vector_data.json"
     data = load_json(json_file)
+    url_index = build_url_index(data)
     
     # Load the vector database from the pickle file
     vector_pickle_file = r"C:\Users\surya\Desktop\webcrawling\vector_store.pkl"
-    vectorizer, doc_vectors, metadata, corpus = load_vector_database(vector_pickle_file)
+    vectorizer, doc_vectors, metadata, corpus, url_row_index = load_vector_database(vector_pickle_file)
     
     print("Enter your query (type 'exit' to quit):")
     while True:
@@ -120,7 +152,7 @@ if __name__ == "__main__":
             break
         
         # First, filter records using word filtering on the URL from local JSON data.
-        filtered_records = filter_records_by_url(data, query)
+        filtered_records = filter_records_by_url(data, query, url_index)
         
         if len(filtered_records) == 0:
             # Fallback to Google search if no local records found.
@@ -152,7 +184,8 @@ if __name__ == "__main__":
         else:
             # If more than 2 local records are found, narrow them down using vector similarity.
             valid_urls = set(record["url"].lower() for record in filtered_records)
-            vector_results = query_vector_subset(query, vectorizer, doc_vectors, metadata, corpus, valid_urls, top_n=2)
+            vector_results = query_vector_subset(query, vectorizer, doc_vectors, metadata, corpus, valid_urls, top_n=2,
+                                                 url_row_index=url_row_index)
             
             print(f"\nFound {len(filtered_records)} records after local URL filtering.")
             print(f"Displaying top {len(vector_results)} record(s) based on similarity:")
@@ -0,0 +1,147 @@
+import os
+import time
+import sqlite3
+
+# Crawl frontier persisted in SQLite. Every URL ever seen is one row keyed by
+# the URL, so enqueue, dequeue and "seen?" are single indexed lookups instead
+# of list scans, and a crawl stopped at any point resumes from the same queue
+# on the next run. A page's outgoing links and its "done" mark are written in
+# one transaction, so no page is lost or crawled twice across a restart.
+
+QUEUED = "queued"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"   # seen, but over the per-page link cap or depth limit
+
+class CrawlFrontier:
+    """
+    FIFO crawl queue with membership, per-page link caps and a depth limit.
+    Open the same path again to resume.
+    """
+
+    def __init__(self, path, max_depth=None, max_links_per_page=None):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_links_per_page = max_links_per_page
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " url TEXT NOT NULL UNIQUE,"
+            " depth INTEGER NOT NULL,"
+            " parent TEXT,"
+            " state TEXT NOT NULL,"
+            " error TEXT,"
+            " updated REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state, id)")
+        # Pages that were being fetched when the last run stopped go back in the queue.
+        resumed = self.conn.execute(
+            "UPDATE frontier SET state = ? WHERE state = ?", (QUEUED, IN_PROGRESS)
+        ).rowcount
+        self.conn.commit()
+        self._size = self.conn.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+        if resumed:
+            print(f"Resuming {path}: {resumed} interrupted page(s) re-queued")
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, url):
+        return self.conn.execute("SELECT 1 FROM frontier WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        return self._size
+
+    def count(self, state):
+        return self.conn.execute("SELECT COUNT(*) FROM frontier WHERE state = ?", (state,)).fetchone()[0]
+
+    def _enqueue(self, url, depth, parent):
+        """Insert url as queued, or promote it from skipped. True if it was queued."""
+        now = time.time()
+        inserted = self.conn.execute(
+            "INSERT OR IGNORE INTO frontier (url, depth, parent, state, updated) VALUES (?, ?, ?, ?, ?)",
+            (url, depth, parent, QUEUED, now)
+        ).rowcount
+        if inserted:
+            self._size += 1
+            return True
+        return self.conn.execute(
+            "UPDATE frontier SET state = ?, depth = ?, parent = ?, updated = ? WHERE url = ? AND state = ?",
+            (QUEUED, depth, parent, now, url, SKIPPED)
+        ).rowcount > 0
+
+    def _record_skipped(self, url, depth, parent):
+        self._size += self.conn.execute(
+            "INSERT OR IGNORE INTO frontier (url, depth, parent, state, updated) VALUES (?, ?, ?, ?, ?)",
+            (url, depth, parent, SKIPPED, time.time())
+        ).rowcount
+
+    def add_seeds(self, urls):
+        """Queue start URLs at depth 0 (already-known URLs are left as they are)."""
+        added = sum(self._enqueue(url, 0, None) for url in urls)
+        self.conn.commit()
+        return added
+
+    def pop(self):
+        """Oldest queued (url, depth), marked in progress; None when the queue is empty."""
+        row = self.conn.execute(
+            "SELECT id, url, depth FROM frontier WHERE state = ? ORDER BY id LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute("UPDATE frontier SET state = ?, updated = ? WHERE id = ?", (IN_PROGRESS, time.time(), row[0]))
+        self.conn.commit()
+        return row[1], row[2]
+
+    def complete(self, url, links=(), depth=0):
+        """
+        Mark url done and register the links found on it, in one transaction.
+        At most max_links_per_page new links are queued and none beyond
+        max_depth; the rest are still recorded (state "skipped") and can be
+        queued later from another page. Returns the number queued.
+        """
+        link_depth = depth + 1
+        queued = 0
+        with self.conn:
+            for link in links:
+                over_cap = self.max_links_per_page is not None and queued >= self.max_links_per_page
+                too_deep = self.max_depth is not None and link_depth > self.max_depth
+                if over_cap or too_deep:
+                    self._record_skipped(link, link_depth, url)
+                elif self._enqueue(link, link_depth, url):
+                    queued += 1
+            self.conn.execute("UPDATE frontier SET state = ?, updated = ? WHERE url = ?", (DONE, time.time(), url))
+        return queued
+
+    def fail(self, url, error):
+        with self.conn:
+            self.conn.execute("UPDATE frontier SET state = ?, error = ?, updated = ? WHERE url = ?",
+                              (FAILED, str(error)[:500], time.time(), url))
+
+    def urls(self, states=None):
+        """All URLs seen, in discovery order, optionally only in the given states."""
+        if states is None:
+            return [row[0] for row in self.conn.execute("SELECT url FROM frontier ORDER BY id")]
+        marks = ",".join("?" * len(states))
+        return [row[0] for row in self.conn.execute(
+            f"SELECT url FROM frontier WHERE state IN ({marks}) ORDER BY id", tuple(states))]
+
+    def stats(self):
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall())
+
+def reset_frontier(path):
+    """Delete a frontier database (and its WAL files) to start a crawl from scratch."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
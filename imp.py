@@ -1,97 +1,38 @@
 import os
-import pickle
-import numpy as np
-import requests
+import sys
 import re
-import json
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from bs4 import BeautifulSoup
-from googlesearch import search
-import urllib3
+from onnxencoder import load_query_encoder
+from startup import get_groq_client, prewarm
+from metrics import timed, record_llm_usage, start_metrics_server
+from streamfetch import stream_get, page_text
+from sites import ShardRouter, load_registry
 
-# Disable insecure request warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Heavy dependencies (sentence_transformers/torch, sklearn, bs4, requests,
+# googlesearch, groq) are imported on first use; prewarm() loads them before
+# the first query.
 
 # ------------------------------
-# VECTOR DATABASE FUNCTIONS
-# ------------------------------
-
-def load_vector_database(pickle_file=r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"):
-    with open(pickle_file, "rb") as f:
-        vector_db = pickle.load(f)
-    return vector_db
-
-def save_vector_database(vector_db, pickle_file=r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"):
-    with open(pickle_file, "wb") as f:
-        pickle.dump(vector_db, f)
-
-def query_vector_database(query, model, doc_vectors, metadata, threshold=0.5, top_n=5):
-    """
-    Encode the query, compute cosine similarities, and return top_n records
-    if the maximum similarity is above the threshold; else return None.
-    """
-    query_vec = model.encode([query])
-    similarities = cosine_similarity(query_vec, doc_vectors).flatten()
-    max_sim = np.max(similarities)
-    if max_sim < threshold:
-        return None, max_sim
-    else:
-        sorted_idx = np.argsort(similarities)[::-1]
-        results = []
-        for idx in sorted_idx[:top_n]:
-            results.append({
-                "url": metadata[idx]["url"],
-                "content": metadata[idx]["content"],
-                "similarity": similarities[idx]
-            })
-        return results, max_sim
-
-def update_vector_database(vector_db, new_records, model):
-    """
-    Compute embeddings for new_records and append them to the existing vector database.
-    Each new record should have 'url' and 'content'.
-    """
-    new_contents = [rec["content"] for rec in new_records]
-    new_embeddings = model.encode(new_contents)
-    vector_db["doc_vectors"] = np.vstack([vector_db["doc_vectors"], new_embeddings])
-    for rec in new_records:
-        vector_db["metadata"].append({"url": rec["url"], "content": rec["content"]})
-        vector_db["corpus"].append(rec["content"])
-    return vector_db
-
-# ------------------------------
-# GOOGLE SEARCH & SCRAPING FUNCTIONS
+# SCRAPING FUNCTIONS
 # ------------------------------
 
+@timed("scrape")
 def scrape_content(url):
+    import requests
+    import urllib3
+    from bs4 import BeautifulSoup
+    # Disable insecure request warnings
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
+        # Streamed: non-HTML results (PDFs, videos) are dropped after the headers.
+        response = stream_get(requests.get, url, headers=headers, timeout=10, verify=False)
+        if response.status_code == 200 and not response.skip_reason:
+            soup = BeautifulSoup(page_text(response), "html.parser")
             return soup.get_text(separator=" ", strip=True)
     except Exception as e:
         print(f"Error scraping {url}: {e}")
     return ""
 
-def simple_summary(text, word_limit=1000):
-    words = text.split()
-    if len(words) <= word_limit:
-        return text
-    return " ".join(words[:word_limit]) + "..."
-
-def google_search_and_scrape(query, domain="acg-world.com", num_results=2):
-    search_query = f"site:{domain} {query}"
-    raw_urls = list(search(search_query, num_results=num_results))
-    urls = [u for u in raw_urls if u.startswith("http")]
-    results = []
-    for url in urls:
-        content = scrape_content(url)
-        if content:
-            results.append({"url": url, "content": content})
-    return results
-
 # ------------------------------
 # GROQ CLOUD API FUNCTIONS (for summarization and final answer)
 # ------------------------------
@@ -101,11 +42,8 @@ def query_groq_api(prompt, model="llama-3.3-70b-versatile"):
     Use Groq Cloud API to process a prompt.
     Returns the API's text response.
     """
-    from groq import Groq, GroqError
-    api_key = os.environ.get("GROQ_API_KEY")
-    if not api_key:
-        raise Exception("GROQ_API_KEY not set in environment variables.")
-    client = Groq(api_key=api_key)
+    from groq import GroqError
+    client = get_groq_client()
     try:
         chat_completion = client.chat.completions.create(
             messages=[
@@ -119,6 +57,7 @@ def query_groq_api(prompt, model="llama-3.3-70b-versatile"):
             stop=None
         )
         # Use dot notation instead of subscript:
+        record_llm_usage(chat_completion)
         return chat_completion.choices[0].message.content
     except GroqError as e:
         print(f"Groq API Error: {e}")
@@ -127,6 +66,7 @@ def query_groq_api(prompt, model="llama-3.3-70b-versatile"):
         print(f"Unexpected error in Groq API: {e}")
         return "NO CONTENT"
 
+@timed("summarize")
 def summarize_text(text):
     """
     Summarize text using Groq Cloud API.
@@ -137,6 +77,7 @@ def summarize_text(text):
         return "NO CONTENT"
     return summary.strip()
 
+@timed("generate_answer")
 def generate_final_answer(query, context):
     """
     Generate a final answer using Groq Cloud API with a system prompt.
@@ -156,25 +97,30 @@ def generate_final_answer(query, context):
 # ------------------------------
 
 def main():
-    # Load the vector database.
-    pickle_file = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
-    vector_db = load_vector_database(pickle_file)
+    # Site shards from sites.json (only the original acg-world store when there
+    # is no registry). python imp.py [site] picks the site; a query starting
+    # with "@<site> " is routed to that site's shard instead.
+    router = ShardRouter(load_registry(), load_model=load_query_encoder)
+    site = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("SITE")
     
-    # Retrieve stored data.
-    doc_vectors = vector_db["doc_vectors"]
-    metadata = vector_db["metadata"]
-    corpus = vector_db["corpus"]
+    # Open the site's shard: vector database, pending patches and the BM25
+    # postings / vector norms for the retrieval engine. Texts stay in
+    # vector_db["corpus"] and are read only for the rows a query returns.
+    # The query encoder matches the shard's embedding model.
+    # PyTorch by default; QUERY_ENCODER=onnx switches to the int8 ONNX Runtime backend.
+    site, site_config, vector_db, model = router.route(site)
+    print(f"Site: {site} ({site_config['domain']}), embedding model: {vector_db.get('model_name', 'all-MiniLM-L6-v2')}")
     
-    # Ensure each metadata dictionary has 'content'
-    for i, md in enumerate(metadata):
-        if "content" not in md:
-            md["content"] = corpus[i]
+    # Import the lazy dependencies and run a dummy encode before taking queries.
+    prewarm(vector_db, model)
     
-    # Load the SentenceTransformer model used for embeddings.
-    emb_model_name = vector_db.get("model_name", "all-MiniLM-L6-v2")
-    print(f"Loading embedding model: {emb_model_name}")
-    model = SentenceTransformer(emb_model_name)
+    # Prometheus-style /metrics endpoint for the stage timings and counters.
+    start_metrics_server()
     
+    # Fallback pages are summarized and indexed by a background worker.
+    from asyncpipeline import answer_query
+    from ingestqueue import start_ingest_worker
+    ingest_queue, _ = start_ingest_worker(router)
     threshold = 0.5  # Adjust similarity threshold as needed.
     
     print("Enter your query (press Ctrl+C to exit):")
@@ -183,48 +129,28 @@ def main():
             query = input("Query: ").strip()
             if not query:
                 continue
+            query_site = site
+            if query.startswith("@") and " " in query:
+                query_site, query = query[1:].split(" ", 1)
+            try:
+                # Opens the shard on first use; idle / least recently used shards are closed.
+                query_site, site_config, vector_db, model = router.route(query_site)
+            except KeyError as e:
+                print(e)
+                continue
             
-            # First, try to retrieve local matches (top 5).
-            results, max_sim = query_vector_database(query, model, doc_vectors, metadata, threshold=threshold, top_n=5)
-            context = ""
-            ref_links = []
-            source_label = ""
-            
-            if results is not None:
-                source_label = "retrieved"
-                for res in results:
-                    snippet = res["content"][:1000]  # Adjust snippet length if desired.
-                    context += f"URL: {res['url']}\nSummary: {snippet}\n\n"
-                    ref_links.append(res["url"])
-                print("Local matches found:")
-                for res in results:
-                    print(f"URL: {res['url']} | Similarity: {res['similarity']:.4f}")
-            else:
-                print(f"No local match found (max similarity {max_sim:.4f} below threshold {threshold}).")
-                print("Falling back to Google search...")
-                google_results = google_search_and_scrape(query)
-                if google_results:
-                    source_label = "googled"
-                    # Use only the top result from Google search.
-                    top_google = google_results[0]
-                    summarized = summarize_text(top_google["content"])
-                    if summarized != "NO CONTENT":
-                        new_record = {"url": top_google["url"], "content": summarized}
-                        context += f"URL: {new_record['url']}\nSummary: {new_record['content']}\n\n"
-                        ref_links.append(new_record["url"])
-                        # Update vector database with the new record.
-                        vector_db = update_vector_database(vector_db, [new_record], model)
-                        save_vector_database(vector_db, pickle_file)
-                        print("Vector database updated with new Google result:")
-                        print(f"Added URL: {new_record['url']}")
-                    else:
-                        print("Google search yielded no summarizable content.")
-                else:
-                    print("Google search found no results.")
-            
-            # Limit reference links to 2 for the final answer.
-            ref_links = ref_links[:2]
-            final_answer = generate_final_answer(query, context)
+            # Retrieval, the Google fallback and the answer run as one asyncio
+            # pipeline within QUERY_BUDGET seconds; a weak hit starts the
+            # fallback speculatively. A fallback page is answered from its
+            # text and queued for the ingest worker.
+            final_answer, ref_links, report = answer_query(
+                query, vector_db, model, domain=site_config["domain"], threshold=threshold, top_n=5,
+                enqueue=lambda url, text, s=query_site: ingest_queue.enqueue(s, url, text)
+            )
+            source_label = report["source"]
+            print(f"Source: {source_label or 'none'} in {report['total']:.2f}s, stages: {report['stages']}")
+            if report["timed_out"]:
+                print(f"Timed out: {report['timed_out']}")
             print("\nFinal Answer:")
             print(final_answer)
             if ref_links:
@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Durable queue of pages to add to the index, kept in SQLite next to the
+# stores. The query path only enqueues the page it scraped for a fallback
+# answer; a background worker takes jobs in batches, summarizes them with the
+# LLM, embeds each batch in one encode call and writes it to the site's shard
+# through the rawupdate delta log. Several processes (the app, imp.py, the
+# recrawl daemon) can work the same queue: a claimed job carries its owner
+# and a lease, and only a job whose lease ran out (its worker stopped or hung)
+# is taken again. New content for a job that is being worked on bumps its
+# version, so the job is queued again instead of being marked done.
+
+DEFAULT_QUEUE = r"C:\Users\surya\Desktop\webcrawling\ingest_queue.db"
+
+QUEUED = "queued"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+DROPPED = "dropped"   # summarizer found nothing worth indexing
+FAILED = "failed"     # gave up after MAX_ATTEMPTS
+MAX_ATTEMPTS = 3
+LEASE_SECONDS = 900   # a claimed batch (LLM summaries + one encode) must finish within this
+
+class IngestQueue:
+    """SQLite-backed job queue, one row per (site, url). Thread-safe."""
+
+    def __init__(self, path=DEFAULT_QUEUE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " site TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " created REAL,"
+            " updated REAL,"
+            " owner TEXT,"
+            " lease_until REAL,"
+            " version INTEGER NOT NULL DEFAULT 0,"
+            " UNIQUE (site, url))"
+        )
+        # Queues created before leases existed.
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL"), ("version", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def enqueue(self, site, url, content):
+        """
+        Queue a page. A page already waiting is given the newer content; one
+        that was indexed (or dropped, or failed) before is queued again. A
+        page being worked on gets the newer content and a new version, and
+        is queued again when its current claim finishes.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (site, url, content, state, created, updated) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (site, url) DO UPDATE SET content = excluded.content, attempts = 0, error = NULL, "
+                "updated = excluded.updated, version = version + 1, "
+                "state = CASE WHEN state = ? THEN state ELSE ? END",
+                (site, url, content, QUEUED, now, now, IN_PROGRESS, QUEUED)
+            )
+
+    def claim(self, limit):
+        """
+        Up to limit oldest queued jobs (or jobs whose lease expired) as
+        dicts, marked in progress and leased to this queue for LEASE_SECONDS.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, site, url, content, attempts, version FROM jobs "
+                "WHERE state = ? OR (state = ? AND (lease_until IS NULL OR lease_until < ?)) ORDER BY id LIMIT ?",
+                (QUEUED, IN_PROGRESS, now, limit)
+            ).fetchall()
+            self.conn.executemany("UPDATE jobs SET state = ?, owner = ?, lease_until = ?, updated = ? WHERE id = ?",
+                                  [(IN_PROGRESS, self.owner, now + LEASE_SECONDS, now, row[0]) for row in rows])
+        return [{"id": row[0], "site": row[1], "url": row[2], "content": row[3], "attempts": row[4],
+                 "version": row[5]} for row in rows]
+
+    def finish(self, jobs, state=DONE):
+        """
+        Mark claimed jobs with state. A job given new content since it was
+        claimed is queued again instead; a job whose lease was taken over by
+        another worker is left to that worker.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = CASE WHEN version = ? THEN ? ELSE ? END, owner = NULL, lease_until = NULL, "
+                "updated = ? WHERE id = ? AND state = ? AND owner = ?",
+                [(job["version"], state, QUEUED, time.time(), job["id"], IN_PROGRESS, self.owner) for job in jobs]
+            )
+
+    def retry(self, jobs, error):
+        """Put failed jobs back in the queue, or mark them failed after MAX_ATTEMPTS."""
+        with self._lock, self.conn:
+            for job in jobs:
+                state = FAILED if job["attempts"] + 1 >= MAX_ATTEMPTS else QUEUED
+                self.conn.execute(
+                    "UPDATE jobs SET state = CASE WHEN version = ? THEN ? ELSE ? END, attempts = attempts + 1, "
+                    "error = ?, owner = NULL, lease_until = NULL, updated = ? WHERE id = ? AND state = ? AND owner = ?",
+                    (job["version"], state, QUEUED, str(error)[:500], time.time(), job["id"], IN_PROGRESS, self.owner)
+                )
+
+    def stats(self):
+        with self._lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+# ------------------------------
+# WORKER
+# ------------------------------
+
+def _summarize(job):
+    from imp import summarize_text
+    return summarize_text(job["content"])
+
+def process_batch(queue, router, jobs, summarizers=4):
+    """Summarize, embed and index one batch of claimed jobs, one shard at a time."""
+    by_site = {}
+    for job in jobs:
+        by_site.setdefault(job["site"], []).append(job)
+    for site, site_jobs in by_site.items():
+        try:
+            with ThreadPoolExecutor(max_workers=summarizers) as pool:
+                summaries = list(pool.map(_summarize, site_jobs))
+            kept = [(job, summary) for job, summary in zip(site_jobs, summaries) if summary != "NO CONTENT"]
+            dropped = [job for job, summary in zip(site_jobs, summaries) if summary == "NO CONTENT"]
+            if kept:
+                stats = router.patch(site, [{"url": job["url"], "content": summary} for job, summary in kept])
+                print(f"Indexed {len(kept)} page(s) into {site}: {stats}")
+            queue.finish([job for job, _ in kept])
+            queue.finish(dropped, DROPPED)
+        except Exception as e:
+            print(f"Ingest batch for {site} failed: {e}")
+            queue.retry(site_jobs, e)
+
+def run_worker(queue, router, batch_size=8, poll_seconds=2.0, stop=None, once=False):
+    """Take jobs in batches until stop is set (or the queue is empty, with once=True)."""
+    while stop is None or not stop.is_set():
+        jobs = queue.claim(batch_size)
+        if jobs:
+            process_batch(queue, router, jobs)
+            continue
+        if once:
+            return
+        if stop is not None:
+            stop.wait(poll_seconds)
+        else:
+            time.sleep(poll_seconds)
+
+def start_ingest_worker(router, queue_path=DEFAULT_QUEUE, batch_size=8, poll_seconds=2.0):
+    """
+    Run the worker on a daemon thread of this process, so pages are indexed
+    straight into the shards the router has open. Returns (queue, stop event).
+    """
+    queue = IngestQueue(queue_path)
+    stop = threading.Event()
+    thread = threading.Thread(target=run_worker, args=(queue, router, batch_size, poll_seconds, stop),
+                              name="ingest-worker", daemon=True)
+    thread.start()
+    return queue, stop
+
+def main():
+    # python ingestqueue.py [stats]: jobs per state
+    # python ingestqueue.py work [--once]: run a standalone worker (when no
+    #     app/imp process is running one); open shards in those processes pick
+    #     the new rows up from the delta log on their next query
+    from sites import ShardRouter
+    args = sys.argv[1:]
+    queue = IngestQueue(DEFAULT_QUEUE)
+    if args and args[0] == "work":
+        print(f"Ingest worker on {DEFAULT_QUEUE}: {queue.stats()}")
+        try:
+            run_worker(queue, ShardRouter(), once="--once" in args)
+        except KeyboardInterrupt:
+            pass
+        print(f"Stopped: {queue.stats()}")
+        return
+    print(f"{DEFAULT_QUEUE}: {queue.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import re
+
+# A query term matches a document with re.search(r'\b' + term + r'\b', text).
+# For a term made only of word characters that is exactly "the term is one of
+# the maximal \w+ runs of the text", so those runs are what we index.
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    """Return the set of lowercased word tokens in text."""
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+def build_inverted_index(texts):
+    """
+    Build a token -> sorted list of row ids index over a list of texts.
+    Row ids are positions in texts, so the index lines up with the store's
+    metadata/corpus lists.
+    """
+    postings = {}
+    for row, text in enumerate(texts):
+        for token in tokenize(text or ""):
+            postings.setdefault(token, []).append(row)
+    return {"postings": postings, "num_docs": len(texts)}
+
+def add_to_inverted_index(index, texts):
+    """Append texts as new rows (numbered after the existing ones) to index."""
+    start = index["num_docs"]
+    postings = index["postings"]
+    for offset, text in enumerate(texts):
+        for token in tokenize(text or ""):
+            postings.setdefault(token, []).append(start + offset)
+    index["num_docs"] = start + len(texts)
+    return index
+
+def _intersect(a, b):
+    """Intersect two sorted row lists."""
+    if len(a) > len(b):
+        a, b = b, a
+    b_set = set(b)
+    return [row for row in a if row in b_set]
+
+def match_all_terms(index, query, texts=None):
+    """
+    Return the sorted row ids where every whitespace-separated query term
+    appears with word boundaries, same as the old per-record regex scan.
+
+    Plain word terms are answered from the posting lists alone. Terms with
+    punctuation (e.g. "acg-world", "r&d") narrow the candidates through their
+    word parts and are then confirmed with the original regex, which needs
+    texts (row-aligned with the index).
+    """
+    query_terms = query.lower().split()
+    if not query_terms:
+        return list(range(index["num_docs"]))
+
+    postings = index["postings"]
+    candidates = None
+    verify_terms = []
+    word_terms = []
+    for term in query_terms:
+        if TOKEN_PATTERN.fullmatch(term):
+            word_terms.append(term)
+        else:
+            verify_terms.append(term)
+            word_terms.extend(TOKEN_PATTERN.findall(term))
+    # Rarest lists first keeps the running intersection small.
+    for term in sorted(set(word_terms), key=lambda t: len(postings.get(t, ()))):
+        rows = postings.get(term)
+        if not rows:
+            return []
+        candidates = rows if candidates is None else _intersect(candidates, rows)
+        if not candidates:
+            return []
+
+    if candidates is None:
+        candidates = list(range(index["num_docs"]))
+    if verify_terms:
+        if texts is None:
+            raise ValueError("texts are required to match terms containing punctuation")
+        patterns = [re.compile(r'\b' + re.escape(term) + r'\b') for term in verify_terms]
+        verified = []
+        for row in candidates:
+            text_lower = (texts[row] or "").lower()
+            if all(p.search(text_lower) for p in patterns):
+                verified.append(row)
+        candidates = verified
+    return list(candidates)
@@ -2,6 +2,7 @@ import warnings
 import re
 import requests
 from bs4 import BeautifulSoup
+from streamfetch import stream_get, page_text
 from googlesearch import search
 
 
@@ -15,11 +16,13 @@ def clean_text(text):
 def get_page_content(url):
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
+        response = stream_get(requests.get, url, headers=headers, timeout=10, verify=False)
+        if response.status_code == 200 and not response.skip_reason:
+            soup = BeautifulSoup(page_text(response), "html.parser")
             raw_text = soup.get_text(separator=" ", strip=True)
             return clean_text(raw_text)
+        elif response.skip_reason:
+            return f"Error: skipped ({response.skip_reason})"
         else:
             return f"Error: Status code {response.status_code}"
     except Exception as e:
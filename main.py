@@ -9,6 +9,9 @@ import time
 import re
 import streamlit as st
 from googlesearch import search
+from invertedindex import match_all_terms
+from metrics import span, timed, incr, record_llm_usage, start_metrics_server
+from streamfetch import stream_get, page_text
 
 # Suppress SSL warnings for testing only
 warnings.filterwarnings("ignore", message="Unverified HTTPS request")
@@ -17,8 +20,15 @@ warnings.filterwarnings("ignore", message="Unverified HTTPS request")
 def load_vector_database(pickle_file=r"C:\Users\surya\Desktop\webcrawling\vector_store.pkl"):
     with open(pickle_file, "rb") as f:
         vector_store = pickle.load(f)
-    return vector_store["vectorizer"], vector_store["doc_vectors"], vector_store["metadata"], vector_store["corpus"]
+    # Stores built before the inverted index existed have none; their few
+    # results are then checked directly (filter_results_by_query).
+    content_index = vector_store.get("content_index")
+    # Hashed-index stores (tfidf.py) derive their document vectors on load.
+    vectorizer = vector_store["vectorizer"]
+    doc_vectors = vector_store["doc_vectors"] if "doc_vectors" in vector_store else vectorizer.doc_vectors
+    return vectorizer, doc_vectors, vector_store["metadata"], vector_store["corpus"], content_index
 
+@timed("similarity_search")
 def query_vector_database(query, vectorizer, doc_vectors, metadata, corpus, threshold=0.0000000000000005, top_n=2):
     query_vec = vectorizer.transform([query])
     similarities = cosine_similarity(query_vec, doc_vectors).flatten()
@@ -28,13 +38,22 @@ def query_vector_database(query, vectorizer, doc_vectors, metadata, corpus, thre
         sorted_indices = indices[np.argsort(similarities[indices])[::-1]]
         for idx in sorted_indices[:top_n]:
             results.append({
+                "row": idx,
                 "url": metadata[idx]["url"],
                 "content": corpus[idx],
                 "similarity": similarities[idx]
             })
     return results
 
-def filter_results_by_query(results, query):
+def filter_results_by_query(results, query, content_index=None, corpus=None):
+    """
+    Keep results whose content contains every query term as a whole word.
+    With a content_index the check is a posting-list intersection instead of
+    a regex scan per result and term.
+    """
+    if content_index is not None:
+        matching_rows = set(match_all_terms(content_index, query, corpus))
+        return [res for res in results if res["row"] in matching_rows]
     query_terms = query.lower().split()
     filtered = []
     for res in results:
@@ -44,12 +63,13 @@ def filter_results_by_query(results, query):
     return filtered
 
 ### GOOGLE SEARCH FALLBACK FUNCTIONS ###
+@timed("scrape")
 def scrape_content(url):
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.get(url, headers=headers, timeout=10, verify=False)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
+        response = stream_get(requests.get, url, headers=headers, timeout=10, verify=False)
+        if response.status_code == 200 and not response.skip_reason:
+            soup = BeautifulSoup(page_text(response), "html.parser")
             return soup.get_text(separator=" ", strip=True)
     except Exception as e:
         st.error(f"Error scraping {url}: {e}")
@@ -61,6 +81,7 @@ def simple_summary(text, word_limit=1000):
         return text
     return " ".join(words[:word_limit]) + "..."
 
+@timed("google_fallback")
 def google_search_and_scrape(query, domain="acg-world.com", num_results=2):
     if search is None:
         return []
@@ -79,6 +100,7 @@ def google_search_and_scrape(query, domain="acg-world.com", num_results=2):
     return results
 
 ### GROQ CLOUD API FUNCTION ###
+@timed("generate_answer")
 def query_groq_api(query, context, model="llama-3.3-70b-versatile"):
     from groq import Groq, GroqError
     api_key = os.environ.get("GROQ_API_KEY")
@@ -103,6 +125,7 @@ def query_groq_api(query, context, model="llama-3.3-70b-versatile"):
             stream=False,
             stop=None
         )
+        record_llm_usage(chat_completion)
         return chat_completion.choices[0].message.content
     except GroqError as e:
         return f"Groq API Error: {e}"
@@ -110,14 +133,19 @@ def query_groq_api(query, context, model="llama-3.3-70b-versatile"):
         return f"Unexpected error: {e}"
 
 ### MAIN PIPELINE ###
+# Loaded once per server process instead of on every query.
+@st.cache_resource
+def cached_vector_database():
+    return load_vector_database()
+
 def process_query(query):
     try:
-        vectorizer, doc_vectors, metadata, corpus = load_vector_database()
+        vectorizer, doc_vectors, metadata, corpus, content_index = cached_vector_database()
     except Exception as e:
         return f"Error loading vector database: {e}", [], ""
     
     vector_results = query_vector_database(query, vectorizer, doc_vectors, metadata, corpus)
-    vector_results = filter_results_by_query(vector_results, query)
+    vector_results = filter_results_by_query(vector_results, query, content_index, corpus)
     
     context = ""
     ref_links = []
@@ -125,11 +153,13 @@ def process_query(query):
     
     if vector_results:
         source_label = "retrieved"
+        incr("cache_hits")
         for res in vector_results:
             summary = simple_summary(res["content"], word_limit=1000)
             context += f"URL: {res['url']}\nSummary: {summary}\n\n"
             ref_links.append(res["url"])
     else:
+        incr("fallbacks")
         google_results = google_search_and_scrape(query)
         if google_results:
             source_label = "googled"
@@ -150,8 +180,14 @@ st.markdown("Ask questions about ACG World and get concise answers with referenc
 
 query_input = st.text_input("Enter your query about ACG World:")
 
+@st.cache_resource
+def metrics_server():
+    return start_metrics_server()
+
+metrics_server()
+
 if st.button("Submit Query") and query_input:
-    with st.spinner("Processing your query..."):
+    with st.spinner("Processing your query..."), span("query_total"):
         final_answer, references, source_label = process_query(query_input)
     st.subheader("Final Answer:")
     st.markdown(final_answer)
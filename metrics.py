@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Per-stage timing spans and counters for the query pipelines. Every span is
+# written as one JSON log line (enable with PIPELINE_LOG=stderr or a file
+# path) and aggregated into Prometheus-style histograms served on /metrics.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms = {}   # (stage, labels) -> [bucket counts..., sum, count]
+_counters = {}     # (name, labels) -> value
+_server = None
+
+logger = logging.getLogger("pipeline.metrics")
+logger.propagate = False
+_log_target = os.environ.get("PIPELINE_LOG")
+if _log_target:
+    _handler = logging.StreamHandler() if _log_target == "stderr" else logging.FileHandler(_log_target, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _log(event, **fields):
+    if logger.handlers:
+        fields.update({"ts": round(time.time(), 3), "event": event})
+        logger.info(json.dumps(fields, default=str))
+
+def observe(stage, seconds, **labels):
+    """Record one duration for stage."""
+    key = (stage, _label_key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+@contextmanager
+def span(stage, **labels):
+    """Time the enclosed block as one stage of the pipeline."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(stage, seconds, **labels)
+        _log("span", stage=stage, duration_ms=round(seconds * 1000.0, 3), error=error, **labels)
+
+def timed(stage):
+    """Decorator form of span() for whole functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def incr(name, value=1, **labels):
+    """
+    Add value to counter name (cache hits, fallbacks, LLM tokens, ...).
+    Counters only go up: a negative value is not added but counted in
+    <name>_negative instead.
+    """
+    if value < 0:
+        name, value = name + "_negative", 1
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _log("counter", name=name, value=value, **labels)
+
+def record_llm_usage(completion, **labels):
+    """Count prompt/completion tokens from a Groq chat completion's usage block."""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    incr("llm_requests", **labels)
+    incr("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0, **labels)
+    incr("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0, **labels)
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def render_prometheus():
+    """All spans and counters in the Prometheus text exposition format."""
+    lines = [
+        "# HELP pipeline_stage_duration_seconds Time spent per query pipeline stage.",
+        "# TYPE pipeline_stage_duration_seconds histogram"
+    ]
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+    for (stage, labels), hist in sorted(histograms.items()):
+        base = (("stage", stage),) + labels
+        for bound, count in zip(BUCKETS, hist):
+            lines.append(f"pipeline_stage_duration_seconds_bucket{_format_labels(base + (('le', bound),))} {count}")
+        lines.append(f"pipeline_stage_duration_seconds_bucket{_format_labels(base + (('le', '+Inf'),))} {hist[-1]}")
+        lines.append(f"pipeline_stage_duration_seconds_sum{_format_labels(base)} {hist[-2]:.6f}")
+        lines.append(f"pipeline_stage_duration_seconds_count{_format_labels(base)} {hist[-1]}")
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f"# TYPE pipeline_{name}_total counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"pipeline_{name}_total{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def start_metrics_server(port=None, host=None):
+    """
+    Serve /metrics on host:port (METRICS_HOST, default 127.0.0.1; METRICS_PORT,
+    default 9100) from a daemon thread. The endpoint has no authentication, so
+    set METRICS_HOST=0.0.0.0 only when a scraper on another machine needs it.
+    Safe to call more than once; only the first call starts a server.
+    """
+    global _server
+    if _server is not None:
+        return _server
+    port = int(port or os.environ.get("METRICS_PORT", "9100"))
+    host = host or os.environ.get("METRICS_HOST", "127.0.0.1")
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return _server
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import pickle
+import numpy as np
+
+# Optional CPU backend for query encoding: the SentenceTransformer named in
+# vector_db["model_name"] exported to ONNX, dynamically quantized to int8 and
+# run with onnxruntime. Select it with QUERY_ENCODER=onnx. Every model gets
+# its own export under DEFAULT_ONNX_ROOT (<root>/<model name>), so shards
+# built with different models are never encoded with the wrong one.
+DEFAULT_ONNX_ROOT = os.environ.get("ONNX_MODEL_DIR", r"C:\Users\surya\Desktop\webcrawling\onnx_encoder")
+
+def onnx_dir_for(model_name, root=None):
+    """The export directory of model_name under root (default DEFAULT_ONNX_ROOT)."""
+    return os.path.join(root or DEFAULT_ONNX_ROOT, model_name.replace("/", "__"))
+
+def has_onnx_export(model_dir):
+    return os.path.exists(os.path.join(model_dir, "encoder_config.json"))
+
+def export_onnx_encoder(model_name, output_dir, quantize=True):
+    """
+    Export the transformer of a SentenceTransformer model to ONNX (dynamic
+    batch and sequence axes), then write an int8 dynamically quantized copy.
+    The tokenizer and pooling settings are saved next to it.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    normalize = any(type(module).__name__ == "Normalize" for module in st_model)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"}
+            },
+            opset_version=14
+        )
+    model_file = "model_fp32.onnx"
+    if quantize:
+        quantize_dynamic(fp32_path, os.path.join(output_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+        model_file = "model_int8.onnx"
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, "encoder_config.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": model_name,
+            "model_file": model_file,
+            "max_seq_length": st_model.max_seq_length,
+            "normalize": normalize,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id
+        }, f, indent=2)
+    print(f"Exported {model_name} to {os.path.join(output_dir, model_file)}")
+    return output_dir
+
+class OnnxQueryEncoder:
+    """
+    Drop-in for SentenceTransformer.encode backed by onnxruntime. Threading
+    is set up for single-query latency: one operator at a time, using all
+    intra-op threads. With model_name, the export must have been made from
+    that model (ValueError otherwise).
+    """
+
+    def __init__(self, model_dir, intra_op_threads=None, model_file=None, model_name=None):
+        with open(os.path.join(model_dir, "encoder_config.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        if model_name is not None and self.config.get("model_name") != model_name:
+            raise ValueError(f"ONNX export in {model_dir} is of {self.config.get('model_name')!r}, not {model_name!r}")
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file or self.config["model_file"]),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+            hidden = self.session.run(None, {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+            # Mean pooling over real tokens, as in the SentenceTransformer pipeline.
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.config.get("normalize") or normalize_embeddings:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            outputs.append(pooled.astype(np.float32))
+        if not outputs:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(outputs)
+
+def load_query_encoder(model_name, backend=None, model_dir=None):
+    """
+    Return the encoder used for queries: the ONNX export of model_name when
+    QUERY_ENCODER=onnx (or backend="onnx"), else the PyTorch SentenceTransformer.
+    A model that has not been exported falls back to PyTorch.
+    """
+    backend = backend or os.environ.get("QUERY_ENCODER", "torch")
+    if backend == "onnx":
+        model_dir = model_dir or onnx_dir_for(model_name)
+        if has_onnx_export(model_dir):
+            return OnnxQueryEncoder(model_dir, model_name=model_name)
+        print(f"No ONNX export of {model_name} in {model_dir} (run onnxencoder.py export); using PyTorch")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def _cosine_to_store(encoder, queries, doc_vectors):
+    query_vecs = np.asarray(encoder.encode(queries), dtype=np.float32)
+    query_vecs = query_vecs / np.clip(np.linalg.norm(query_vecs, axis=1, keepdims=True), 1e-12, None)
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    docs = docs / np.clip(np.linalg.norm(docs, axis=1, keepdims=True), 1e-12, None)
+    return query_vecs @ docs.T
+
+def parity_check(onnx_encoder, torch_model, doc_vectors, queries, tolerance=0.02, top_k=5):
+    """
+    Score queries against the stored float vectors with both encoders and
+    compare. Passes when every cosine score differs by at most tolerance.
+    Also reports how often the top_k rows agree.
+    """
+    onnx_scores = _cosine_to_store(onnx_encoder, queries, doc_vectors)
+    torch_scores = _cosine_to_store(torch_model, queries, doc_vectors)
+    diff = np.abs(onnx_scores - torch_scores)
+    overlaps = []
+    for onnx_row, torch_row in zip(onnx_scores, torch_scores):
+        onnx_top = set(np.argsort(-onnx_row)[:top_k])
+        torch_top = set(np.argsort(-torch_row)[:top_k])
+        overlaps.append(len(onnx_top & torch_top) / top_k)
+    return {
+        "max_abs_diff": float(diff.max()) if diff.size else 0.0,
+        "mean_abs_diff": float(diff.mean()) if diff.size else 0.0,
+        f"top{top_k}_overlap": float(np.mean(overlaps)) if overlaps else 1.0,
+        "passed": bool(diff.size == 0 or diff.max() <= tolerance)
+    }
+
+def benchmark_encoders(encoders, queries, repeats=5, warmup=3):
+    """Single-query encode latency per encoder: {name: {"p50_ms", "p95_ms", "mean_ms"}}."""
+    report = {}
+    for name, encoder in encoders.items():
+        for query in queries[:warmup]:
+            encoder.encode([query])
+        timings = []
+        for _ in range(repeats):
+            for query in queries:
+                start = time.perf_counter()
+                encoder.encode([query])
+                timings.append((time.perf_counter() - start) * 1000.0)
+        timings = np.asarray(timings)
+        report[name] = {
+            "mean_ms": float(timings.mean()),
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p95_ms": float(np.percentile(timings, 95))
+        }
+    return report
+
+def main():
+    # python onnxencoder.py export [store.pkl] [output_dir]
+    # python onnxencoder.py check  [store.pkl] [output_dir]
+    # output_dir defaults to <ONNX_MODEL_DIR>/<the store's model name>.
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    pickle_file = sys.argv[2] if len(sys.argv) > 2 else r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+    from textarena import relocate_store_texts
+    with open(pickle_file, "rb") as f:
+        vector_db = relocate_store_texts(pickle.load(f), pickle_file)
+    model_name = vector_db.get("model_name", "all-MiniLM-L6-v2")
+    model_dir = sys.argv[3] if len(sys.argv) > 3 else onnx_dir_for(model_name)
+
+    if command == "export":
+        export_onnx_encoder(model_name, model_dir)
+        return
+
+    from sentence_transformers import SentenceTransformer
+    torch_model = SentenceTransformer(model_name, device="cpu")
+    onnx_encoder = OnnxQueryEncoder(model_dir, model_name=model_name)
+    queries = [
+        " ".join(md["url"].rstrip("/").split("/")[-1].replace("-", " ").split("#")[0].split())
+        or "acg capsules" for md in vector_db["metadata"][:50]
+    ]
+    parity = parity_check(onnx_encoder, torch_model, vector_db["doc_vectors"], queries)
+    print(f"Parity: max |diff| {parity['max_abs_diff']:.4f}, mean |diff| {parity['mean_abs_diff']:.4f}, "
+          f"top5 overlap {parity['top5_overlap']:.2f} -> {'PASS' if parity['passed'] else 'FAIL'}")
+    report = benchmark_encoders({"pytorch": torch_model, "onnx-int8": onnx_encoder}, queries)
+    for name, stats in report.items():
+        print(f"{name:>10}: mean {stats['mean_ms']:.2f} ms | p50 {stats['p50_ms']:.2f} ms | p95 {stats['p95_ms']:.2f} ms")
+    # Non-zero on FAIL so a deploy script can refuse to switch QUERY_ENCODER to onnx.
+    sys.exit(0 if parity["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import time
+import threading
+import email.utils
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from streamfetch import stream_get, HTML_TYPES
+
+# Per-host politeness for the crawlers. Every host gets its own request rate
+# and concurrency limit, adapted AIMD-style: after a round of fast, successful
+# responses both grow by one (request/s and request in flight); a 429/503, a
+# connection error or a slow response halves them. robots.txt rules and
+# Crawl-delay are fetched once per host and cached; Crawl-delay caps the rate.
+
+USER_AGENT = "Mozilla/5.0"
+ROBOTS_TTL = 24 * 3600
+CONGESTION_STATUSES = (429, 503)
+
+def _crawl_delay(lines, user_agent):
+    """
+    Crawl-delay for user_agent from robots.txt lines. urllib.robotparser
+    only understands whole seconds, and "Crawl-delay: 0.5" is common.
+    """
+    agent = user_agent.split("/")[0].lower()
+    delays = {}
+    group = []
+    in_rules = False
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        field, value = [part.strip() for part in line.split(":", 1)]
+        field = field.lower()
+        if field == "user-agent":
+            if in_rules:
+                group = []
+                in_rules = False
+            group.append(value.lower())
+        else:
+            in_rules = True
+            if field == "crawl-delay":
+                try:
+                    for name in group:
+                        delays[name] = float(value)
+                except ValueError:
+                    pass
+    for name, delay in delays.items():
+        if name != "*" and name in agent:
+            return delay
+    return delays.get("*")
+
+def _retry_after_seconds(value):
+    """Retry-After as seconds; the header is either a number or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class PolitenessScheduler:
+    """
+    Gatekeeper for every request a crawler makes. Use fetch(url) for a polite
+    GET, or slot(url) + record(...) around a custom request. Thread-safe, so
+    several workers can share one scheduler; each host's limit caps how many
+    of them hit that host at once.
+    """
+
+    def __init__(self, user_agent=USER_AGENT, initial_delay=1.0, max_delay=60.0, max_rate=20.0,
+                 max_concurrency=8, target_latency=1.5, verify=True, timeout=10, archive=None):
+        self.user_agent = user_agent
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.verify = verify
+        self.timeout = timeout
+        # Optional webarchive.ArchiveWriter that keeps every raw response.
+        self.archive = archive
+        self._hosts = {}
+        self._robots = {}
+        self._robots_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    # ------------------------------
+    # ROBOTS.TXT
+    # ------------------------------
+
+    def _robots_for(self, url):
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        with self._robots_lock:
+            cached = self._robots.get(host)
+            if cached is not None and time.time() - cached[1] < ROBOTS_TTL:
+                return cached[0]
+            rules = RobotFileParser(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+            try:
+                import requests
+                response = requests.get(rules.url, headers={"User-Agent": self.user_agent},
+                                        timeout=self.timeout, verify=self.verify)
+                if response.status_code in (401, 403):
+                    rules.disallow_all = True
+                elif response.status_code >= 400:
+                    rules.allow_all = True
+                else:
+                    lines = response.text.splitlines()
+                    rules.parse(lines)
+                    delay = _crawl_delay(lines, self.user_agent)
+                    rate = rules.request_rate(self.user_agent)
+                    if rate is not None and rate.requests:
+                        delay = max(delay or 0.0, rate.seconds / rate.requests)
+                    if delay:
+                        self._set_crawl_delay(host, delay)
+            except Exception as e:
+                print(f"Could not fetch {rules.url}: {e}; assuming everything is allowed")
+                rules.allow_all = True
+            self._robots[host] = (rules, time.time())
+        return rules
+
+    def _set_crawl_delay(self, host, delay):
+        with self._cond:
+            state = self._host(host)
+            state["max_rate"] = min(self.max_rate, 1.0 / delay)
+            state["rate"] = min(state["rate"], state["max_rate"])
+
+    def allowed(self, url):
+        """robots.txt verdict for url (fetches and caches the host's rules on first use)."""
+        return self._robots_for(url).can_fetch(self.user_agent, url)
+
+    # ------------------------------
+    # PER-HOST SPACING + CONCURRENCY
+    # ------------------------------
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                "rate": min(1.0 / self.initial_delay, self.max_rate) if self.initial_delay > 0 else self.max_rate,
+                "max_rate": self.max_rate,
+                "limit": 1,
+                "in_flight": 0,
+                "next_time": 0.0,
+                "successes": 0,
+                "latency": None
+            }
+        return state
+
+    @contextmanager
+    def slot(self, url):
+        """Block until url's host has a free slot and its spacing has elapsed."""
+        host = urlparse(url).netloc.lower()
+        with self._cond:
+            while True:
+                state = self._host(host)
+                now = time.monotonic()
+                if state["in_flight"] < state["limit"] and now >= state["next_time"]:
+                    state["in_flight"] += 1
+                    state["next_time"] = now + 1.0 / state["rate"]
+                    break
+                if state["in_flight"] < state["limit"]:
+                    self._cond.wait(state["next_time"] - now)
+                else:
+                    self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                state["in_flight"] -= 1
+                self._cond.notify_all()
+
+    def record(self, url, status, latency, retry_after=None):
+        """
+        Feed one response back: status None means the request failed. Returns
+        True when the response was a congestion signal (the host was slowed down).
+        """
+        host = urlparse(url).netloc.lower()
+        with self._cond:
+            state = self._host(host)
+            # Smoothed latency, so a single slow page does not halve the rate.
+            state["latency"] = latency if state["latency"] is None else 0.7 * state["latency"] + 0.3 * latency
+            congested = status is None or status in CONGESTION_STATUSES or state["latency"] > self.target_latency
+            if congested:
+                state["limit"] = max(1, state["limit"] // 2)
+                state["rate"] = max(1.0 / self.max_delay, state["rate"] / 2.0)
+                state["successes"] = 0
+                pause = _retry_after_seconds(retry_after)
+                if pause:
+                    state["next_time"] = max(state["next_time"], time.monotonic() + min(pause, self.max_delay))
+            elif status is not None and status < 400:
+                state["successes"] += 1
+                # One additive step per round of `limit` good responses.
+                if state["successes"] >= state["limit"]:
+                    state["successes"] = 0
+                    state["limit"] = min(self.max_concurrency, state["limit"] + 1)
+                    state["rate"] = min(state["max_rate"], state["rate"] + 1.0)
+            self._cond.notify_all()
+        return congested
+
+    def fetch(self, url, retries=2, max_bytes=None, accept_types=HTML_TYPES, **kwargs):
+        """
+        Polite requests.get: honours robots.txt (returns None when disallowed),
+        waits for the host's slot, reports the outcome and retries 429/503
+        responses up to retries times. The body is streamed (streamfetch):
+        non-HTML responses come back with .skip_reason set and no body, and
+        pages are cut at max_bytes. Pass accept_types=None for XML or text.
+        """
+        import requests
+        if not self.allowed(url):
+            print(f"Disallowed by robots.txt: {url}")
+            return None
+        headers = {"User-Agent": self.user_agent}
+        headers.update(kwargs.pop("headers", {}))
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        for attempt in range(retries + 1):
+            with self.slot(url):
+                start = time.monotonic()
+                try:
+                    response = stream_get(requests.get, url, max_bytes, accept_types, headers=headers, **kwargs)
+                except requests.exceptions.RequestException:
+                    self.record(url, None, time.monotonic() - start)
+                    raise
+                self.record(url, response.status_code, time.monotonic() - start,
+                            response.headers.get("Retry-After"))
+            if self.archive is not None and not response.skip_reason:
+                self.archive.write_response(url, response.status_code, dict(response.headers), response.content,
+                                            charset=response.encoding)
+            if response.status_code not in CONGESTION_STATUSES or attempt == retries:
+                return response
+            print(f"{response.status_code} from {urlparse(url).netloc}, backing off (attempt {attempt + 1})")
+        return response
+
+    def stats(self):
+        """Current rate (requests/s) / limit / smoothed latency per host."""
+        with self._cond:
+            return {
+                host: {"rate": round(state["rate"], 3), "limit": state["limit"], "max_rate": round(state["max_rate"], 3),
+                       "latency": state["latency"]}
+                for host, state in self._hosts.items()
+            }
@@ -1,66 +1,406 @@
 import os
+import sys
+import copy
+import json
+import time
 import pickle
+import numpy as np
+from urlindex import build_url_row_index, add_to_url_row_index, resolve_rows
+from sentembeed import content_hash, load_model, split_into_passages
+from retrieval import add_to_retrieval_index, update_retrieval_rows
+from textarena import set_row_text, take_rows, relocate_store_texts
+
+DEFAULT_STORE = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+
+# Curated corrections applied by `python rawupdate.py` with no arguments.
+CURATED_CORRECTIONS = [
+    # Leadership record (only leadership info).
+    {
+        "url": "https://www.acg-world.com/leadership",
+        "append": (
+            "ACG was founded in 1961 by brothers Ajit Singh and Jasjit Singh to manufacture empty hard capsules for Indian "
+            "pharmaceutical companies. It is important to note that our founders are only Ajit Singh and Jasjit Singh. "
+            "Karan Singh, who now serves as our Chairman, represents the next generation leading ACG forward. "
+            "For more details, please visit our official website at https://www.acg-world.com."
+        )
+    },
+    # History record (only pure history, excluding leadership details).
+    {
+        "url": "https://www.acg-world.com/#main-content",
+        "append": (
+            "ACG is a multinational pharmaceutical company with origins dating back to 1961. Over the decades, "
+            "the company has grown from a small family-run business into one of the world's largest integrated suppliers "
+            "of solid dosage products. Early on, the company focused on manufacturing empty hard capsules and gradually expanded "
+            "its operations to include equipment manufacturing, packaging, inspection, and testing. Key milestones include "
+            "the establishment of our R&D hub in Mumbai in 1971, the acquisition of a capsule shell manufacturing plant in Croatia in 2007, "
+            "and strategic expansions that have propelled us onto the global stage. For further details, please visit https://www.acg-world.com."
+        )
+    }
+]
+
+# ------------------------------
+# STORE + DELTA LOG
+# Patches are appended to <store>.delta instead of rewriting the whole
+# pickle. Every entry carries the final text and vectors of one row, so
+# replaying the log on load is cheap and idempotent; `compact` folds it back
+# into the pickle.
+# ------------------------------
+
+def delta_path(pickle_file):
+    return pickle_file + ".delta"
 
 def load_vector_database(pickle_file):
     with open(pickle_file, "rb") as f:
         vector_db = pickle.load(f)
+    relocate_store_texts(vector_db, pickle_file)
+    apply_delta_file(vector_db, pickle_file)
     return vector_db
 
 def save_vector_database(vector_db, pickle_file):
-    with open(pickle_file, "wb") as f:
+    tmp_file = pickle_file + ".tmp"
+    with open(tmp_file, "wb") as f:
         pickle.dump(vector_db, f)
+    os.replace(tmp_file, pickle_file)
+
+def append_delta(pickle_file, entries):
+    with open(delta_path(pickle_file), "ab") as f:
+        for entry in entries:
+            pickle.dump(entry, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_delta(pickle_file):
+    entries = []
+    path = delta_path(pickle_file)
+    if not os.path.exists(path):
+        return entries
+    with open(path, "rb") as f:
+        while True:
+            try:
+                entries.append(pickle.load(f))
+            except EOFError:
+                break
+            except pickle.UnpicklingError:
+                # A write interrupted half-way; everything before it is intact.
+                print(f"Ignoring truncated entry at the end of {path}")
+                break
+    return entries
+
+def apply_delta_file(vector_db, pickle_file):
+    """Replay <store>.delta onto a freshly loaded store. Returns the rows written."""
+    entries = read_delta(pickle_file)
+    if not entries:
+        return 0
+    return write_entries(vector_db, entries)
+
+def compact_store(pickle_file):
+    """Fold the delta log into the pickle and start a new, empty log."""
+    vector_db = load_vector_database(pickle_file)
+    save_vector_database(vector_db, pickle_file)
+    if os.path.exists(delta_path(pickle_file)):
+        os.remove(delta_path(pickle_file))
+    return vector_db
+
+# ------------------------------
+# URL -> ROW LOOKUP
+# ------------------------------
 
-def update_records(vector_db, target_url_substring, additional_text):
+def ensure_url_row_index(vector_db):
+    """The store's URL -> row index, extended for rows appended since it was built."""
+    metadata = vector_db["metadata"]
+    index = vector_db.get("url_row_index")
+    if index is None or index["num_rows"] > len(metadata):
+        index = vector_db["url_row_index"] = build_url_row_index(metadata)
+    elif index["num_rows"] < len(metadata):
+        add_to_url_row_index(index, [md.get("url", "") for md in metadata[index["num_rows"]:]])
+    return index
+
+def find_rows(vector_db, url):
+    """
+    Rows stored under url (ignoring case). A URL without a fragment also
+    matches its "#..." anchors, e.g. /leadership covers /leadership#ex96;
+    a URL with a fragment matches only itself.
+    """
+    index = ensure_url_row_index(vector_db)
+    rows = set(resolve_rows(index, urls=[url]))
+    if "#" not in url:
+        rows.update(resolve_rows(index, prefix=url + "#"))
+    return sorted(rows)
+
+# ------------------------------
+# PATCHING
+# ------------------------------
+
+def _row_text(vector_db, row):
+    return vector_db["metadata"][row].get("content", vector_db["corpus"][row])
+
+def _patched_text(current, patch):
     """
-    For each record in vector_db whose URL contains target_url_substring,
-    if the record's 'content' does not already include additional_text, append the additional_text.
-    Returns the number of records updated.
+    A patch replaces the text ("content") and/or appends to it ("append").
+    Appending is skipped when the text already contains it, so re-running
+    the same corrections is a no-op.
     """
-    updated_count = 0
-    for record in vector_db["metadata"]:
-        url = record.get("url", "")
-        if target_url_substring in url:
-            current_content = record.get("content", "")
-            if additional_text not in current_content:
-                record["content"] = current_content.strip() + "\n\n" + additional_text.strip()
-                updated_count += 1
-                print(f"Updated record for URL: {url}")
+    text = patch["content"].strip() if "content" in patch else current
+    if text is None:
+        return None
+    addition = (patch.get("append") or "").strip()
+    if addition and addition not in text:
+        text = text.strip() + "\n\n" + addition
+    return text
+
+def _encode_passages(vector_db, texts, model):
+    passages = vector_db["passages"]
+    chunks = [split_into_passages(text, passages["passage_words"], passages["overlap_words"]) for text in texts]
+    flat = [chunk for row_chunks in chunks for chunk in row_chunks]
+    vectors = np.zeros((0, passages["vectors"].shape[1]), dtype=np.float32)
+    if flat:
+        vectors = np.asarray(model.encode(flat, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32)
+    result = []
+    start = 0
+    for row_chunks in chunks:
+        result.append({"texts": row_chunks, "vectors": vectors[start:start + len(row_chunks)]})
+        start += len(row_chunks)
+    return result
+
+def apply_patches(vector_db, patches, model, keep=CURATED_CORRECTIONS):
+    """
+    Apply corrections keyed by URL ({"url", "content" and/or "append"}).
+    Only the touched records are re-embedded, in one batch. A URL that is not
+    in the store is inserted when the patch gives its full "content".
+    The "append" texts of the keep corrections are re-applied to the rows
+    they target, so replacing a page's text (a recrawl, the ingest worker)
+    does not drop them. Returns (delta entries, stats); persist the entries
+    with append_delta.
+    """
+    metadata = vector_db["metadata"]
+    kept_appends = {}
+    for correction in keep or []:
+        if correction.get("append"):
+            for row in find_rows(vector_db, correction["url"]):
+                kept_appends.setdefault(row, []).append(correction["append"])
+    # Row -> new text for stored records, URL -> text for new ones. Every
+    # row is patched from its own text, never from another row's.
+    pending = {}
+    stats = {"updated": 0, "inserted": 0, "unchanged": 0, "missing": 0}
+    for patch in patches:
+        rows = find_rows(vector_db, patch["url"])
+        for key in rows or [patch["url"]]:
+            current = pending.get(key)
+            if current is None and rows:
+                current = _row_text(vector_db, key)
+            text = _patched_text(current, patch)
+            if text is not None and rows:
+                for addition in kept_appends.get(key, []):
+                    text = _patched_text(text, {"append": addition})
+            label = metadata[key]["url"] if rows else key
+            if text is None:
+                print(f"No record for URL: {patch['url']} and no full content to insert. Skipping.")
+                stats["missing"] += 1
+            elif text == current:
+                print(f"Record for URL: {label} is already up to date. Skipping.")
+                stats["unchanged"] += 1
             else:
-                print(f"Record for URL: {url} is already updated. Skipping.")
-    return updated_count
+                pending[key] = text
+                stats["updated" if rows else "inserted"] += 1
 
-def main():
-    # Path to your vector database pickle file.
-    pickle_file = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+    if not pending:
+        return [], stats
+    keys = list(pending)
+    texts = [pending[key] for key in keys]
+    vectors = np.asarray(model.encode(texts, convert_to_numpy=True))
+    passages = _encode_passages(vector_db, texts, model) if "passages" in vector_db else [None] * len(texts)
+    entries = []
+    for key, text, vector, row_passages in zip(keys, texts, vectors, passages):
+        row = key if isinstance(key, int) else None
+        entries.append({"url": metadata[row]["url"] if row is not None else key, "row": row, "text": text,
+                        "content_hash": content_hash(text), "vector": vector, "passages": row_passages,
+                        "time": time.time()})
+    write_entries(vector_db, entries)
+    return entries, stats
+
+def _entry_rows(vector_db, entry):
+    """
+    The row an entry was made for. Entries carry the row and its exact URL;
+    older logs only the URL, which then names the first row stored under it.
+    """
+    metadata = vector_db["metadata"]
+    row = entry.get("row")
+    if row is not None and row < len(metadata) and metadata[row].get("url") == entry["url"]:
+        return [row]
+    return resolve_rows(ensure_url_row_index(vector_db), urls=[entry["url"]])[:1]
+
+def writable_copy(vector_db):
+    """
+    A copy of the store that write_entries can change without touching the
+    original: everything it updates in place (metadata, texts, vectors,
+    norms, BM25 postings, passages, the URL index) is copied, the rest is
+    shared. Open shards are patched this way and swapped in whole, so a
+    query running on the old store never sees a half-written one.
+    """
+    copied = dict(vector_db)
+    copied["metadata"] = [dict(md) for md in vector_db["metadata"]]
+    corpus = vector_db["corpus"]
+    copied["corpus"] = corpus.copy()
+    copied["doc_vectors"] = np.array(vector_db["doc_vectors"])
+    if "doc_norms" in vector_db:
+        copied["doc_norms"] = vector_db["doc_norms"].copy()
+    if "bm25" in vector_db:
+        copied["bm25"] = dict(vector_db["bm25"], postings=dict(vector_db["bm25"]["postings"]),
+                              doc_len=vector_db["bm25"]["doc_len"].copy())
+    if "passages" in vector_db:
+        passages = vector_db["passages"]
+        copied["passages"] = dict(passages, texts=passages["texts"].copy())
+    if vector_db.get("url_row_index") is not None:
+        copied["url_row_index"] = copy.deepcopy(vector_db["url_row_index"])
+    return copied
+
+def write_entries(vector_db, entries):
+    """
+    Write patch entries into the in-memory store: the row an entry was made
+    for is overwritten in place, unknown URLs are appended. Rows that already hold
+    the entry's text are left alone, which makes replaying a log idempotent.
+    """
+    metadata = vector_db["metadata"]
+    corpus = vector_db["corpus"]
+    doc_vectors = np.asarray(vector_db["doc_vectors"])
+    rows, old_texts, new_entries, appended = [], [], [], []
+    # A row patched more than once in the log: only its latest entry counts.
+    latest = {}
+    for entry in entries:
+        latest[(entry["url"], entry.get("row"))] = entry
+    for entry in latest.values():
+        entry_rows = _entry_rows(vector_db, entry)
+        if not entry_rows:
+            appended.append(entry)
+            continue
+        for row in entry_rows:
+            md = metadata[row]
+            if md.get("content_hash") == entry["content_hash"] and _row_text(vector_db, row) == entry["text"]:
+                continue
+            # Both spellings of the row may be in the BM25 postings.
+            old_texts.append(corpus[row] + "\n" + md.get("content", ""))
+            set_row_text(vector_db, row, entry["text"])
+            md["content_hash"] = entry["content_hash"]
+            rows.append(row)
+            new_entries.append(entry)
+
+    if rows:
+        new_vectors = np.asarray([entry["vector"] for entry in new_entries], dtype=doc_vectors.dtype)
+        doc_vectors[rows] = new_vectors
+        update_retrieval_rows(vector_db, rows, old_texts, [entry["text"] for entry in new_entries], new_vectors)
+        if "passages" in vector_db:
+            _replace_passages(vector_db, rows, [entry["passages"] for entry in new_entries])
+
+    if appended:
+        first_row = len(metadata)
+        texts = [entry["text"] for entry in appended]
+        new_vectors = np.asarray([entry["vector"] for entry in appended], dtype=doc_vectors.dtype)
+        doc_vectors = np.vstack([doc_vectors, new_vectors])
+        for entry in appended:
+            metadata.append({"url": entry["url"], "content_hash": entry["content_hash"]})
+        corpus.extend(texts)
+        add_to_retrieval_index(vector_db, texts, new_vectors)
+        if "passages" in vector_db:
+            _replace_passages(vector_db, range(first_row, first_row + len(appended)),
+                              [entry["passages"] for entry in appended])
+    vector_db["doc_vectors"] = doc_vectors
+    if appended:
+        ensure_url_row_index(vector_db)
+    return len(rows) + len(appended)
+
+def _replace_passages(vector_db, rows, row_passages):
+    passages = vector_db["passages"]
+    rows = list(rows)
+    keep = ~np.isin(passages["parent"], rows)
+    if not keep.all():
+        passages["texts"] = take_rows(passages["texts"], np.flatnonzero(keep))
+        passages["parent"] = passages["parent"][keep]
+        passages["vectors"] = passages["vectors"][keep]
+    for row, payload in zip(rows, row_passages):
+        if not payload or not payload["texts"]:
+            continue
+        passages["texts"].extend(payload["texts"])
+        passages["parent"] = np.concatenate([passages["parent"], np.full(len(payload["texts"]), row, dtype=np.int32)])
+        passages["vectors"] = np.vstack([passages["vectors"], np.asarray(payload["vectors"], dtype=np.float32)])
+
+def patch_store(pickle_file, patches, model=None):
+    """Load the store, apply patches, and append only the delta to <store>.delta."""
     vector_db = load_vector_database(pickle_file)
-    
-    # Update the leadership record (only leadership info).
-    leadership_target = "https://www.acg-world.com/leadership"
-    leadership_text = (
-        "ACG was founded in 1961 by brothers Ajit Singh and Jasjit Singh to manufacture empty hard capsules for Indian "
-        "pharmaceutical companies. It is important to note that our founders are only Ajit Singh and Jasjit Singh. "
-        "Karan Singh, who now serves as our Chairman, represents the next generation leading ACG forward. "
-        "For more details, please visit our official website at https://www.acg-world.com."
-    )
-    leadership_updates = update_records(vector_db, leadership_target, leadership_text)
-    
-    # Update the history record (only pure history, excluding leadership details).
-    history_target = "https://www.acg-world.com/#main-content"
-    history_text = (
-        "ACG is a multinational pharmaceutical company with origins dating back to 1961. Over the decades, "
-        "the company has grown from a small family-run business into one of the world's largest integrated suppliers "
-        "of solid dosage products. Early on, the company focused on manufacturing empty hard capsules and gradually expanded "
-        "its operations to include equipment manufacturing, packaging, inspection, and testing. Key milestones include "
-        "the establishment of our R&D hub in Mumbai in 1971, the acquisition of a capsule shell manufacturing plant in Croatia in 2007, "
-        "and strategic expansions that have propelled us onto the global stage. For further details, please visit https://www.acg-world.com."
-    )
-    history_updates = update_records(vector_db, history_target, history_text)
-    
-    if leadership_updates or history_updates:
-        save_vector_database(vector_db, pickle_file)
-        print(f"\nVector database updated: {leadership_updates} leadership record(s) and {history_updates} history record(s) modified.")
+    if model is None:
+        model = load_model(vector_db.get("model_name", "all-MiniLM-L6-v2"))
+    start_time = time.perf_counter()
+    entries, stats = apply_patches(vector_db, patches, model)
+    if entries:
+        append_delta(pickle_file, entries)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+    print(f"Patched: {stats['updated']} updated, {stats['inserted']} inserted, {stats['unchanged']} unchanged, "
+          f"{stats['missing']} missing ({elapsed_ms:.0f} ms, {len(entries)} delta entries)")
+    return vector_db, stats
+
+def check_patch_isolation(vector_db, patches, model):
+    """
+    Apply patches to a scratch copy of the store and compare every row with
+    the original: rows the patches do not target must be byte-identical
+    (text and vector), and an append-only patch must keep each targeted
+    row's own text. Returns the list of problems (empty when it passes).
+    """
+    scratch = copy.deepcopy(vector_db)
+    # Plain lists, so the check never writes to the store's text arena.
+    scratch["corpus"] = list(scratch["corpus"])
+    if "passages" in scratch:
+        scratch["passages"]["texts"] = list(scratch["passages"]["texts"])
+    before_texts = [_row_text(vector_db, row) for row in range(len(vector_db["metadata"]))]
+    before_vectors = np.asarray(vector_db["doc_vectors"])
+    entries, _ = apply_patches(scratch, patches, model)
+    targeted = {entry["row"]: entry for entry in entries if entry["row"] is not None}
+    after_vectors = np.asarray(scratch["doc_vectors"])
+    append_rows = {row for patch in patches if "content" not in patch for row in find_rows(vector_db, patch["url"])}
+    problems = []
+    for row, before in enumerate(before_texts):
+        after = _row_text(scratch, row)
+        if row not in targeted:
+            if after.encode("utf-8") != before.encode("utf-8") or \
+                    after_vectors[row].tobytes() != before_vectors[row].tobytes():
+                problems.append(f"row {row} ({vector_db['metadata'][row]['url']}) changed but was not patched")
+        elif row in append_rows and not after.startswith(before.strip()):
+            problems.append(f"row {row} ({vector_db['metadata'][row]['url']}) lost its own text")
+    return problems
+
+def load_patches(patch_file):
+    """A JSON list of {"url", "content" and/or "append"} objects."""
+    with open(patch_file, "r", encoding="utf-8") as f:
+        patches = json.load(f)
+    for patch in patches:
+        if "url" not in patch or not ("content" in patch or "append" in patch):
+            raise ValueError(f"Patch needs a url and content or append: {patch}")
+    return patches
+
+def main():
+    # python rawupdate.py                          apply CURATED_CORRECTIONS
+    # python rawupdate.py patch fixes.json [store] apply a batch of corrections
+    # python rawupdate.py compact [store]          fold the delta log into the store
+    # python rawupdate.py check [fixes.json] [store]  dry-run patches, verify no other row changes
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        patches = load_patches(sys.argv[2]) if len(sys.argv) > 2 else CURATED_CORRECTIONS
+        pickle_file = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_STORE
+        vector_db = load_vector_database(pickle_file)
+        problems = check_patch_isolation(vector_db, patches, load_model(vector_db.get("model_name", "all-MiniLM-L6-v2")))
+        for problem in problems:
+            print(problem)
+        print("Patch isolation check: " + ("FAIL" if problems else "OK"))
+        sys.exit(1 if problems else 0)
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        pickle_file = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE
+        compact_store(pickle_file)
+        print(f"Delta log folded into {pickle_file}")
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == "patch":
+        patches = load_patches(sys.argv[2])
+        pickle_file = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_STORE
     else:
-        print("\nNo record required updating. All records are already updated.")
+        patches = CURATED_CORRECTIONS
+        pickle_file = DEFAULT_STORE
+    patch_store(pickle_file, patches)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,354 @@
+import sys
+import math
+import time
+import sqlite3
+import signal
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+# Sitemap-driven recrawl scheduling. Every URL's sitemap <lastmod>,
+# <changefreq> and <priority>, the lastmod it had when we last fetched it,
+# how often its text actually changed and what a fetch costs are kept in
+# SQLite. Each cycle re-reads the sitemap and plans the fetches that fit in a
+# budget of fetch seconds: pages never fetched and pages whose lastmod moved
+# come first, pages whose lastmod did not move are skipped, and pages without
+# a lastmod are ranked by the estimated chance they changed since the last
+# fetch (from their change history, with changefreq as the prior) per second
+# of fetch cost. Pages whose text changed since their previous fetch go to
+# the ingest queue to be re-summarized and re-indexed; a page's first fetch
+# only records its baseline hash. `python recrawl.py daemon` runs the cycles
+# continuously.
+
+DEFAULT_STATE = r"C:\Users\surya\Desktop\webcrawling\recrawl_state.db"
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+CHANGEFREQ_SECONDS = {
+    "always": 3600,
+    "hourly": 3600,
+    "daily": 86400,
+    "weekly": 7 * 86400,
+    "monthly": 30 * 86400,
+    "yearly": 365 * 86400,
+    "never": 10 * 365 * 86400
+}
+DEFAULT_CHANGE_INTERVAL = CHANGEFREQ_SECONDS["weekly"]
+DEFAULT_FETCH_COST = 1.0     # seconds, until a page has been fetched once
+DEFAULT_BUDGET = 600.0       # fetch seconds per cycle
+DEFAULT_CYCLE = 3600         # seconds between cycles of the daemon
+MIN_CHANGE_PROBABILITY = 0.05
+
+# ------------------------------
+# SITEMAPS
+# ------------------------------
+
+def parse_lastmod(text):
+    """W3C datetime ("2024-05-01", "2024-05-01T10:00:00Z", ...) -> epoch seconds, or None."""
+    if not text:
+        return None
+    try:
+        parsed = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def parse_sitemap_entries(xml_bytes):
+    """
+    Returns (entries, child sitemaps): entries are dicts with url, lastmod
+    (epoch seconds or None), changefreq and priority; child sitemaps are the
+    <loc>s of a sitemap index.
+    """
+    root = ET.fromstring(xml_bytes)
+    if root.tag == SITEMAP_NS + "sitemapindex":
+        return [], [loc.text.strip() for loc in root.iter(SITEMAP_NS + "loc") if loc.text]
+    entries = []
+    for url_el in root.findall(SITEMAP_NS + "url"):
+        loc = url_el.findtext(SITEMAP_NS + "loc")
+        if not loc:
+            continue
+        priority = url_el.findtext(SITEMAP_NS + "priority")
+        try:
+            priority = float(priority) if priority else None
+        except ValueError:
+            priority = None
+        entries.append({
+            "url": loc.strip(),
+            "lastmod": parse_lastmod(url_el.findtext(SITEMAP_NS + "lastmod")),
+            "changefreq": (url_el.findtext(SITEMAP_NS + "changefreq") or "").strip().lower() or None,
+            "priority": priority
+        })
+    return entries, []
+
+def load_sitemap(source, scheduler=None, max_sitemaps=50):
+    """All entries of a sitemap file or URL, following sitemap indexes."""
+    pending = [source]
+    entries = []
+    seen = set()
+    while pending and len(seen) < max_sitemaps:
+        current = pending.pop(0)
+        if current in seen:
+            continue
+        seen.add(current)
+        if current.startswith("http"):
+            # Sitemaps are XML and may be up to 50 MB.
+            response = scheduler.fetch(current, max_bytes=50 * 1024 * 1024, accept_types=None) \
+                if scheduler is not None else None
+            if response is None or response.status_code != 200:
+                print(f"Could not fetch sitemap {current}")
+                continue
+            data = response.content
+        else:
+            with open(current, "rb") as f:
+                data = f.read()
+        found, children = parse_sitemap_entries(data)
+        entries.extend(found)
+        pending.extend(children)
+    return entries
+
+# ------------------------------
+# STATE
+# ------------------------------
+
+class RecrawlState:
+    """Per-URL sitemap fields, fetch history and cost, in SQLite."""
+
+    def __init__(self, path=DEFAULT_STATE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY,"
+            " site TEXT,"
+            " lastmod REAL,"              # current sitemap <lastmod>
+            " fetched_lastmod REAL,"      # <lastmod> when the page was last fetched
+            " changefreq TEXT,"
+            " priority REAL,"
+            " in_sitemap INTEGER NOT NULL DEFAULT 1,"
+            " first_fetched REAL,"
+            " last_fetched REAL,"
+            " last_status INTEGER,"
+            " content_hash TEXT,"
+            " fetches INTEGER NOT NULL DEFAULT 0,"
+            " changes INTEGER NOT NULL DEFAULT 0,"
+            " avg_cost REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_site ON pages (site)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def update_from_sitemap(self, site, entries):
+        """Record the sitemap's current fields; URLs no longer listed stop being planned."""
+        with self.conn:
+            self.conn.execute("UPDATE pages SET in_sitemap = 0 WHERE site = ?", (site,))
+            self.conn.executemany(
+                "INSERT INTO pages (url, site, lastmod, changefreq, priority, in_sitemap) VALUES (?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (url) DO UPDATE SET site = excluded.site, lastmod = excluded.lastmod, "
+                "changefreq = excluded.changefreq, priority = excluded.priority, in_sitemap = 1",
+                [(e["url"], site, e["lastmod"], e["changefreq"], e["priority"]) for e in entries]
+            )
+
+    def record_fetch(self, url, status, cost, content_hash=None):
+        """
+        Store one fetch. A 200 whose text hash differs from the previous fetch
+        counts as a change. Returns True when the page changed since its
+        previous fetch; the first fetch only records the baseline hash, since
+        the page is normally in the shard already from the initial build.
+        """
+        row = self.conn.execute("SELECT content_hash, fetches, avg_cost FROM pages WHERE url = ?", (url,)).fetchone()
+        old_hash, fetches, avg_cost = row if row else (None, 0, None)
+        counts_as_change = status == 200 and content_hash is not None and old_hash is not None \
+            and content_hash != old_hash
+        avg_cost = cost if avg_cost is None else 0.7 * avg_cost + 0.3 * cost
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE pages SET fetched_lastmod = CASE WHEN ? = 200 THEN lastmod ELSE fetched_lastmod END, "
+                "first_fetched = COALESCE(first_fetched, ?), last_fetched = ?, last_status = ?, content_hash = COALESCE(?, content_hash), "
+                "fetches = fetches + 1, changes = changes + ?, avg_cost = ? WHERE url = ?",
+                (status, now, now, status, content_hash if status == 200 else None, int(counts_as_change), avg_cost, url)
+            )
+        return counts_as_change
+
+    def pages(self, site):
+        cursor = self.conn.execute(
+            "SELECT url, lastmod, fetched_lastmod, changefreq, priority, first_fetched, last_fetched, "
+            "fetches, changes, avg_cost FROM pages WHERE site = ? AND in_sitemap = 1", (site,)
+        )
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def stats(self, site):
+        return self.conn.execute(
+            "SELECT COUNT(*), SUM(fetches > 0), SUM(changes), AVG(avg_cost) FROM pages WHERE site = ? AND in_sitemap = 1",
+            (site,)
+        ).fetchone()
+
+# ------------------------------
+# PLANNING
+# ------------------------------
+
+def change_probability(page, now):
+    """
+    Chance the page changed since its last fetch, from a Poisson change rate:
+    (changes + 1) / (observed seconds + prior interval), where the prior
+    interval comes from <changefreq>.
+    """
+    prior = CHANGEFREQ_SECONDS.get(page["changefreq"], DEFAULT_CHANGE_INTERVAL)
+    observed = (page["last_fetched"] or now) - (page["first_fetched"] or now)
+    rate = (page["changes"] + 1) / (observed + prior)
+    return 1.0 - math.exp(-rate * (now - page["last_fetched"]))
+
+def plan_recrawl(pages, budget=DEFAULT_BUDGET, now=None):
+    """
+    Choose the pages to fetch within budget fetch seconds. Returns
+    (plan, skipped): plan is a list of (url, reason, score), best first;
+    skipped counts the pages left out by reason.
+    """
+    now = now or time.time()
+    must, ranked = [], []
+    skipped = {"lastmod unchanged": 0, "unlikely changed": 0, "over budget": 0}
+    for page in pages:
+        cost = page["avg_cost"] or DEFAULT_FETCH_COST
+        weight = page["priority"] if page["priority"] is not None else 0.5
+        if not page["fetches"]:
+            must.append((page["url"], "new", weight, cost))
+        elif page["lastmod"] is not None and page["fetched_lastmod"] is not None:
+            if page["lastmod"] > page["fetched_lastmod"]:
+                must.append((page["url"], "lastmod moved", weight, cost))
+            else:
+                skipped["lastmod unchanged"] += 1
+        else:
+            probability = change_probability(page, now)
+            if probability < MIN_CHANGE_PROBABILITY:
+                skipped["unlikely changed"] += 1
+                continue
+            ranked.append((page["url"], f"p(change)={probability:.2f}", weight * probability / cost, cost))
+    # Known changes first (higher sitemap priority first), then by expected
+    # changes found per second of fetching.
+    must.sort(key=lambda item: -item[2])
+    ranked.sort(key=lambda item: -item[2])
+    plan = []
+    spent = 0.0
+    for url, reason, score, cost in must + ranked:
+        if spent + cost > budget:
+            skipped["over budget"] += 1
+            continue
+        spent += cost
+        plan.append((url, reason, score))
+    return plan, skipped
+
+# ------------------------------
+# CYCLES + DAEMON
+# ------------------------------
+
+def text_hash(text):
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def run_cycle(site, config, state, scheduler, queue=None, budget=DEFAULT_BUDGET):
+    """Refresh the sitemap, plan within budget, fetch, record, queue changed pages."""
+    from contentmaker import extract_page, clean_text
+    sitemap = config.get("sitemap")
+    if not sitemap:
+        print(f"[{site}] no sitemap registered; nothing to schedule")
+        return {}
+    entries = load_sitemap(sitemap, scheduler)
+    if entries:
+        state.update_from_sitemap(site, entries)
+    plan, skipped = plan_recrawl(state.pages(site), budget)
+    print(f"[{site}] {len(entries)} sitemap URLs; fetching {len(plan)}, skipped {skipped}")
+    changed = 0
+    for url, reason, _ in plan:
+        start = time.monotonic()
+        try:
+            response = scheduler.fetch(url)
+        except Exception as e:
+            print(f"[{site}] error fetching {url}: {e}")
+            state.record_fetch(url, None, time.monotonic() - start)
+            continue
+        if response is None:
+            state.record_fetch(url, None, time.monotonic() - start)
+            continue
+        cost = time.monotonic() - start
+        content = None
+        if response.status_code == 200 and not response.skip_reason:
+            content = clean_text(extract_page(url, response.content, response.headers, response.encoding)["content"])
+        if state.record_fetch(url, response.status_code, cost, text_hash(content) if content else None):
+            changed += 1
+            if queue is not None:
+                queue.enqueue(site, url, content)
+            print(f"[{site}] changed ({reason}): {url}")
+    print(f"[{site}] cycle done: {changed} of {len(plan)} fetched pages changed")
+    return {"planned": len(plan), "changed": changed, "skipped": skipped}
+
+def run_daemon(sites=None, cycle_seconds=DEFAULT_CYCLE, budget=DEFAULT_BUDGET, stop=None, once=False):
+    """
+    Run recrawl cycles for the given sites (default: every registered site
+    with a sitemap) until stop is set or the process is interrupted.
+    """
+    from sites import load_registry
+    from politeness import PolitenessScheduler
+    from ingestqueue import IngestQueue
+    registry = load_registry()
+    sites = sites or [site for site, config in registry["sites"].items() if config.get("sitemap")]
+    state = RecrawlState()
+    queue = IngestQueue()
+    scheduler = PolitenessScheduler(verify=False)
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        # Finish the page in hand and exit cleanly when the service manager stops us.
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.is_set():
+            cycle_start = time.monotonic()
+            for site in sites:
+                if stop.is_set():
+                    break
+                try:
+                    run_cycle(site, registry["sites"][site], state, scheduler, queue, budget)
+                except Exception as e:
+                    # One broken sitemap must not stop the other sites.
+                    print(f"[{site}] cycle failed: {e}")
+            if once:
+                break
+            stop.wait(max(cycle_seconds - (time.monotonic() - cycle_start), 0))
+    except KeyboardInterrupt:
+        print("Recrawl daemon stopped.")
+    finally:
+        state.close()
+        queue.close()
+
+def main():
+    # python recrawl.py plan <site> [budget]: show the next cycle's plan
+    # python recrawl.py daemon [cycle_seconds] [budget] [site...]
+    # python recrawl.py once [site...]: a single cycle
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "plan":
+        from sites import load_registry
+        from politeness import PolitenessScheduler
+        registry = load_registry()
+        budget = float(args[2]) if len(args) > 2 else DEFAULT_BUDGET
+        state = RecrawlState()
+        sitemap = registry["sites"][args[1]].get("sitemap")
+        if sitemap:
+            state.update_from_sitemap(args[1], load_sitemap(sitemap, PolitenessScheduler(verify=False)))
+        plan, skipped = plan_recrawl(state.pages(args[1]), budget)
+        for url, reason, score in plan:
+            print(f"{score:8.4f}  {reason:18s}  {url}")
+        print(f"{len(plan)} planned, skipped {skipped}")
+    elif args and args[0] == "daemon":
+        cycle = float(args[1]) if len(args) > 1 else DEFAULT_CYCLE
+        budget = float(args[2]) if len(args) > 2 else DEFAULT_BUDGET
+        run_daemon(args[3:] or None, cycle_seconds=cycle, budget=budget)
+    elif args and args[0] == "once":
+        run_daemon(args[1:] or None, once=True)
+    else:
+        print("Usage: python recrawl.py plan <site> [budget] | daemon [cycle_seconds] [budget] [site...] | once [site...]")
+
+if __name__ == "__main__":
+    main()
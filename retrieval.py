@@ -0,0 +1,425 @@
+import os
+import re
+import sys
+import math
+import time
+import pickle
+import numpy as np
+from metrics import span
+from textarena import relocate_store_texts
+
+# One engine over one store: the dense store from sentembeed plus a BM25
+# index over the same corpus rows. RETRIEVAL_MODE picks the strategy. Stores
+# with a passage index (sentembeed.create_passage_index) score the dense side
+# by each row's best passage and return that passage as the content;
+# RETRIEVAL_PASSAGES=0 scores with the whole-page vectors instead.
+RETRIEVAL_MODES = ("sparse", "dense", "hybrid")
+DEFAULT_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+USE_PASSAGES = os.environ.get("RETRIEVAL_PASSAGES", "1") != "0"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+_stop_words = None
+
+def bm25_tokenize(text):
+    global _stop_words
+    if _stop_words is None:
+        # sklearn is only needed for its stop word list; import it on first use.
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        _stop_words = ENGLISH_STOP_WORDS
+    return [t for t in TOKEN_PATTERN.findall((text or "").lower()) if t not in _stop_words]
+
+# ------------------------------
+# BM25 INDEX
+# ------------------------------
+
+def build_bm25_index(corpus):
+    """
+    Build a BM25 index over corpus. Postings keep raw term frequencies so that
+    documents can be appended later without rebuilding; idf and length
+    normalisation are applied at query time.
+    """
+    index = {"postings": {}, "doc_len": np.zeros(0, dtype=np.int32)}
+    return add_to_bm25_index(index, corpus)
+
+def add_to_bm25_index(index, texts):
+    """Append texts as new rows after the existing ones."""
+    start = len(index["doc_len"])
+    grouped = {}
+    doc_len = np.zeros(len(texts), dtype=np.int32)
+    for offset, text in enumerate(texts):
+        tokens = bm25_tokenize(text)
+        doc_len[offset] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            rows, tfs = grouped.setdefault(token, ([], []))
+            rows.append(start + offset)
+            tfs.append(tf)
+    postings = index["postings"]
+    for token, (rows, tfs) in grouped.items():
+        rows = np.asarray(rows, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        if token in postings:
+            old_rows, old_tfs = postings[token]
+            rows = np.concatenate([old_rows, rows])
+            tfs = np.concatenate([old_tfs, tfs])
+        postings[token] = (rows, tfs)
+    index["doc_len"] = np.concatenate([index["doc_len"], doc_len])
+    return index
+
+def update_bm25_rows(index, rows, old_texts, new_texts):
+    """
+    Re-index existing rows whose text was edited in place. old_texts must
+    cover every token the rows were indexed with; only those postings are
+    touched, so the cost depends on the edited rows, not on the corpus.
+    """
+    postings = index["postings"]
+    for row, old_text in zip(rows, old_texts):
+        for token in set(bm25_tokenize(old_text)):
+            posting = postings.get(token)
+            if posting is None:
+                continue
+            keep = posting[0] != row
+            if keep.all():
+                continue
+            if keep.any():
+                postings[token] = (posting[0][keep], posting[1][keep])
+            else:
+                del postings[token]
+    for row, text in zip(rows, new_texts):
+        tokens = bm25_tokenize(text)
+        index["doc_len"][row] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            if token in postings:
+                old_rows, old_tfs = postings[token]
+                postings[token] = (np.append(old_rows, np.int32(row)), np.append(old_tfs, np.float32(tf)))
+            else:
+                postings[token] = (np.asarray([row], dtype=np.int32), np.asarray([tf], dtype=np.float32))
+    return index
+
+def bm25_scores(index, query):
+    """Return a dense array of BM25 scores, one per row (0 for no match)."""
+    doc_len = index["doc_len"]
+    num_docs = len(doc_len)
+    scores = np.zeros(num_docs, dtype=np.float32)
+    if num_docs == 0:
+        return scores
+    avgdl = max(float(doc_len.mean()), 1.0)
+    for token in set(bm25_tokenize(query)):
+        posting = index["postings"].get(token)
+        if posting is None:
+            continue
+        rows, tfs = posting
+        df = len(rows)
+        idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_len[rows] / avgdl)
+        scores[rows] += idf * tfs * (BM25_K1 + 1.0) / (tfs + norm)
+    return scores
+
+# ------------------------------
+# STORE
+# ------------------------------
+
+def load_vector_database(pickle_file):
+    with open(pickle_file, "rb") as f:
+        return relocate_store_texts(pickle.load(f), pickle_file)
+
+def save_vector_database(vector_db, pickle_file):
+    with open(pickle_file, "wb") as f:
+        pickle.dump(vector_db, f)
+
+def _store_texts(vector_db):
+    corpus = vector_db.get("corpus")
+    if corpus is not None:
+        return corpus
+    return [md.get("content", "") for md in vector_db["metadata"]]
+
+def _row_texts(vector_db):
+    """Current text of every row: in-place edits in metadata win over the corpus."""
+    corpus = vector_db.get("corpus")
+    return [md.get("content", corpus[row] if corpus is not None else "")
+            for row, md in enumerate(vector_db["metadata"])]
+
+def ensure_retrieval_index(vector_db):
+    """
+    Add the pieces the engine needs to a sentembeed dense store in place:
+    a BM25 index over the same rows and the document vector norms.
+    """
+    if "bm25" not in vector_db:
+        vector_db["bm25"] = build_bm25_index(_row_texts(vector_db))
+    doc_vectors = vector_db["doc_vectors"]
+    if len(vector_db.get("doc_norms", ())) != len(doc_vectors):
+        norms = np.linalg.norm(np.asarray(doc_vectors, dtype=np.float32), axis=1)
+        norms[norms == 0] = 1.0
+        vector_db["doc_norms"] = norms
+    return vector_db
+
+def add_to_retrieval_index(vector_db, texts, new_vectors):
+    """Keep BM25 postings and norms in step with rows appended to the store."""
+    if "bm25" in vector_db:
+        add_to_bm25_index(vector_db["bm25"], texts)
+    if "doc_norms" in vector_db:
+        norms = np.linalg.norm(np.asarray(new_vectors, dtype=np.float32), axis=1)
+        norms[norms == 0] = 1.0
+        vector_db["doc_norms"] = np.concatenate([vector_db["doc_norms"], norms])
+    return vector_db
+
+def update_retrieval_rows(vector_db, rows, old_texts, new_texts, new_vectors):
+    """Keep BM25 postings and norms in step with rows re-embedded in place."""
+    if "bm25" in vector_db:
+        update_bm25_rows(vector_db["bm25"], rows, old_texts, new_texts)
+    if "doc_norms" in vector_db:
+        norms = np.linalg.norm(np.asarray(new_vectors, dtype=np.float32), axis=1)
+        norms[norms == 0] = 1.0
+        vector_db["doc_norms"][rows] = norms
+    return vector_db
+
+def _dense_scores(vector_db, query_vec, rows=None):
+    doc_vectors = vector_db["doc_vectors"]
+    norms = vector_db["doc_norms"]
+    if rows is not None:
+        doc_vectors = doc_vectors[rows]
+        norms = norms[rows]
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    q_norm = np.linalg.norm(q) or 1.0
+    return (doc_vectors @ q) / (norms * q_norm)
+
+def _passage_scores(vector_db, query_vec):
+    """
+    Dense scores from the passage index: each row scores its best passage,
+    rows without passages -inf. Also returns passage_of(row), the text of
+    that best passage (None without passages).
+    """
+    passages = vector_db["passages"]
+    parents = passages["parent"]
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    q = q / (np.linalg.norm(q) or 1.0)
+    # Passage vectors are stored normalized.
+    similarities = passages["vectors"] @ q
+    scores = np.full(len(vector_db["metadata"]), -np.inf, dtype=np.float32)
+    np.maximum.at(scores, parents, similarities)
+
+    def passage_of(row):
+        own = np.flatnonzero(parents == row)
+        if len(own) == 0:
+            return None
+        return passages["texts"][int(own[np.argmax(similarities[own])])]
+
+    return scores, passage_of
+
+def _top(scores, top_n):
+    if len(scores) <= top_n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, top_n)[:top_n]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+def _ranks(scores):
+    """1-based rank of every position in scores (best score -> rank 1)."""
+    order = np.argsort(-scores, kind="stable")
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[order] = np.arange(1, len(scores) + 1)
+    return ranks
+
+# ------------------------------
+# SEARCH
+# ------------------------------
+
+def search(query, model, vector_db, mode=None, threshold=0.5, top_n=5, num_candidates=100, passages=None):
+    """
+    Retrieve the top_n rows for query.
+
+    mode "sparse" ranks by BM25 only and never encodes the query. "dense" is
+    the brute-force cosine search over every vector. "hybrid" runs the same
+    dense scan, takes the num_candidates best dense rows together with the
+    num_candidates best BM25 rows and fuses both rankings with reciprocal
+    rank fusion; the best dense row is always among the results.
+
+    passages (default USE_PASSAGES) scores the dense side by each row's best
+    passage when the store has a passage index; the results then carry that
+    passage as their content.
+
+    Returns (results, best_score): results is None when nothing clears the
+    threshold. Dense and hybrid compare the best cosine similarity against
+    threshold; sparse treats any BM25 match as a hit.
+    """
+    mode = mode or DEFAULT_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+    ensure_retrieval_index(vector_db)
+    metadata = vector_db["metadata"]
+    texts = _store_texts(vector_db)
+
+    if mode == "sparse":
+        with span("similarity_search", mode=mode):
+            scores = bm25_scores(vector_db["bm25"], query)
+        best = float(scores.max()) if len(scores) else 0.0
+        if best <= 0.0:
+            return None, best
+        rows = [int(r) for r in _top(scores, top_n) if scores[r] > 0]
+        return [_result(metadata, texts, r, float(scores[r]), bm25=float(scores[r])) for r in rows], best
+
+    with span("encode"):
+        query_vec = model.encode([query])[0]
+    use_passages = "passages" in vector_db and (USE_PASSAGES if passages is None else passages)
+    with span("similarity_search", mode="passages" if use_passages else "dense"):
+        if use_passages:
+            dense, passage_of = _passage_scores(vector_db, query_vec)
+        else:
+            dense, passage_of = _dense_scores(vector_db, query_vec), None
+    # The miss decision is made on every row, so a paraphrase sharing no
+    # terms with its page still counts as a hit in hybrid mode.
+    best = float(dense.max()) if len(dense) else 0.0
+    if best < threshold:
+        return None, best
+    dense_rows = np.asarray([r for r in _top(dense, num_candidates if mode == "hybrid" else top_n)
+                             if np.isfinite(dense[r])], dtype=np.int64)
+    if mode == "dense":
+        return [_result(metadata, texts, int(r), float(dense[r]), passage_of) for r in dense_rows], best
+
+    with span("sparse_candidates"):
+        sparse = bm25_scores(vector_db["bm25"], query)
+        matched = np.flatnonzero(sparse > 0)
+        sparse_rows = matched[_top(sparse[matched], num_candidates)]
+    # The best dense rows join the BM25 candidates; rows BM25 did not match
+    # get no sparse share of the fused score.
+    candidates = np.union1d(sparse_rows, dense_rows).astype(np.int64)
+    matched_sparse = sparse[candidates] > 0
+    sparse_ranks = _ranks(np.where(matched_sparse, sparse[candidates], -1.0))
+    sparse_share = np.where(matched_sparse, 1.0 / (RRF_K + sparse_ranks), 0.0)
+    fused = sparse_share + 1.0 / (RRF_K + _ranks(dense[candidates]))
+    # The best dense row is what made this a hit: it keeps a place even when
+    # BM25-matched rows outrank it in the fusion.
+    picked = list(_top(fused, top_n))
+    best_pos = int(np.flatnonzero(candidates == dense_rows[0])[0])
+    if best_pos not in picked:
+        picked[-1] = best_pos
+    results = []
+    for pos in picked:
+        row = int(candidates[pos])
+        results.append(_result(metadata, texts, row, float(dense[row]), passage_of,
+                               bm25=float(sparse[row]), fused=float(fused[pos])))
+    return results, best
+
+def _result(metadata, texts, row, similarity, passage_of=None, **scores):
+    passage = passage_of(row) if passage_of is not None else None
+    result = {
+        "row": row,
+        "url": metadata[row]["url"],
+        "content": passage if passage is not None else metadata[row].get("content", texts[row]),
+        "similarity": similarity
+    }
+    result.update(scores)
+    return result
+
+# ------------------------------
+# LATENCY REPORT
+# ------------------------------
+
+def benchmark_modes(queries, model, vector_db, modes=RETRIEVAL_MODES, top_n=5, repeats=3):
+    """
+    Time search() for every mode over queries and return
+    {mode: {"mean_ms", "p50_ms", "p95_ms", "hit_rate"}}.
+    """
+    ensure_retrieval_index(vector_db)
+    report = {}
+    for mode in modes:
+        timings = []
+        hits = 0
+        for _ in range(repeats):
+            for query in queries:
+                start = time.perf_counter()
+                results, _ = search(query, model, vector_db, mode=mode, top_n=top_n)
+                timings.append((time.perf_counter() - start) * 1000.0)
+                hits += results is not None
+        timings = np.asarray(timings)
+        report[mode] = {
+            "mean_ms": float(timings.mean()),
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p95_ms": float(np.percentile(timings, 95)),
+            "hit_rate": hits / max(len(timings), 1)
+        }
+    return report
+
+class _RowEncoder:
+    """Encodes every query as one stored row's vector."""
+
+    def __init__(self, vector):
+        self.vector = np.asarray(vector, dtype=np.float32)
+
+    def encode(self, sentences, **kwargs):
+        return np.tile(self.vector, (len(sentences), 1))
+
+def check_hybrid_recall(vector_db, samples=20, top_n=5):
+    """
+    Regression check for hybrid misses: for sampled rows, query with a term
+    that other rows contain but the row does not, encoded as the row's own
+    vector (a paraphrase sharing no words with its page). Hybrid search must
+    return the row. Returns the list of problems (empty when it passes).
+    """
+    ensure_retrieval_index(vector_db)
+    postings = vector_db["bm25"]["postings"]
+    texts = _row_texts(vector_db)
+    problems = []
+    step = max(len(texts) // samples, 1)
+    for row in range(0, len(texts), step)[:samples]:
+        own_terms = set(bm25_tokenize(texts[row]))
+        term = next((t for t in postings if t not in own_terms), None)
+        if term is None:
+            continue
+        model = _RowEncoder(vector_db["doc_vectors"][row])
+        results, best = search(term, model, vector_db, mode="hybrid", threshold=0.5, top_n=top_n, passages=False)
+        if results is None or row not in [r["row"] for r in results]:
+            problems.append(f"row {row} ({vector_db['metadata'][row]['url']}) missed for {term!r} (best {best:.3f})")
+    return problems
+
+def sample_queries(vector_db, limit=50):
+    """Cheap benchmark queries: the words of each URL path."""
+    queries = []
+    for md in vector_db["metadata"]:
+        words = [w for w in re.split(r"[/\-_#?=.]+", md["url"].split("://")[-1].split("/", 1)[-1]) if w.isalpha()]
+        if words:
+            queries.append(" ".join(words))
+        if len(queries) >= limit:
+            break
+    return queries
+
+def main():
+    # python retrieval.py [store.pkl]          add the BM25 index and time every mode
+    # python retrieval.py check [store.pkl]    hybrid recall check for no-overlap paraphrases
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        pickle_file = sys.argv[2] if len(sys.argv) > 2 else r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+        problems = check_hybrid_recall(load_vector_database(pickle_file))
+        for problem in problems:
+            print(problem)
+        print("Hybrid recall check: " + ("FAIL" if problems else "PASS"))
+        sys.exit(1 if problems else 0)
+
+    from sentence_transformers import SentenceTransformer
+
+    pickle_file = sys.argv[1] if len(sys.argv) > 1 else r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+    vector_db = load_vector_database(pickle_file)
+    had_index = "bm25" in vector_db
+    ensure_retrieval_index(vector_db)
+    if not had_index:
+        save_vector_database(vector_db, pickle_file)
+        print(f"Added BM25 index to {pickle_file}")
+
+    model = SentenceTransformer(vector_db.get("model_name", "all-MiniLM-L6-v2"))
+    queries = sample_queries(vector_db)
+    print(f"Benchmarking {len(queries)} queries over {len(vector_db['metadata'])} records")
+    report = benchmark_modes(queries, model, vector_db)
+    for mode, stats in report.items():
+        print(f"{mode:>7}: mean {stats['mean_ms']:.2f} ms | p50 {stats['p50_ms']:.2f} ms | "
+              f"p95 {stats['p95_ms']:.2f} ms | hit rate {stats['hit_rate']:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,11 @@ import requests
 import xml.etree.ElementTree as ET
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
+import sys
 import time
+from politeness import PolitenessScheduler
+from frontier import CrawlFrontier, reset_frontier
+from streamfetch import page_text, fetch_report
 
 # Suppress SSL warnings about certificate verification
 warnings.filterwarnings("ignore", message="Unverified HTTPS request")
@@ -18,35 +22,52 @@ def parse_sitemap(file_path):
             urls.add(loc.text.strip())
     return list(urls)
 
-# Function to crawl only acg-world.com pages
-def crawl(seed_urls, max_links=1000):
-    domain_filter = "acg-world.com"
-    discovered = set(url for url in seed_urls if domain_filter in url)
-    queue = [url for url in seed_urls if domain_filter in url]
+# Function to crawl only the pages of one site (acg-world.com unless told otherwise)
+def crawl(seed_urls, max_links=1000, frontier_file="scrap_frontier.db", domain_filter="acg-world.com", fresh=False):
+    # robots.txt, Crawl-delay and adaptive spacing instead of a fixed 1 s sleep.
+    scheduler = PolitenessScheduler(verify=False)
     
-    while queue and len(discovered) < max_links:
-        current_url = queue.pop(0)
-        print(f"Crawling: {current_url} (Total discovered: {len(discovered)})")
-        try:
-            response = requests.get(current_url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10, verify=False)
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, "html.parser")
-                for a in soup.find_all("a", href=True):
-                    href = a.get("href")
-                    absolute_url = urljoin(current_url, href)
-                    parsed = urlparse(absolute_url)
-                    # Only allow URLs that contain 'acg-world.com'
-                    if parsed.scheme in ["http", "https"] and domain_filter in parsed.netloc:
-                        if absolute_url not in discovered:
-                            queue.append(absolute_url)
-                            discovered.add(absolute_url)
-                            print(f"New website found: {absolute_url}")
-            else:
-                print(f"Status code {response.status_code} for {current_url}")
-        except Exception as e:
-            print(f"Error crawling {current_url}: {e}")
-        time.sleep(1)  # Delay to avoid overloading the server
-    return discovered
+    # Queue and seen-set live in SQLite: rerun after an interruption to resume.
+    # A finished frontier has nothing left to crawl, so fresh=True starts over.
+    if fresh:
+        reset_frontier(frontier_file)
+    with CrawlFrontier(frontier_file) as frontier:
+        frontier.add_seeds(url for url in seed_urls if domain_filter in url)
+        while len(frontier) < max_links:
+            item = frontier.pop()
+            if item is None:
+                break
+            current_url, depth = item
+            print(f"Crawling: {current_url} (Total discovered: {len(frontier)})")
+            links = []
+            try:
+                response = scheduler.fetch(current_url)
+                if response is None:
+                    frontier.fail(current_url, "disallowed by robots.txt")
+                    continue
+                if response.skip_reason:
+                    # PDFs, images, oversized files: headers only, no body downloaded.
+                    print(f"Skipped {current_url} ({response.skip_reason})")
+                elif response.status_code == 200:
+                    soup = BeautifulSoup(page_text(response), "html.parser")
+                    for a in soup.find_all("a", href=True):
+                        href = a.get("href")
+                        absolute_url = urljoin(current_url, href)
+                        parsed = urlparse(absolute_url)
+                        # Only allow URLs on the site's domain
+                        if parsed.scheme in ["http", "https"] and domain_filter in parsed.netloc:
+                            if absolute_url not in frontier and absolute_url not in links:
+                                links.append(absolute_url)
+                                print(f"New website found: {absolute_url}")
+                else:
+                    print(f"Status code {response.status_code} for {current_url}")
+            except Exception as e:
+                print(f"Error crawling {current_url}: {e}")
+                frontier.fail(current_url, e)
+                continue
+            frontier.complete(current_url, links[:max(max_links - len(frontier), 0)], depth)
+        print(f"Streaming fetch: {fetch_report()}")
+        return set(frontier.urls())
 
 # Function to save discovered URLs to an XML sitemap file
 def save_sitemap(urls, output_file="expanded_sitemap.xml"):
@@ -60,12 +81,16 @@ def save_sitemap(urls, output_file="expanded_sitemap.xml"):
     print(f"Saved {len(urls)} URLs to {output_file}")
 
 if __name__ == "__main__":
+    # Usage:
+    #   python scrap.py            -> resume (or start) the crawl
+    #   python scrap.py --fresh    -> forget the previous crawl and start over
+    fresh = "--fresh" in sys.argv[1:]
     sitemap_file = r"C:\Users\surya\Downloads\sitemap.xml"  # Make sure your sitemap.xml is in the same folder or provide full path
     seed_urls = parse_sitemap(sitemap_file)
     print("Seed URLs from sitemap:", seed_urls)
     
     # Crawl only URLs under acg-world.com up to 1000 links
-    discovered_urls = crawl(seed_urls, max_links=1000)
+    discovered_urls = crawl(seed_urls, max_links=1000, fresh=fresh)
     
     # Save the filtered URLs into an XML sitemap
     save_sitemap(discovered_urls, output_file="expanded_sitemap.xml")
@@ -1,9 +1,19 @@
 import os
+import sys
 import json
+import time
 import pickle
+import hashlib
+import multiprocessing
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from tqdm import tqdm  # for progress reporting
+from metrics import span
+from textarena import take_rows, pack_store_texts, relocate_store_texts
+
+def load_model(model_name, **kwargs):
+    # Imported on first use: sentence_transformers pulls in torch, which
+    # dominates the start-up time of every script that imports this module.
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, **kwargs)
 
 def load_json(json_file):
     with open(json_file, "r", encoding="utf-8") as f:
@@ -13,7 +23,11 @@ def save_vector_database(vector_db, output_file):
     with open(output_file, "wb") as f:
         pickle.dump(vector_db, f)
 
-def create_vector_database(json_file, model_name="all-mpnet-base-v2"):
+def content_hash(text):
+    """Stable fingerprint of a record's text, stored per row to detect changes."""
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+def create_vector_database(json_file, model_name="all-mpnet-base-v2", model=None):
     # Load the final JSON file
     data = load_json(json_file)
     print(f"Loaded {len(data)} records from {json_file}")
@@ -23,14 +37,18 @@ def create_vector_database(json_file, model_name="all-mpnet-base-v2"):
     metadata = []
     for record in data:
         corpus.append(record.get("content", ""))
+        # source_hash: text last taken from the JSON; content_hash: text the vector was computed from.
         metadata.append({
-            "url": record.get("url", "No URL")
+            "url": record.get("url", "No URL"),
+            "source_hash": content_hash(corpus[-1]),
+            "content_hash": content_hash(corpus[-1])
         })
     
-    # Load the embedding model and report time/memory if needed.
-    print(f"Loading embedding model: {model_name} ...")
-    model = SentenceTransformer(model_name)
-    print("Model loaded successfully.")
+    # Load the embedding model (unless the caller already has it) and report time/memory if needed.
+    if model is None:
+        print(f"Loading embedding model: {model_name} ...")
+        model = load_model(model_name)
+        print("Model loaded successfully.")
     
     # Generate embeddings with a progress bar.
     print("Generating embeddings for the corpus...")
@@ -49,11 +67,429 @@ def create_vector_database(json_file, model_name="all-mpnet-base-v2"):
     }
     return vector_db
 
+def split_into_passages(text, passage_words=120, overlap_words=30):
+    """
+    Split text into overlapping passages of about passage_words words.
+    Consecutive passages share overlap_words words so that a sentence cut at
+    a boundary still appears whole in one of them.
+    """
+    words = text.split()
+    if len(words) <= passage_words:
+        return [" ".join(words)] if words else []
+    step = max(passage_words - overlap_words, 1)
+    passages = []
+    for start in range(0, len(words), step):
+        passages.append(" ".join(words[start:start + passage_words]))
+        if start + passage_words >= len(words):
+            break
+    return passages
+
+def _chunk_records(texts, rows, passage_words, overlap_words):
+    passage_texts = []
+    parents = []
+    for row, text in zip(rows, texts):
+        for passage in split_into_passages(text, passage_words, overlap_words):
+            passage_texts.append(passage)
+            parents.append(row)
+    return passage_texts, parents
+
+def create_passage_index(vector_db, model, passage_words=120, overlap_words=30, batch_size=64):
+    """
+    Chunk every record of vector_db into overlapping passages, embed them in
+    bulk and store them under vector_db["passages"]. Each passage keeps the
+    row of its parent record, which maps it back to the page URL.
+    """
+    texts = [md.get("content", vector_db["corpus"][i]) for i, md in enumerate(vector_db["metadata"])]
+    passage_texts, parents = _chunk_records(texts, range(len(texts)), passage_words, overlap_words)
+    print(f"Embedding {len(passage_texts)} passages from {len(texts)} records...")
+    vectors = model.encode(passage_texts, batch_size=batch_size, show_progress_bar=True,
+                           convert_to_numpy=True, normalize_embeddings=True)
+    vector_db["passages"] = {
+        "texts": passage_texts,
+        "parent": np.asarray(parents, dtype=np.int32),
+        "vectors": np.asarray(vectors, dtype=np.float32),
+        "passage_words": passage_words,
+        "overlap_words": overlap_words
+    }
+    return vector_db
+
+def add_passages(vector_db, texts, first_row, model, rows=None):
+    """Chunk and embed records appended at first_row onwards (or at the given rows)."""
+    passages = vector_db["passages"]
+    if rows is None:
+        rows = range(first_row, first_row + len(texts))
+    passage_texts, parents = _chunk_records(texts, rows, passages["passage_words"], passages["overlap_words"])
+    if not passage_texts:
+        return vector_db
+    vectors = model.encode(passage_texts, convert_to_numpy=True, normalize_embeddings=True)
+    passages["texts"].extend(passage_texts)
+    passages["parent"] = np.concatenate([passages["parent"], np.asarray(parents, dtype=np.int32)])
+    passages["vectors"] = np.vstack([passages["vectors"], np.asarray(vectors, dtype=np.float32)])
+    return vector_db
+
+def query_passages(query, model, vector_db, threshold=0.5, top_n=5):
+    """
+    Return the best passage of each of the top_n pages for query, plus the best
+    similarity, in the same (results, max_sim) shape as retrieval.search.
+    Results are None when the best passage is below threshold.
+    """
+    passages = vector_db["passages"]
+    with span("encode"):
+        query_vec = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)[0]
+    with span("similarity_search", mode="passages"):
+        similarities = passages["vectors"] @ query_vec
+    if len(similarities) == 0:
+        return None, 0.0
+    max_sim = float(similarities.max())
+    if max_sim < threshold:
+        return None, max_sim
+    results = []
+    seen_rows = set()
+    for idx in np.argsort(-similarities, kind="stable"):
+        row = int(passages["parent"][idx])
+        if row in seen_rows:
+            continue
+        seen_rows.add(row)
+        results.append({
+            "row": row,
+            "url": vector_db["metadata"][row]["url"],
+            "content": passages["texts"][idx],
+            "similarity": float(similarities[idx])
+        })
+        if len(results) >= top_n:
+            break
+    return results, max_sim
+
+# ------------------------------
+# BULK BUILD (multi-process, length-bucketed, resumable)
+# ------------------------------
+
+_worker_model = None
+
+def _init_bulk_worker(model_name, threads_per_worker):
+    """Load the model once per worker process."""
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    _worker_model = load_model(model_name, device="cpu")
+
+def _save_shard(path, vectors):
+    # Write to a temp file first so a killed worker never leaves a half shard.
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+def _encode_shard(task):
+    shard_id, texts, rows, shard_path, passage_path, batch_size, passage_params = task
+    if not os.path.exists(shard_path):
+        _save_shard(shard_path, _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True))
+    if passage_params is not None and not os.path.exists(passage_path):
+        passage_texts, _ = _chunk_records(texts, rows, *passage_params)
+        vectors = _worker_model.encode(passage_texts, batch_size=batch_size, convert_to_numpy=True,
+                                       normalize_embeddings=True) if passage_texts else np.zeros((0, 0))
+        _save_shard(passage_path, vectors)
+    return shard_id, len(texts)
+
+def _corpus_fingerprint(corpus, model_name, shard_size):
+    digest = hashlib.sha1(f"{model_name}|{shard_size}|{len(corpus)}".encode("utf-8"))
+    for text in corpus:
+        digest.update(hashlib.sha1(text.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+def bulk_create_vector_database(json_file, shard_dir, model_name="all-mpnet-base-v2",
+                                processes=None, shard_size=256, batch_size=32,
+                                passages=True, passage_words=120, overlap_words=30):
+    """
+    Build the same vector_db as create_vector_database, but:
+    - texts are sorted by length (word count as a proxy for token count) so
+      each batch holds similar lengths and wastes little padding;
+    - consecutive length-sorted slices (shards) are encoded by a pool of CPU
+      processes, each with the model loaded once;
+    - every finished shard is saved to shard_dir, so rerunning after a crash
+      only encodes the shards that are missing;
+    - with passages, the same workers chunk and embed each shard's passages
+      (saved next to the shard) and the store gets the passage index
+      create_passage_index would build.
+    Reports docs/sec for the shards encoded in this run.
+    """
+    data = load_json(json_file)
+    corpus = [record.get("content", "") for record in data]
+    metadata = [
+        {"url": record.get("url", "No URL"), "source_hash": content_hash(text), "content_hash": content_hash(text)}
+        for record, text in zip(data, corpus)
+    ]
+    print(f"Loaded {len(data)} records from {json_file}")
+
+    os.makedirs(shard_dir, exist_ok=True)
+    fingerprint = _corpus_fingerprint(corpus, model_name, shard_size)
+    manifest_path = os.path.join(shard_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("fingerprint") != fingerprint:
+            # Input, model or shard size changed: old shards don't line up any more.
+            print("Corpus or model changed since the last run; discarding old shards.")
+            for name in os.listdir(shard_dir):
+                if name.startswith("shard_"):
+                    os.remove(os.path.join(shard_dir, name))
+        elif manifest.get("passage_params") != [passage_words, overlap_words]:
+            # Only the chunking changed: the page vectors are still good.
+            for name in os.listdir(shard_dir):
+                if name.startswith("shard_") and name.endswith(".passages.npy"):
+                    os.remove(os.path.join(shard_dir, name))
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "model_name": model_name, "shard_size": shard_size,
+                   "passage_params": [passage_words, overlap_words]}, f)
+
+    order = sorted(range(len(corpus)), key=lambda i: len(corpus[i].split()))
+    shards = [order[start:start + shard_size] for start in range(0, len(order), shard_size)]
+    shard_paths = [os.path.join(shard_dir, f"shard_{i:05d}.npy") for i in range(len(shards))]
+    passage_paths = [os.path.join(shard_dir, f"shard_{i:05d}.passages.npy") for i in range(len(shards))]
+    passage_params = (passage_words, overlap_words) if passages else None
+    pending = [
+        (i, [corpus[j] for j in rows], rows, shard_paths[i], passage_paths[i], batch_size, passage_params)
+        for i, rows in enumerate(shards)
+        if not os.path.exists(shard_paths[i]) or (passages and not os.path.exists(passage_paths[i]))
+    ]
+    print(f"{len(shards) - len(pending)}/{len(shards)} shards already done, {len(pending)} to encode.")
+
+    processes = processes or max(1, (os.cpu_count() or 1) // 2)
+    threads_per_worker = max(1, (os.cpu_count() or 1) // processes)
+    encoded = 0
+    start_time = time.perf_counter()
+    if pending:
+        with multiprocessing.Pool(processes, initializer=_init_bulk_worker,
+                                  initargs=(model_name, threads_per_worker)) as pool:
+            from tqdm import tqdm  # for progress reporting
+            with tqdm(total=sum(len(task[1]) for task in pending), unit="doc") as progress:
+                for shard_id, count in pool.imap_unordered(_encode_shard, pending):
+                    encoded += count
+                    progress.update(count)
+    elapsed = time.perf_counter() - start_time
+    if encoded:
+        print(f"Encoded {encoded} docs in {elapsed:.1f}s ({encoded / elapsed:.1f} docs/sec, {processes} processes)")
+
+    doc_vectors = None
+    for rows, shard_path in zip(shards, shard_paths):
+        vectors = np.load(shard_path)
+        if doc_vectors is None:
+            doc_vectors = np.zeros((len(corpus), vectors.shape[1]), dtype=np.float32)
+        doc_vectors[rows] = vectors
+    if doc_vectors is None:
+        doc_vectors = np.zeros((0, 0), dtype=np.float32)
+    print(f"Embeddings assembled. Shape: {doc_vectors.shape}")
+
+    vector_db = {
+        "model_name": model_name,
+        "doc_vectors": doc_vectors,
+        "metadata": metadata,
+        "corpus": corpus
+    }
+    if passages:
+        # Re-chunking is cheap and gives the same passages the workers embedded.
+        passage_texts = []
+        parents = []
+        vectors = []
+        for rows, passage_path in zip(shards, passage_paths):
+            texts, shard_parents = _chunk_records([corpus[j] for j in rows], rows, passage_words, overlap_words)
+            if texts:
+                passage_texts.extend(texts)
+                parents.extend(shard_parents)
+                vectors.append(np.load(passage_path))
+        vector_db["passages"] = {
+            "texts": passage_texts,
+            "parent": np.asarray(parents, dtype=np.int32),
+            "vectors": (np.vstack(vectors).astype(np.float32) if vectors
+                        else np.zeros((0, doc_vectors.shape[1]), dtype=np.float32)),
+            "passage_words": passage_words,
+            "overlap_words": overlap_words
+        }
+        print(f"Passage index assembled: {len(passage_texts)} passages")
+    return vector_db
+
+# ------------------------------
+# INCREMENTAL SYNC (content-hash keyed)
+# ------------------------------
+
+def _row_text(vector_db, row):
+    return vector_db["metadata"][row].get("content", vector_db["corpus"][row])
+
+def sync_vector_database(vector_db, records, model):
+    """
+    Bring vector_db in line with records (the summarized JSON) without
+    re-encoding unchanged rows:
+    - rows that came from records (they carry a source_hash) and whose URL
+      is gone from them are dropped;
+    - rows whose source text changed take the new text and are re-encoded;
+    - rows edited in place since they were embedded (e.g. by rawupdate) are
+      re-encoded, keeping the edit;
+    - URLs not in the store are appended and encoded.
+    Rows added at query time by the ingest worker are kept: rows with
+    no source_hash whose URL is not in records. Stores from before hashing
+    have their content_hash backfilled from the embedded (corpus) text.
+    Returns counts of added, changed, stale, deleted, unchanged and
+    backfilled rows.
+    """
+    metadata = vector_db["metadata"]
+    corpus = vector_db["corpus"]
+    source = {}
+    for record in records:
+        source.setdefault(record.get("url", "No URL"), record.get("content", ""))
+
+    keep_rows = []
+    reencode_rows = []
+    stats = {"added": 0, "changed": 0, "stale": 0, "deleted": 0, "unchanged": 0, "backfilled": 0}
+    seen_urls = set()
+    for row, md in enumerate(metadata):
+        url = md["url"]
+        if "content_hash" not in md or ("source_hash" not in md and url in source):
+            # Stores from before hashing: corpus still holds the text that was
+            # embedded (from the JSON, or from the fallback for query-time
+            # rows); in-place edits only touched metadata.
+            md.setdefault("content_hash", content_hash(corpus[row]))
+            if url in source:
+                md.setdefault("source_hash", content_hash(corpus[row]))
+            stats["backfilled"] += 1
+        if "source_hash" not in md and url not in source:
+            # Added at query time (Google fallback), not from the JSON: keep it,
+            # only re-encode if it was edited since.
+            keep_rows.append(row)
+            if md["content_hash"] != content_hash(_row_text(vector_db, row)):
+                reencode_rows.append(row)
+                stats["stale"] += 1
+            else:
+                stats["unchanged"] += 1
+            continue
+        if url not in source or url in seen_urls:
+            stats["deleted"] += 1
+            continue
+        seen_urls.add(url)
+        keep_rows.append(row)
+        source_hash = content_hash(source[url])
+        if md["source_hash"] != source_hash:
+            corpus[row] = source[url]
+            if "content" in md:
+                md["content"] = source[url]
+            md["source_hash"] = source_hash
+            reencode_rows.append(row)
+            stats["changed"] += 1
+        elif md["content_hash"] != content_hash(_row_text(vector_db, row)):
+            reencode_rows.append(row)
+            stats["stale"] += 1
+        else:
+            stats["unchanged"] += 1
+
+    new_urls = [url for url in source if url not in seen_urls]
+    stats["added"] = len(new_urls)
+    if stats["deleted"] == 0 and not reencode_rows and not new_urls:
+        return stats
+
+    # Reorder: surviving rows keep their relative order, new URLs go at the end.
+    row_map = {old: new for new, old in enumerate(keep_rows)}
+    doc_vectors = np.asarray(vector_db["doc_vectors"])[keep_rows]
+    vector_db["metadata"] = [metadata[row] for row in keep_rows]
+    vector_db["corpus"] = take_rows(corpus, keep_rows)
+    for url in new_urls:
+        vector_db["metadata"].append({"url": url, "source_hash": content_hash(source[url])})
+        vector_db["corpus"].append(source[url])
+
+    target_rows = [row_map[row] for row in reencode_rows] + list(range(len(keep_rows), len(vector_db["corpus"])))
+    target_texts = [_row_text(vector_db, row) for row in target_rows]
+    if target_rows:
+        print(f"Re-encoding {len(target_rows)} of {len(vector_db['corpus'])} rows...")
+        new_vectors = np.asarray(model.encode(target_texts, convert_to_numpy=True), dtype=doc_vectors.dtype)
+        if len(doc_vectors) == 0:
+            doc_vectors = np.zeros((0, new_vectors.shape[1]), dtype=new_vectors.dtype)
+        doc_vectors = np.vstack([doc_vectors, np.zeros((len(new_urls), doc_vectors.shape[1]), dtype=doc_vectors.dtype)])
+        doc_vectors[target_rows] = new_vectors
+        for row, text in zip(target_rows, target_texts):
+            vector_db["metadata"][row]["content_hash"] = content_hash(text)
+    vector_db["doc_vectors"] = doc_vectors
+    # Rows moved: the URL -> row lookup is rebuilt on next use.
+    vector_db.pop("url_row_index", None)
+
+    if "passages" in vector_db:
+        passages = vector_db["passages"]
+        redo = set(target_rows)
+        keep = [
+            i for i, parent in enumerate(passages["parent"])
+            if int(parent) in row_map and row_map[int(parent)] not in redo
+        ]
+        passages["texts"] = take_rows(passages["texts"], keep)
+        passages["parent"] = np.asarray([row_map[int(passages["parent"][i])] for i in keep], dtype=np.int32)
+        passages["vectors"] = passages["vectors"][keep]
+        add_passages(vector_db, target_texts, 0, model, rows=target_rows)
+
+    # Sparse postings and norms are cheap to rebuild from the new rows.
+    had_retrieval_index = "bm25" in vector_db
+    vector_db.pop("bm25", None)
+    vector_db.pop("doc_norms", None)
+    if had_retrieval_index:
+        from retrieval import ensure_retrieval_index
+        ensure_retrieval_index(vector_db)
+    return stats
+
+def sync_store_file(json_file, pickle_file):
+    """python sentembeed.py sync: apply the JSON's changes to the store file."""
+    with open(pickle_file, "rb") as f:
+        vector_db = pickle.load(f)
+    relocate_store_texts(vector_db, pickle_file)
+    records = load_json(json_file)
+    model = load_model(vector_db.get("model_name", "all-MiniLM-L6-v2"))
+    start_time = time.perf_counter()
+    stats = sync_vector_database(vector_db, records, model)
+    elapsed = time.perf_counter() - start_time
+    print(f"Sync: {stats['added']} added, {stats['changed']} changed, {stats['stale']} stale, "
+          f"{stats['deleted']} deleted, {stats['unchanged']} unchanged, {stats['backfilled']} hashes backfilled "
+          f"({elapsed:.1f}s)")
+    if stats["added"] or stats["changed"] or stats["stale"] or stats["deleted"] or stats["backfilled"]:
+        save_vector_database(vector_db, pickle_file)
+        print(f"Vector database saved to {pickle_file}")
+
+def add_passage_index_to_store(pickle_file):
+    """Build the passage index for an existing store file without re-embedding pages."""
+    with open(pickle_file, "rb") as f:
+        vector_db = pickle.load(f)
+    relocate_store_texts(vector_db, pickle_file)
+    model = load_model(vector_db.get("model_name", "all-MiniLM-L6-v2"))
+    create_passage_index(vector_db, model)
+    save_vector_database(vector_db, pickle_file)
+    print(f"Passage index added to {pickle_file}")
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "passages":
+        # python sentembeed.py passages [store.pkl]
+        pickle_file = sys.argv[2] if len(sys.argv) > 2 else r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+        add_passage_index_to_store(pickle_file)
+        return
+
     input_file = r"C:\Users\surya\Desktop\webcrawling\vector_data_final.json"
     output_file = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
     
-    vector_db = create_vector_database(input_file, model_name="all-mpnet-base-v2")
+    if len(sys.argv) > 1 and sys.argv[1] == "sync":
+        # python sentembeed.py sync: re-encode only added/changed rows, drop deleted URLs.
+        sync_store_file(input_file, output_file)
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bulk":
+        # python sentembeed.py bulk [processes]; rerun the same command to resume.
+        # Builds the passage index in the same workers.
+        processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        shard_dir = output_file + ".shards"
+        vector_db = bulk_create_vector_database(input_file, shard_dir, model_name="all-mpnet-base-v2",
+                                                processes=processes)
+        pack_store_texts(vector_db, output_file + ".text")
+        save_vector_database(vector_db, output_file)
+        print(f"Vector database created and saved to {output_file}")
+        return
+
+    model_name = "all-mpnet-base-v2"
+    model = load_model(model_name)
+    vector_db = create_vector_database(input_file, model_name=model_name, model=model)
+    # Passage-level index: overlapping chunks mapped back to their parent record.
+    create_passage_index(vector_db, model)
+    # Texts go to a memory-mapped arena next to the store; the pickle keeps offsets.
+    pack_store_texts(vector_db, output_file + ".text")
     save_vector_database(vector_db, output_file)
     print(f"Vector database created and saved to {output_file}")
 
@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+import multiprocessing
+import multiprocessing.pool
+from multiprocessing.connection import Client, Listener, AuthenticationError
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import numpy as np
+
+# Scatter-gather dense search. The store's doc_vectors are split into row
+# shards (<store>.rowshards/rowshard_NNNNN.npy + norms + manifest.json); each
+# query vector is sent to every shard, searched either by a local worker
+# process (shards are memory-mapped, so processes share the page cache) or by
+# a shard server on another node reached over a multiprocessing.connection
+# socket. Each shard returns its own top-k, and the coordinator merges them.
+# Ranking is by (score desc, row asc) everywhere, so the merged top-k is
+# exactly the top-k of a single search over the whole array.
+
+DEFAULT_STORE = r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+# Shard servers unpickle what they receive, so the connection key must be a
+# secret shared by the servers and the coordinator: SHARD_AUTHKEY, or
+# --authkey on the command line. There is no default.
+AUTHKEY_ENV = "SHARD_AUTHKEY"
+DEFAULT_HOST = "127.0.0.1"
+
+def get_authkey(authkey=None):
+    """authkey (str or bytes), else $SHARD_AUTHKEY; raises ValueError when neither is set."""
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(f"No shard server key: set {AUTHKEY_ENV} or pass --authkey")
+    return authkey.encode("utf-8") if isinstance(authkey, str) else authkey
+
+def shard_dir_for(pickle_file):
+    return pickle_file + ".rowshards"
+
+# ------------------------------
+# SPLIT
+# ------------------------------
+
+def split_store(vector_db, shard_dir, num_shards):
+    """Write doc_vectors (and their norms) as num_shards contiguous row ranges."""
+    doc_vectors = np.asarray(vector_db["doc_vectors"], dtype=np.float32)
+    norms = np.linalg.norm(doc_vectors, axis=1)
+    norms[norms == 0] = 1.0
+    os.makedirs(shard_dir, exist_ok=True)
+    bounds = np.linspace(0, len(doc_vectors), num_shards + 1).astype(np.int64)
+    shards = []
+    for i in range(num_shards):
+        first, last = int(bounds[i]), int(bounds[i + 1])
+        name = f"rowshard_{i:05d}"
+        np.save(os.path.join(shard_dir, name + ".npy"), doc_vectors[first:last])
+        np.save(os.path.join(shard_dir, name + ".norms.npy"), norms[first:last].astype(np.float32))
+        shards.append({"id": i, "file": name, "first_row": first, "rows": last - first})
+    manifest = {"rows": len(doc_vectors), "dim": int(doc_vectors.shape[1]) if doc_vectors.ndim == 2 else 0,
+                "model_name": vector_db.get("model_name"), "shards": shards}
+    with open(os.path.join(shard_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Split {len(doc_vectors)} vectors into {num_shards} row shards in {shard_dir}")
+    return manifest
+
+def load_manifest(shard_dir):
+    with open(os.path.join(shard_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ------------------------------
+# PER-SHARD SEARCH (runs in workers and shard servers)
+# ------------------------------
+
+_open_shards = {}   # per process: shard path -> (vectors, norms), memory-mapped
+
+def _open_shard(shard_dir, shard):
+    path = os.path.join(shard_dir, shard["file"])
+    if path not in _open_shards:
+        _open_shards[path] = (np.load(path + ".npy", mmap_mode="r"), np.load(path + ".norms.npy", mmap_mode="r"))
+    return _open_shards[path]
+
+def top_k(scores, k):
+    """Positions of the k best scores, best first; ties go to the lower position."""
+    if len(scores) > k:
+        cutoff = np.partition(-scores, k - 1)[k - 1]
+        candidates = np.flatnonzero(-scores <= cutoff)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+def cosine_scores(vectors, norms, query_vec):
+    q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+    q_norm = np.linalg.norm(q) or 1.0
+    return (vectors @ q) / (norms * q_norm)
+
+def search_shard(shard_dir, shard, query_vec, k):
+    """(global rows, scores) of the shard's top k, best first."""
+    vectors, norms = _open_shard(shard_dir, shard)
+    scores = cosine_scores(vectors, norms, query_vec)
+    best = top_k(scores, k)
+    return best + shard["first_row"], scores[best]
+
+def _search_task(args):
+    return search_shard(*args)
+
+# ------------------------------
+# SHARD SERVER (one node serving some shards over a socket)
+# ------------------------------
+
+def serve_shards(shard_dir, address, shard_ids=None, authkey=None):
+    """
+    Answer (request id, shard_id, query_vec, k) requests for the given shards
+    (default: all). One thread per coordinator connection; runs until killed.
+    authkey defaults to $SHARD_AUTHKEY; there is no built-in key.
+    """
+    authkey = get_authkey(authkey)
+    manifest = load_manifest(shard_dir)
+    shards = {s["id"]: s for s in manifest["shards"] if shard_ids is None or s["id"] in shard_ids}
+    for shard in shards.values():
+        _open_shard(shard_dir, shard)
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    request_id, shard_id, query_vec, k = conn.recv()
+                    if shard_id not in shards:
+                        conn.send((request_id, "error", f"shard {shard_id} is not served here"))
+                        continue
+                    conn.send((request_id, "ok", search_shard(shard_dir, shards[shard_id], query_vec, k)))
+                except (EOFError, OSError):
+                    # Closed by the coordinator (e.g. after a timeout).
+                    return
+
+    with Listener(address, authkey=authkey, backlog=64) as listener:
+        print(f"Serving shards {sorted(shards)} of {shard_dir} on {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError, EOFError) as e:
+                # A client with the wrong key (or a dropped handshake) is turned away.
+                print(f"Rejected connection: {e}")
+                continue
+            # A thread for as long as the connection lasts: coordinators keep
+            # their connections open, so a fixed pool would starve new ones.
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+def parse_address(text):
+    """"host:port", or just "port" for the loopback interface."""
+    host, _, port = text.rpartition(":")
+    return host or DEFAULT_HOST, int(port)
+
+# ------------------------------
+# COORDINATOR
+# ------------------------------
+
+class ScatterGatherSearcher:
+    """
+    Searches every row shard in parallel and merges the per-shard top-k.
+
+    Shards listed in remote ({shard id: "host:port"}) are queried on their
+    shard server; the rest are searched by a pool of processes worker
+    processes. Each search waits at most timeout seconds in total: shards
+    that have not answered by then are reported as missing and, with
+    partial=True, the merged result covers only the shards that answered;
+    with partial=False a TimeoutError is raised instead. Remote shards need
+    the servers' key (authkey or $SHARD_AUTHKEY).
+    """
+
+    def __init__(self, shard_dir, processes=None, timeout=2.0, partial=True, remote=None, authkey=None):
+        self.shard_dir = shard_dir
+        self.manifest = load_manifest(shard_dir)
+        self.timeout = timeout
+        self.partial = partial
+        self.remote = {int(shard_id): parse_address(address) for shard_id, address in (remote or {}).items()}
+        self.authkey = get_authkey(authkey) if self.remote else None
+        local = [s for s in self.manifest["shards"] if s["id"] not in self.remote]
+        self._pool = None
+        if local:
+            self._pool = multiprocessing.Pool(processes or min(len(local), os.cpu_count() or 1))
+        # Idle connections per remote shard. A request takes one (or opens a
+        # new one), so concurrent queries never wait for each other, and a
+        # connection whose request timed out is closed instead of reused.
+        self._idle = {shard_id: [] for shard_id in self.remote}
+        self._idle_lock = threading.Lock()
+        self._request_id = itertools.count()
+        self._remote_pool = ThreadPoolExecutor(max_workers=max(4, 4 * len(self.remote)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        with self._idle_lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+                connections.clear()
+        self._remote_pool.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remote_search(self, shard, query_vec, k, deadline):
+        shard_id = shard["id"]
+        request_id = next(self._request_id)
+        with self._idle_lock:
+            conn = self._idle[shard_id].pop() if self._idle[shard_id] else None
+        if conn is None:
+            conn = Client(self.remote[shard_id], authkey=self.authkey)
+        try:
+            conn.send((request_id, shard_id, np.asarray(query_vec, dtype=np.float32), k))
+            if not conn.poll(max(deadline - time.perf_counter(), 0.0)):
+                raise TimeoutError(f"shard {shard_id} did not answer in time")
+            reply_id, status, payload = conn.recv()
+            if reply_id != request_id:
+                raise RuntimeError(f"shard {shard_id} answered request {reply_id} instead of {request_id}")
+        except BaseException:
+            # The connection may still get the late reply: never reuse it.
+            conn.close()
+            raise
+        with self._idle_lock:
+            self._idle[shard_id].append(conn)
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def search(self, query_vec, k=5):
+        """
+        Returns (rows, scores, info): the global top-k rows and their cosine
+        scores, best first, and info = {"shards", "answered", "missing", "ms"}.
+        """
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        pending = {}
+        for shard in self.manifest["shards"]:
+            if shard["rows"] == 0:
+                continue
+            if shard["id"] in self.remote:
+                pending[shard["id"]] = self._remote_pool.submit(self._remote_search, shard, query_vec, k, deadline)
+            else:
+                pending[shard["id"]] = self._pool.apply_async(_search_task, ((self.shard_dir, shard, query_vec, k),))
+
+        all_rows, all_scores, missing = [], [], []
+        for shard_id, result in pending.items():
+            remaining = max(deadline - time.perf_counter(), 0.0)
+            try:
+                if isinstance(result, multiprocessing.pool.AsyncResult):
+                    rows, scores = result.get(remaining)
+                else:
+                    rows, scores = result.result(remaining)
+            except (multiprocessing.TimeoutError, FutureTimeout, TimeoutError):
+                missing.append(shard_id)
+                continue
+            except Exception as e:
+                print(f"Shard {shard_id} failed: {e}")
+                missing.append(shard_id)
+                continue
+            all_rows.append(np.asarray(rows, dtype=np.int64))
+            all_scores.append(np.asarray(scores, dtype=np.float32))
+        if missing and not self.partial:
+            raise TimeoutError(f"Shards {missing} did not answer within {self.timeout}s")
+
+        rows = np.concatenate(all_rows) if all_rows else np.zeros(0, dtype=np.int64)
+        scores = np.concatenate(all_scores) if all_scores else np.zeros(0, dtype=np.float32)
+        # Rows are global, so (score desc, row asc) is the single-array order.
+        order = np.lexsort((rows, -scores))[:k]
+        info = {"shards": len(pending), "answered": len(pending) - len(missing), "missing": missing,
+                "ms": (time.perf_counter() - start) * 1000.0}
+        return rows[order], scores[order], info
+
+def query_vector_database(query, model, searcher, metadata, threshold=0.5, top_n=5, corpus=None):
+    """
+    Returns (results, max_sim) like retrieval.search, with the dense
+    similarity search scattered over searcher's row shards. Results of a partial search carry
+    "partial": True.
+    """
+    query_vec = model.encode([query])[0]
+    rows, scores, info = searcher.search(query_vec, top_n)
+    max_sim = float(scores[0]) if len(scores) else 0.0
+    if info["missing"]:
+        print(f"Partial result: shards {info['missing']} did not answer")
+    if max_sim < threshold:
+        return None, max_sim
+    results = []
+    for row, score in zip(rows, scores):
+        row = int(row)
+        results.append({
+            "url": metadata[row]["url"],
+            "content": metadata[row].get("content", corpus[row] if corpus is not None else ""),
+            "similarity": float(score),
+            "partial": bool(info["missing"])
+        })
+    return results, max_sim
+
+# ------------------------------
+# CHECK
+# ------------------------------
+
+def check_exact(vector_db, searcher, queries=50, k=10, seed=0):
+    """
+    Compare scatter-gather against one search over the whole array, using
+    stored vectors as queries. Returns the number of mismatching queries.
+    """
+    doc_vectors = np.asarray(vector_db["doc_vectors"], dtype=np.float32)
+    norms = np.linalg.norm(doc_vectors, axis=1)
+    norms[norms == 0] = 1.0
+    rng = np.random.default_rng(seed)
+    mismatches = 0
+    timings = []
+    for row in rng.choice(len(doc_vectors), size=min(queries, len(doc_vectors)), replace=False):
+        query_vec = doc_vectors[row] + rng.normal(0, 0.01, doc_vectors.shape[1]).astype(np.float32)
+        expected = top_k(cosine_scores(doc_vectors, norms, query_vec), k)
+        rows, _, info = searcher.search(query_vec, k)
+        timings.append(info["ms"])
+        mismatches += not np.array_equal(rows, expected)
+    print(f"{len(timings)} queries, {mismatches} mismatches, "
+          f"p50 {np.percentile(timings, 50):.1f} ms, p95 {np.percentile(timings, 95):.1f} ms")
+    return mismatches
+
+def main():
+    # python shardsearch.py split [num_shards] [store.pkl]
+    # python shardsearch.py serve [host:]port [shard ids...] [--store store.pkl] [--authkey key]
+    #     (binds to 127.0.0.1 unless a host is given; key from $SHARD_AUTHKEY otherwise)
+    # python shardsearch.py check [processes] [store.pkl]
+    from rawupdate import load_vector_database
+    args = sys.argv[1:]
+    pickle_file = DEFAULT_STORE
+    authkey = None
+    if "--store" in args:
+        pickle_file = args[args.index("--store") + 1]
+        del args[args.index("--store"):args.index("--store") + 2]
+    if "--authkey" in args:
+        authkey = args[args.index("--authkey") + 1]
+        del args[args.index("--authkey"):args.index("--authkey") + 2]
+    if args and args[0] == "split":
+        num_shards = int(args[1]) if len(args) > 1 else os.cpu_count() or 1
+        pickle_file = args[2] if len(args) > 2 else pickle_file
+        split_store(load_vector_database(pickle_file), shard_dir_for(pickle_file), num_shards)
+    elif args and args[0] == "serve" and len(args) > 1:
+        shard_ids = [int(a) for a in args[2:]] or None
+        serve_shards(shard_dir_for(pickle_file), parse_address(args[1]), shard_ids, authkey)
+    elif args and args[0] == "check":
+        processes = int(args[1]) if len(args) > 1 else None
+        pickle_file = args[2] if len(args) > 2 else pickle_file
+        with ScatterGatherSearcher(shard_dir_for(pickle_file), processes=processes, timeout=30) as searcher:
+            check_exact(load_vector_database(pickle_file), searcher)
+    else:
+        print("Usage: python shardsearch.py split [num_shards] [store.pkl] | "
+              "serve [host:]port [shard ids...] [--store store.pkl] [--authkey key] | check [processes] [store.pkl]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# One index shard per hosted site. sites.json maps a site id to its domain
+# and the files of its shard (store pickle, summarized JSON, crawl frontier,
+# archive); every shard is built by the same crawl -> summarize -> embed
+# pipeline. ShardRouter opens a shard only when a query is routed to it and
+# keeps at most max_open of them in memory, closing the least recently used
+# and any left idle, so memory follows the active sites rather than all sites.
+
+DEFAULT_REGISTRY = r"C:\Users\surya\Desktop\webcrawling\sites.json"
+DEFAULT_SHARD_DIR = r"C:\Users\surya\Desktop\webcrawling\shards"
+DEFAULT_SITE = "acg-world"
+
+# The original single-site store, used when no registry file exists yet.
+BUILTIN_SITES = {
+    DEFAULT_SITE: {
+        "domain": "acg-world.com",
+        "store": r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl",
+        "json": r"C:\Users\surya\Desktop\webcrawling\vector_data_final.json",
+        "frontier": "scrap_frontier.db",
+        "archive": r"C:\Users\surya\Desktop\webcrawling\crawl_archive.warc.gz",
+        "model_name": "all-mpnet-base-v2"
+    }
+}
+
+# ------------------------------
+# REGISTRY
+# ------------------------------
+
+def load_registry(registry_file=DEFAULT_REGISTRY):
+    if not os.path.exists(registry_file):
+        return {"default": DEFAULT_SITE, "sites": json.loads(json.dumps(BUILTIN_SITES))}
+    with open(registry_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_registry(registry, registry_file=DEFAULT_REGISTRY):
+    tmp_file = registry_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_file, registry_file)
+
+def register_site(registry, site, domain, shard_dir=DEFAULT_SHARD_DIR, sitemap=None, model_name="all-mpnet-base-v2"):
+    """Add (or update) a site; its shard files live in shard_dir/<site>/."""
+    site_dir = os.path.join(shard_dir, site)
+    config = registry["sites"].get(site, {})
+    config.update({
+        "domain": domain.lower(),
+        "store": config.get("store", os.path.join(site_dir, "vector_store.pkl")),
+        "json": config.get("json", os.path.join(site_dir, "vector_data.json")),
+        "frontier": config.get("frontier", os.path.join(site_dir, "frontier.db")),
+        "archive": config.get("archive", os.path.join(site_dir, "archive.warc.gz")),
+        "model_name": model_name
+    })
+    if sitemap:
+        config["sitemap"] = sitemap
+    registry["sites"][site] = config
+    registry.setdefault("default", site)
+    return config
+
+def resolve_site(registry, site=None, url=None):
+    """
+    Site id for a query: the given id (or a domain), else the site whose
+    domain the URL belongs to, else the registry default.
+    """
+    sites = registry["sites"]
+    if site in sites:
+        return site
+    host = (urlparse(url).netloc if url else site or "").lower()
+    host = host.split(":")[0]
+    for site_id, config in sites.items():
+        domain = config["domain"]
+        if host == domain or host.endswith("." + domain):
+            return site_id
+    if site or url:
+        raise KeyError(f"No site registered for {site or url}")
+    return registry["default"]
+
+# ------------------------------
+# PER-SITE BUILD PIPELINE
+# ------------------------------
+
+def build_site_shard(registry, site, max_links=1000, sitemap_file=None):
+    """
+    Crawl the site's domain, extract and summarize every page, and embed the
+    summaries into the site's shard. The crawl frontier is per site, so a
+    stopped build resumes where it left off.
+    """
+    from scrap import crawl, parse_sitemap
+    from contentmaker import crawl_urls
+    from jsontosummary import clean_data, save_json
+    from imp import summarize_text
+    from sentembeed import load_model, create_vector_database, create_passage_index
+    from textarena import pack_store_texts
+    from rawupdate import save_vector_database
+
+    config = registry["sites"][site]
+    domain = config["domain"]
+    os.makedirs(os.path.dirname(config["store"]), exist_ok=True)
+    sitemap_file = sitemap_file or config.get("sitemap")
+    seed_urls = parse_sitemap(sitemap_file) if sitemap_file else [f"https://{domain}/", f"https://www.{domain}/"]
+
+    urls = sorted(crawl(seed_urls, max_links=max_links, domain_filter=domain, frontier_file=config["frontier"]))
+    print(f"[{site}] {len(urls)} URLs discovered on {domain}")
+    records = crawl_urls(urls, archive_path=config.get("archive"))
+
+    for idx, record in enumerate(records, start=1):
+        record["content"] = summarize_text(record["content"])
+        print(f"[{site}] {idx}/{len(records)} summarized")
+    records = clean_data(records)
+    save_json(records, config["json"])
+
+    model = load_model(config["model_name"])
+    vector_db = create_vector_database(config["json"], model_name=config["model_name"], model=model)
+    create_passage_index(vector_db, model)
+    pack_store_texts(vector_db, config["store"] + ".text")
+    save_vector_database(vector_db, config["store"])
+    config["built"] = time.time()
+    print(f"[{site}] shard with {len(records)} records saved to {config['store']}")
+    return vector_db
+
+# ------------------------------
+# QUERY ROUTING
+# ------------------------------
+
+class ShardRouter:
+    """
+    Lazily opened, LRU-bounded set of site shards. get(site) returns the
+    site's vector_db, loading it (with pending rawupdate patches and the
+    retrieval index) on first use; patches appended to the shard's delta log
+    by another process are replayed on the next get(), and a store file
+    rewritten by another process (compact, pack, a rebuild) is reopened.
+    Thread-safe: a
+    vector_db handed out is never changed afterwards. Patches are written
+    into a copy that replaces the shard in one step, so queries can keep
+    using the store they were given without a lock.
+    """
+
+    def __init__(self, registry=None, max_open=4, idle_seconds=1800, load_model=None):
+        self.registry = registry if registry is not None else load_registry()
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        self._load_model = load_model
+        self._shards = OrderedDict()   # site -> (vector_db, last used)
+        self._delta_sizes = {}         # site -> size of its delta log when last replayed
+        self._store_stamps = {}        # site -> (mtime, size) of its store file when opened
+        self._models = {}
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()   # one patch at a time
+
+    def _open(self, site):
+        from rawupdate import load_vector_database
+        from retrieval import ensure_retrieval_index
+        config = self.registry["sites"][site]
+        start = time.perf_counter()
+        self._store_stamps[site] = self._store_stamp(site)
+        self._delta_sizes[site] = self._delta_size(site)
+        vector_db = load_vector_database(config["store"])
+        ensure_retrieval_index(vector_db)
+        print(f"Opened shard {site} ({len(vector_db['metadata'])} records) in {time.perf_counter() - start:.2f}s")
+        return vector_db
+
+    def _store_stamp(self, site):
+        stat = os.stat(self.registry["sites"][site]["store"])
+        return stat.st_mtime_ns, stat.st_size
+
+    def _delta_size(self, site):
+        from rawupdate import delta_path
+        path = delta_path(self.registry["sites"][site]["store"])
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _close(self, site):
+        vector_db, _ = self._shards.pop(site)
+        for texts in (vector_db.get("corpus"), (vector_db.get("passages") or {}).get("texts")):
+            if hasattr(texts, "close"):
+                texts.close()
+        print(f"Closed shard {site}")
+
+    def evict_idle(self):
+        """Close shards not used for idle_seconds. Returns the sites closed."""
+        with self._lock:
+            now = time.monotonic()
+            idle = [site for site, (_, used) in self._shards.items() if now - used > self.idle_seconds]
+            for site in idle:
+                self._close(site)
+            return idle
+
+    def get(self, site):
+        with self._lock:
+            self.evict_idle()
+            if site in self._shards and self._store_stamp(site) != self._store_stamps.get(site):
+                # The store was rewritten; its rows and text file may have
+                # moved. Queries still holding the old store keep working on
+                # the old text file, which packing leaves in place.
+                self._shards.pop(site)
+                print(f"Shard {site}: store file changed, reopening")
+            if site in self._shards:
+                vector_db, _ = self._shards.pop(site)
+                size = self._delta_size(site)
+                if size != self._delta_sizes.get(site):
+                    from rawupdate import apply_delta_file, writable_copy
+                    # Replaying is idempotent: rows already up to date are skipped.
+                    updated = writable_copy(vector_db)
+                    rows = apply_delta_file(updated, self.registry["sites"][site]["store"])
+                    self._delta_sizes[site] = size
+                    if rows:
+                        vector_db = updated
+                        print(f"Shard {site}: {rows} row(s) updated from its delta log")
+            else:
+                vector_db = self._open(site)
+                while len(self._shards) >= self.max_open:
+                    self._close(next(iter(self._shards)))
+            self._shards[site] = (vector_db, time.monotonic())
+            return vector_db
+
+    def model_for(self, vector_db):
+        """Query encoder for a shard; shards built with the same model share it."""
+        model_name = vector_db.get("model_name", "all-MiniLM-L6-v2")
+        with self._lock:
+            if model_name not in self._models:
+                if self._load_model is not None:
+                    self._models[model_name] = self._load_model(model_name)
+                else:
+                    from onnxencoder import load_query_encoder
+                    self._models[model_name] = load_query_encoder(model_name)
+            return self._models[model_name]
+
+    def route(self, site=None, url=None):
+        """(site id, site config, vector_db, model) for a query."""
+        site = resolve_site(self.registry, site, url)
+        vector_db = self.get(site)
+        return site, self.registry["sites"][site], vector_db, self.model_for(vector_db)
+
+    def patch(self, site, patches):
+        """
+        Apply rawupdate patches ({"url", "content"}) to a site's shard: the
+        touched pages are embedded in one batch (outside the router lock, so
+        queries are not held up), written into a copy of the shard, appended
+        to its delta log and the copy swapped in. Returns the patch stats.
+        """
+        from rawupdate import apply_patches, append_delta, write_entries, writable_copy
+        store = self.registry["sites"][site]["store"]
+        with self._write_lock:
+            snapshot = self.get(site)
+            updated = writable_copy(snapshot)
+            entries, stats = apply_patches(updated, patches, self.model_for(snapshot))
+            if not entries:
+                return stats
+            with self._lock:
+                current = self.get(site)
+                if current is not snapshot:
+                    # Replaced meanwhile (delta log of another process, or
+                    # reopened): write the same entries onto the new one.
+                    updated = writable_copy(current)
+                    write_entries(updated, entries)
+                size = self._delta_size(site)
+                append_delta(store, entries)
+                if size == self._delta_sizes.get(site):
+                    self._delta_sizes[site] = self._delta_size(site)
+                self._shards[site] = (updated, time.monotonic())
+            return stats
+
+    def open_sites(self):
+        with self._lock:
+            return list(self._shards)
+
+def main():
+    # python sites.py list
+    # python sites.py add <site> <domain> [sitemap.xml]
+    # python sites.py build <site> [max_links]
+    args = sys.argv[1:]
+    registry = load_registry()
+    if not args or args[0] == "list":
+        for site, config in registry["sites"].items():
+            marker = " (default)" if site == registry["default"] else ""
+            built = os.path.exists(config["store"])
+            print(f"{site}{marker}: {config['domain']} -> {config['store']} ({'built' if built else 'not built'})")
+        return
+    if args[0] == "add" and len(args) >= 3:
+        config = register_site(registry, args[1], args[2], sitemap=args[3] if len(args) > 3 else None)
+        save_registry(registry)
+        print(f"Registered {args[1]} ({config['domain']}); build it with: python sites.py build {args[1]}")
+        return
+    if args[0] == "build" and len(args) >= 2:
+        max_links = int(args[2]) if len(args) > 2 else 1000
+        build_site_shard(registry, args[1], max_links=max_links)
+        save_registry(registry)
+        return
+    print("Usage: python sites.py [list | add <site> <domain> [sitemap.xml] | build <site> [max_links]]")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import re
+import json
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Append-only TF-IDF index for the lexical store (tfidf.py / main.py). Terms
+# are hashed into n_features columns instead of being looked up in a fitted
+# vocabulary, so new documents can be added at any time without a refit: the
+# raw term counts of every row are kept as a float32 CSR matrix and the
+# document frequency of every column is updated as rows are added. The idf
+# weights are recomputed from those counts when the document vectors are next
+# needed, with the same smoothed formula TfidfVectorizer uses, so rankings
+# match a full refit (up to hash collisions, which are rare at 2**20
+# columns). There is no vocabulary dict to pickle; only the columns that
+# occur are stored, and columns outside [min_df, max_df] are pruned from the
+# document vectors.
+
+DEFAULT_FEATURES = 2 ** 20
+BATCH_SIZE = 1000
+
+class HashedTfidfIndex:
+    """
+    Drop-in for a fitted TfidfVectorizer + its doc_vectors: transform() gives
+    L2-normalized query vectors comparable with doc_vectors via
+    cosine_similarity, and add() appends documents as new rows.
+    """
+
+    def __init__(self, n_features=DEFAULT_FEATURES, stop_words="english", min_df=1, max_df=1.0):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.min_df = min_df
+        self.max_df = max_df
+        self.tf = sp.csr_matrix((0, n_features), dtype=np.float32)
+        self.df = np.zeros(n_features, dtype=np.int32)
+        self._hasher = None
+        self._doc_vectors = None
+        self._idf = None
+
+    @property
+    def num_docs(self):
+        return self.tf.shape[0]
+
+    def _counts(self, texts):
+        if self._hasher is None:
+            self._hasher = HashingVectorizer(n_features=self.n_features, stop_words=self.stop_words,
+                                             alternate_sign=False, norm=None, dtype=np.float32)
+        return self._hasher.transform(texts).tocsr()
+
+    def add(self, texts):
+        """Append texts as new rows (numbered after the existing ones)."""
+        return self.add_batches([texts])
+
+    def add_batches(self, batches):
+        """
+        Append several batches of texts with a single copy of the matrix;
+        only one batch of texts is held at a time.
+        """
+        parts = [self.tf]
+        for texts in batches:
+            texts = list(texts)
+            if not texts:
+                continue
+            counts = self._counts(texts)
+            counts.sum_duplicates()
+            self.df += np.bincount(counts.indices, minlength=self.n_features).astype(np.int32)
+            parts.append(counts)
+        if len(parts) > 1:
+            self.tf = sp.vstack(parts, format="csr", dtype=np.float32)
+            self._doc_vectors = None
+            self._idf = None
+        return self
+
+    def idf(self):
+        """Smoothed idf per column; pruned and unseen columns weigh 0."""
+        if self._idf is None:
+            n = self.num_docs
+            idf = (np.log((1.0 + n) / (1.0 + self.df)) + 1.0).astype(np.float32)
+            max_df = self.max_df if isinstance(self.max_df, int) else self.max_df * n
+            idf[(self.df < max(self.min_df, 1)) | (self.df > max_df)] = 0.0
+            self._idf = idf
+        return self._idf
+
+    def _weigh(self, counts):
+        weighted = counts.astype(np.float32, copy=True)
+        weighted.data *= self.idf()[weighted.indices]
+        weighted.eliminate_zeros()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        weighted.data /= np.repeat(norms, np.diff(weighted.indptr)).astype(np.float32)
+        return weighted
+
+    @property
+    def doc_vectors(self):
+        """L2-normalized tf-idf rows of every document (float32 CSR), cached until the next add()."""
+        if self._doc_vectors is None:
+            self._doc_vectors = self._weigh(self.tf)
+        return self._doc_vectors
+
+    def transform(self, texts):
+        """Query vectors weighted with the current idf."""
+        return self._weigh(self._counts(texts))
+
+    def nbytes(self):
+        return self.tf.data.nbytes + self.tf.indices.nbytes + self.tf.indptr.nbytes
+
+    def __getstate__(self):
+        # The hasher and the weighted matrix are rebuilt on demand; df is
+        # stored as (column, count) pairs for the columns that occur.
+        state = self.__dict__.copy()
+        state["_hasher"] = None
+        state["_doc_vectors"] = None
+        state["_idf"] = None
+        columns = np.flatnonzero(self.df).astype(np.int32)
+        state["df"] = (columns, self.df[columns])
+        return state
+
+    def __setstate__(self, state):
+        columns, counts = state["df"]
+        df = np.zeros(state["n_features"], dtype=np.int32)
+        df[columns] = counts
+        state["df"] = df
+        self.__dict__.update(state)
+
+def iter_json_records(json_file, chunk_size=1 << 20):
+    """
+    Yield the records of a JSON array file one at a time, reading chunk_size
+    characters at a time, so the whole file is never held in memory.
+    """
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"[\s,]*")
+    with open(json_file, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{json_file} is not a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            pos = whitespace.match(buffer, pos).end()
+            if buffer.startswith("]", pos):
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Record cut off at the end of the buffer: read on.
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+
+def iter_batches(items, batch_size=BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
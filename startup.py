@@ -0,0 +1,119 @@
+import os
+import re
+import ast
+import sys
+import time
+import subprocess
+import importlib
+
+# Modules the query path needs sooner or later. prewarm() imports them up
+# front so that the first user request doesn't pay for them.
+WARM_MODULES = ("requests", "bs4", "googlesearch", "groq")
+
+_groq_client = None
+
+def get_groq_client():
+    """One Groq client per process instead of one per call."""
+    global _groq_client
+    if _groq_client is None:
+        from groq import Groq
+        api_key = os.environ.get("GROQ_API_KEY")
+        if not api_key:
+            raise Exception("GROQ_API_KEY not set in environment variables.")
+        _groq_client = Groq(api_key=api_key)
+    return _groq_client
+
+def prewarm(vector_db=None, model=None, modules=WARM_MODULES):
+    """
+    Do the cold-start work before the first query is accepted: import the
+    lazily loaded dependencies, build the retrieval index, load the prompt
+    tokenizer and run a dummy encode so model weights and kernels are
+    initialised. Returns the seconds
+    spent per step.
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Pre-warm: could not import {name}: {e}")
+        timings[f"import {name}"] = time.perf_counter() - start
+    if vector_db is not None:
+        from retrieval import ensure_retrieval_index
+        start = time.perf_counter()
+        ensure_retrieval_index(vector_db)
+        timings["retrieval index"] = time.perf_counter() - start
+    if model is not None:
+        start = time.perf_counter()
+        model.encode(["warm up"])
+        timings["dummy encode"] = time.perf_counter() - start
+    start = time.perf_counter()
+    # The prompt tokenizer for context packing (transformers import + files).
+    from contextpacker import get_token_counter
+    get_token_counter()
+    timings["token counter"] = time.perf_counter() - start
+    if os.environ.get("GROQ_API_KEY"):
+        start = time.perf_counter()
+        get_groq_client()
+        timings["groq client"] = time.perf_counter() - start
+    print("Pre-warm done: " + ", ".join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in timings.items()))
+    return timings
+
+# ------------------------------
+# IMPORT-TIME PROFILE
+# ------------------------------
+
+def _top_level_imports(script_path):
+    """Source of the module-level import statements of a script, without running the rest of it."""
+    with open(script_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script_path)
+    statements = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in statements)
+
+def profile_imports(script_path):
+    """
+    Run the script's top-level imports under `python -X importtime` in a
+    fresh interpreter and return [(package, self_ms, cumulative_ms)] per
+    top-level package, most expensive first.
+    """
+    code = _top_level_imports(script_path)
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=script_dir, capture_output=True, text=True
+    )
+    line_pattern = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+    packages = {}
+    for line in proc.stderr.splitlines():
+        match = line_pattern.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        package = name.split(".")[0]
+        stats = packages.setdefault(package, [0, 0])
+        stats[0] += int(self_us)
+        # Only the outermost import of a package carries its full cumulative cost.
+        if len(indent) == 1:
+            stats[1] += int(cumulative_us)
+    if proc.returncode != 0:
+        print(proc.stderr.splitlines()[-1] if proc.stderr else f"exit code {proc.returncode}")
+    rows = [(name, self_us / 1000.0, cumulative_us / 1000.0) for name, (self_us, cumulative_us) in packages.items()]
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+def main():
+    # python startup.py profile [script.py ...]
+    if len(sys.argv) < 2 or sys.argv[1] != "profile":
+        print("Usage: python startup.py profile [app.py imp.py test.py]")
+        return
+    scripts = sys.argv[2:] or ["app.py", "imp.py", "test.py"]
+    for script in scripts:
+        rows = profile_imports(script)
+        total = sum(row[1] for row in rows)
+        print(f"\n{script}: {total:.0f} ms total import time")
+        print(f"{'package':<30}{'self ms':>10}{'top-level ms':>14}")
+        for name, self_ms, cumulative_ms in rows[:25]:
+            print(f"{name:<30}{self_ms:>10.1f}{cumulative_ms:>14.1f}")
+
+if __name__ == "__main__":
+    main()
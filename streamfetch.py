@@ -0,0 +1,138 @@
+import os
+import re
+import codecs
+import threading
+from metrics import incr
+
+# Streaming GET for the crawlers and scrapers. The body is only read after
+# the headers have been checked: responses whose Content-Type is not HTML,
+# or whose Content-Length is over the cap, are closed before any of the body
+# is downloaded. Without a Content-Type the first bytes are sniffed. Pages
+# are read in chunks up to max_bytes and decoded incrementally, so a huge
+# page costs at most max_bytes of memory and is cut cleanly at a character
+# boundary. Every response gets .skip_reason (None, "content-type" or
+# "too large") and .truncated; the bytes never downloaded are counted.
+
+MAX_BYTES = int(os.environ.get("FETCH_MAX_BYTES", 2 * 1024 * 1024))
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+CHUNK_SIZE = 64 * 1024
+
+_totals = {"responses": 0, "skipped": 0, "truncated": 0, "bytes_read": 0, "bytes_saved": 0}
+_totals_lock = threading.Lock()
+
+def _count(**values):
+    with _totals_lock:
+        for name, value in values.items():
+            _totals[name] += value
+
+def fetch_report():
+    """Totals since start: responses, skipped, truncated, bytes read and bytes saved."""
+    with _totals_lock:
+        return dict(_totals)
+
+def _content_length(headers):
+    try:
+        return int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+def _sniff_html(prefix):
+    head = prefix[:1024].lstrip().lower()
+    return head.startswith((b"<!doctype html", b"<html", b"<head", b"<body", b"<!--")) or b"<html" in head
+
+def _sniff_charset(prefix):
+    match = re.search(rb"""<meta[^>]+charset=["']?([A-Za-z0-9_\-]+)""", prefix[:4096], re.IGNORECASE)
+    return match.group(1).decode("ascii") if match else None
+
+def _header_charset(content_type):
+    match = re.search(r"""charset=["']?([A-Za-z0-9_\-]+)""", content_type or "", re.IGNORECASE)
+    return match.group(1) if match else None
+
+def detect_charset(headers, body):
+    """
+    Charset of an HTML body the way stream_get decodes it: the Content-Type
+    charset, else a <meta charset> near the top, else None (meaning UTF-8).
+    Never the ISO-8859-1 default that requests assumes for text/*.
+    """
+    content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+    return _header_charset(content_type) or _sniff_charset(body or b"")
+
+def _wire_bytes(response):
+    try:
+        return response.raw.tell()
+    except Exception:
+        return 0
+
+def _skip(response, reason, length):
+    response.skip_reason = reason
+    response.truncated = False
+    saved = max((length or 0) - _wire_bytes(response), 0)
+    response._content = b""
+    response.close()
+    _count(responses=1, skipped=1, bytes_saved=saved)
+    incr("fetch_skipped", reason=reason)
+    incr("fetch_bytes_saved", saved, reason=reason)
+    return response
+
+def stream_get(get, url, max_bytes=None, accept_types=HTML_TYPES, **kwargs):
+    """
+    get(url, stream=True, **kwargs) (requests.get or a Session's get), read
+    with the checks above. accept_types=None accepts any type (sitemaps,
+    robots.txt). The returned response behaves like a normal one: .content
+    holds the bytes read and .text their decoded text.
+    """
+    max_bytes = max_bytes or MAX_BYTES
+    response = get(url, stream=True, **kwargs)
+    length = _content_length(response.headers)
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if response.status_code == 200:
+        if accept_types and content_type and content_type not in accept_types:
+            return _skip(response, "content-type", length)
+        if length is not None and length > max_bytes:
+            return _skip(response, "too large", length)
+
+    encoding = response.encoding if "charset" in response.headers.get("Content-Type", "").lower() else None
+    decoder = None
+    parts, text_parts = [], []
+    read = 0
+    truncated = False
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if not chunk:
+            continue
+        if decoder is None:
+            if accept_types and not content_type and response.status_code == 200 and not _sniff_html(chunk):
+                return _skip(response, "content-type", length)
+            encoding = encoding or _sniff_charset(chunk) or "utf-8"
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            except LookupError:
+                encoding = "utf-8"
+                decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        if read + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - read]
+            truncated = True
+        parts.append(chunk)
+        text_parts.append(decoder.decode(chunk))
+        read += len(chunk)
+        if truncated:
+            break
+    if decoder is not None:
+        text_parts.append(decoder.decode(b"", final=True))
+    saved = max((length or 0) - _wire_bytes(response), 0) if truncated else 0
+    response.close()
+
+    response._content = b"".join(parts)
+    response._content_consumed = True
+    response.encoding = encoding or "utf-8"
+    response.decoded_text = "".join(text_parts)
+    response.skip_reason = None
+    response.truncated = truncated
+    _count(responses=1, truncated=int(truncated), bytes_read=read, bytes_saved=saved)
+    if truncated:
+        incr("fetch_truncated")
+        incr("fetch_bytes_saved", saved, reason="truncated")
+    return response
+
+def page_text(response):
+    """The incrementally decoded text of a stream_get response."""
+    return getattr(response, "decoded_text", None) or response.text
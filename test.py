@@ -1,15 +1,17 @@
 import os
 import pickle
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from startup import prewarm
+from textarena import relocate_store_texts
 
 def load_vector_database(pickle_file):
     with open(pickle_file, "rb") as f:
         vector_db = pickle.load(f)
-    return vector_db
+    # Packed stores keep their texts in <store>.text.<n> next to the pickle.
+    return relocate_store_texts(vector_db, pickle_file)
 
-def query_vector_database(query, model, doc_vectors, metadata, threshold=0.5, top_n=1):
+def query_vector_database(query, model, doc_vectors, metadata, threshold=0.5, top_n=1, corpus=None):
+    from sklearn.metrics.pairwise import cosine_similarity
     # Encode the query to get its embedding.
     query_vec = model.encode([query])
     # Compute cosine similarities between query and all document embeddings.
@@ -24,7 +26,8 @@ def query_vector_database(query, model, doc_vectors, metadata, threshold=0.5, to
         for idx in sorted_idx[:top_n]:
             results.append({
                 "url": metadata[idx]["url"],
-                "content": metadata[idx].get("content", ""),  # summary is stored here
+                # Summary: an in-place edit in metadata, else the corpus text.
+                "content": metadata[idx].get("content", corpus[idx] if corpus is not None else ""),
                 "similarity": similarities[idx]
             })
         return results, max_sim
@@ -37,18 +40,17 @@ def main():
     # Retrieve stored data.
     doc_vectors = vector_db["doc_vectors"]
     metadata = vector_db["metadata"]
+    # Texts are read from the corpus only for the top-k rows of each query.
     corpus = vector_db["corpus"]
     
-    # Ensure that each metadata dictionary has the 'content' field.
-    for i, md in enumerate(metadata):
-        if "content" not in md:
-            md["content"] = corpus[i]
-    
     # Load the same SentenceTransformer model used during embedding creation.
     # The model name is stored in vector_db["model_name"]. If missing, default to "all-MiniLM-L6-v2".
     model_name = vector_db.get("model_name", "all-MiniLM-L6-v2")
     print(f"Loading embedding model: {model_name}")
+    from sentence_transformers import SentenceTransformer
     model = SentenceTransformer(model_name)
+    # Run a dummy encode (and load cosine_similarity) before the first query.
+    prewarm(model=model, modules=("sklearn.metrics.pairwise",))
     
     threshold = 0.5  # Adjust threshold as needed.
     
@@ -59,7 +61,7 @@ def main():
             if not query:
                 continue  # skip empty query
             
-            results, max_sim = query_vector_database(query, model, doc_vectors, metadata, threshold=threshold)
+            results, max_sim = query_vector_database(query, model, doc_vectors, metadata, threshold=threshold, corpus=corpus)
             
             if results is None:
                 print(f"No match found. Maximum similarity {max_sim:.4f} is below threshold {threshold}.\n")
@@ -0,0 +1,254 @@
+import os
+import sys
+import mmap
+import hashlib
+import contextlib
+import numpy as np
+
+# Record and passage texts stored once in an append-only UTF-8 file next to
+# the store (<store>.text.<n>) and read through a memory map. The store keeps
+# only an offset/length table per text, so resident memory follows the
+# vectors while a query decodes just the handful of texts it returns.
+# The file always sits next to its store, so a pickled arena keeps only the
+# file name; load_vector_database points it back at the store's directory
+# (relocate_store_texts), and the pair can be moved or copied together.
+# Packing writes a new numbered file instead of replacing the old one, so
+# processes that still have the previous store open keep valid offsets.
+
+class TextArena:
+    """
+    A list-like sequence of texts backed by a file. Supports indexing,
+    iteration, len(), append/extend and item assignment; assignment writes
+    the new text at the end of the file and repoints the row. Identical texts
+    are written once. Pickles as the file name plus the offset table.
+    """
+
+    def __init__(self, path, offsets=None, lengths=None):
+        self.path = os.path.abspath(path)
+        self.offsets = np.zeros(0, dtype=np.int64) if offsets is None else np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.zeros(0, dtype=np.int64) if lengths is None else np.asarray(lengths, dtype=np.int64)
+        self._mm = None
+        self._dedup = None
+        if not os.path.exists(self.path):
+            open(self.path, "ab").close()
+
+    def __getstate__(self):
+        return {"path": os.path.basename(self.path), "offsets": self.offsets, "lengths": self.lengths}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.offsets = state["offsets"]
+        self.lengths = state["lengths"]
+        self._mm = None
+        self._dedup = None
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        offset = int(self.offsets[row])
+        length = int(self.lengths[row])
+        if length == 0:
+            return ""
+        if self._mm is None or offset + length > len(self._mm):
+            self._remap()
+        return self._mm[offset:offset + length].decode("utf-8")
+
+    def __setitem__(self, row, text):
+        offsets, lengths = self._write([text])
+        self.offsets[row] = offsets[0]
+        self.lengths[row] = lengths[0]
+
+    def append(self, text):
+        self.extend([text])
+
+    def extend(self, texts):
+        offsets, lengths = self._write(list(texts))
+        self.offsets = np.concatenate([self.offsets, offsets])
+        self.lengths = np.concatenate([self.lengths, lengths])
+
+    def copy(self):
+        """An independent row table over the same file (for copy-on-write updates)."""
+        arena = TextArena(self.path, self.offsets.copy(), self.lengths.copy())
+        arena._dedup = self._dedup
+        return arena
+
+    def take(self, rows):
+        """A new arena over the same file holding only rows, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return TextArena(self.path, self.offsets[rows], self.lengths[rows])
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _remap(self):
+        self.close()
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _index_lengths(self, sizes):
+        """
+        Add the stored texts of the given byte lengths to the dedup table.
+        Only rows as long as a new text can equal it, so a write hashes a
+        handful of rows instead of the whole corpus.
+        """
+        if self._dedup is None:
+            self._dedup = {"keys": {}, "lengths": set()}
+        sizes = set(sizes) - self._dedup["lengths"]
+        if not sizes:
+            return
+        rows = np.flatnonzero(np.isin(self.lengths, list(sizes)))
+        if len(rows) and (self._mm is None or int((self.offsets[rows] + self.lengths[rows]).max()) > len(self._mm)):
+            self._remap()
+        keys = self._dedup["keys"]
+        for row in rows:
+            offset, length = int(self.offsets[row]), int(self.lengths[row])
+            keys.setdefault(hashlib.sha1(self._mm[offset:offset + length]).digest(), (offset, length))
+        self._dedup["lengths"].update(sizes)
+
+    def _write(self, texts):
+        datas = [(text or "").encode("utf-8") for text in texts]
+        self._index_lengths(len(data) for data in datas if data)
+        keys = self._dedup["keys"]
+        offsets = np.zeros(len(datas), dtype=np.int64)
+        lengths = np.zeros(len(datas), dtype=np.int64)
+        # The file grows under the map; drop it and remap on the next read.
+        self.close()
+        # Other processes (the ingest worker, rawupdate, a sync) append to
+        # the same file: the end offset is only valid while the lock is held.
+        with _file_lock(self.path), open(self.path, "ab") as f:
+            end = f.seek(0, os.SEEK_END)
+            for i, data in enumerate(datas):
+                if not data:
+                    continue
+                key = hashlib.sha1(data).digest()
+                if key not in keys:
+                    f.write(data)
+                    keys[key] = (end, len(data))
+                    end += len(data)
+                offsets[i], lengths[i] = keys[key]
+        return offsets, lengths
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive lock on <path>.lock, across threads and processes."""
+    with open(path + ".lock", "a+b") as lock:
+        if os.name == "nt":
+            import msvcrt
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+def take_rows(texts, rows):
+    """texts[rows] for a TextArena or a plain list."""
+    if isinstance(texts, TextArena):
+        return texts.take(rows)
+    return [texts[row] for row in rows]
+
+def relocate_store_texts(vector_db, pickle_file):
+    """Point the store's arenas (corpus, passage texts) at their file next to pickle_file."""
+    store_dir = os.path.dirname(os.path.abspath(pickle_file))
+    passages = vector_db.get("passages") or {}
+    for texts in (vector_db.get("corpus"), passages.get("texts")):
+        if isinstance(texts, TextArena):
+            texts.path = os.path.join(store_dir, os.path.basename(texts.path))
+    return vector_db
+
+def set_row_text(vector_db, row, text):
+    """
+    Replace the current text of a store row. Arena stores keep a single copy
+    in the arena; list stores keep the corpus as the JSON text and record the
+    edit in metadata["content"], as rawupdate always has.
+    """
+    if isinstance(vector_db["corpus"], TextArena):
+        vector_db["corpus"][row] = text
+        vector_db["metadata"][row].pop("content", None)
+    else:
+        vector_db["metadata"][row]["content"] = text
+
+def _next_text_file(text_file):
+    """text_file with the next free version number: <store>.text.1, .2, ..."""
+    directory, name = os.path.split(os.path.abspath(text_file))
+    versions = [int(entry[len(name) + 1:]) for entry in os.listdir(directory)
+                if entry.startswith(name + ".") and entry[len(name) + 1:].isdigit()]
+    return f"{os.path.abspath(text_file)}.{max(versions, default=0) + 1}"
+
+def pack_store_texts(vector_db, text_file):
+    """
+    Move the store's texts into a fresh arena at the next version of
+    text_file (<text_file>.<n>): one copy per record (metadata["content"]
+    edits win over the corpus) plus the passage texts. Also compacts an
+    existing arena, dropping texts no row points to. The previous file is
+    left in place for readers of the old store; save the store afterwards so
+    it names the new one.
+    """
+    text_file = _next_text_file(text_file)
+    tmp_file = text_file + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    corpus = vector_db["corpus"]
+    corpus_arena = TextArena(tmp_file)
+    corpus_arena.extend(md.get("content", corpus[row]) for row, md in enumerate(vector_db["metadata"]))
+    passages = vector_db.get("passages")
+    passage_arena = None
+    if passages is not None:
+        passage_arena = TextArena(tmp_file)
+        passage_arena.extend(passages["texts"])
+    for old in (corpus, passages["texts"] if passages is not None else None):
+        if isinstance(old, TextArena):
+            old.close()
+    os.replace(tmp_file, text_file)
+    if os.path.exists(tmp_file + ".lock"):
+        os.remove(tmp_file + ".lock")
+    for arena in (corpus_arena, passage_arena):
+        if arena is not None:
+            arena.path = os.path.abspath(text_file)
+    for md in vector_db["metadata"]:
+        md.pop("content", None)
+    vector_db["corpus"] = corpus_arena
+    if passages is not None:
+        passages["texts"] = passage_arena
+    return vector_db
+
+def main():
+    # python textarena.py pack [store.pkl]: move (or compact) texts into <store>.text.<n>
+    from rawupdate import load_vector_database, save_vector_database, delta_path
+    if len(sys.argv) < 2 or sys.argv[1] != "pack":
+        print("Usage: python textarena.py pack [store.pkl]")
+        return
+    pickle_file = sys.argv[2] if len(sys.argv) > 2 else r"C:\Users\surya\Desktop\webcrawling\vector_store_final.pkl"
+    # Pending rawupdate patches are replayed on load and saved with the store.
+    vector_db = load_vector_database(pickle_file)
+    before = sum(len(t.encode("utf-8")) for t in vector_db["corpus"])
+    pack_store_texts(vector_db, pickle_file + ".text")
+    save_vector_database(vector_db, pickle_file)
+    if os.path.exists(delta_path(pickle_file)):
+        os.remove(delta_path(pickle_file))
+    text_file = vector_db["corpus"].path
+    print(f"{len(vector_db['corpus'])} record texts ({before / 1e6:.1f} MB of corpus) moved to "
+          f"{text_file} ({os.path.getsize(text_file) / 1e6:.1f} MB incl. passages)")
+    print("Older <store>.text files can be deleted once no process has the previous store open.")
+
+if __name__ == "__main__":
+    main()
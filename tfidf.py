@@ -1,45 +1,103 @@
-import json
+import os
+import sys
 import pickle
-from sklearn.feature_extraction.text import TfidfVectorizer
+from invertedindex import build_inverted_index, add_to_inverted_index
+from urlindex import build_url_row_index, add_to_url_row_index
+from sparseindex import HashedTfidfIndex, iter_json_records, iter_batches
 
-def build_vector_database(json_file, output_file):
-    # Load the JSON data from the file
-    with open(json_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    corpus = []      # List to store document content
-    metadata = []    # List to store corresponding metadata (URL, title)
-    
-    # Iterate over each record and extract cleaned content
-    for record in data:
+# The lexical store is a HashedTfidfIndex (sparseindex.py): records are read
+# from the JSON file one at a time and hashed in batches, and new records can
+# be appended to an existing store without refitting anything.
+
+def _records(json_file, corpus, metadata, skip_urls=()):
+    """Yield the text of each usable record, collecting corpus and metadata as it goes."""
+    for record in iter_json_records(json_file):
         # Use 'content_clean' if available, otherwise fallback to 'content'
         text = record.get("content_clean") or record.get("content", "")
-        if text.strip():
-            corpus.append(text)
-            metadata.append({
-                "url": record.get("url", ""),
-                "title": record.get("title", "")
-            })
-    
-    # Build TF-IDF vectorizer with English stop words removed
-    vectorizer = TfidfVectorizer(stop_words="english")
-    doc_vectors = vectorizer.fit_transform(corpus)
-    
-    # Save the vectorizer, document vectors, metadata, and corpus in a pickle file
+        url = record.get("url", "")
+        if not text.strip() or url in skip_urls:
+            continue
+        corpus.append(text)
+        metadata.append({
+            "url": url,
+            "title": record.get("title", "")
+        })
+        yield text
+
+def save_store(vector_store, output_file):
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump(vector_store, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, output_file)
+
+def build_vector_database(json_file, output_file, min_df=1, max_df=1.0):
+    corpus = []      # List to store document content
+    metadata = []    # List to store corresponding metadata (URL, title)
+
+    # Hashed TF-IDF with English stop words removed, built batch by batch
+    index = HashedTfidfIndex(stop_words="english", min_df=min_df, max_df=max_df)
+    index.add_batches(iter_batches(_records(json_file, corpus, metadata)))
+
+    # Token inverted indexes for the "all query terms present" filters
+    content_index = build_inverted_index(corpus)
+    url_index = build_inverted_index([md["url"] for md in metadata])
+    # URL -> row lookups for pushing metadata filters down before scoring
+    url_row_index = build_url_row_index(metadata)
+
+    # The document vectors are derived from the index on load, so the
+    # store only carries the raw counts once.
     vector_store = {
-        "vectorizer": vectorizer,
-        "doc_vectors": doc_vectors,
+        "vectorizer": index,
         "metadata": metadata,
-        "corpus": corpus
+        "corpus": corpus,
+        "content_index": content_index,
+        "url_index": url_index,
+        "url_row_index": url_row_index
     }
-    
-    with open(output_file, "wb") as f:
-        pickle.dump(vector_store, f)
-    
-    print(f"Vector database saved to {output_file}")
-    
+    save_store(vector_store, output_file)
+    print(f"Vector database saved to {output_file}: {index.num_docs} documents, "
+          f"{index.nbytes() / 1e6:.1f} MB of term counts")
+
+def append_to_vector_database(json_file, pickle_file):
+    """
+    Add the records of json_file to an existing store as new rows. Records
+    whose URL is already in the store are skipped (rebuild to refresh them).
+    """
+    with open(pickle_file, "rb") as f:
+        vector_store = pickle.load(f)
+    index = vector_store["vectorizer"]
+    if not isinstance(index, HashedTfidfIndex):
+        raise ValueError(f"{pickle_file} was built with a fitted TfidfVectorizer; rebuild it first")
+    corpus = vector_store["corpus"]
+    metadata = vector_store["metadata"]
+    start = len(corpus)
+    known_urls = {md["url"] for md in metadata}
+
+    index.add_batches(iter_batches(_records(json_file, corpus, metadata, skip_urls=known_urls)))
+    added = len(corpus) - start
+    if not added:
+        print(f"No new records in {json_file}")
+        return 0
+
+    new_urls = [md["url"] for md in metadata[start:]]
+    add_to_inverted_index(vector_store["content_index"], corpus[start:])
+    add_to_inverted_index(vector_store["url_index"], new_urls)
+    add_to_url_row_index(vector_store["url_row_index"], new_urls)
+    save_store(vector_store, pickle_file)
+    print(f"Appended {added} documents to {pickle_file} ({index.num_docs} total)")
+    return added
+
 if __name__ == "__main__":
+    # python tfidf.py                          build the default store
+    # python tfidf.py build <json> <store>     build a store from a JSON file
+    # python tfidf.py append <json> [store]    add new records to a store
     # Update the paths as needed
     json_file = r"C:\Users\surya\Desktop\webcrawling\vector_data.json"  # or your JSON file name
     output_file = r"C:\Users\surya\Desktop\webcrawling\vector_store.pkl"
-    build_vector_database(json_file, output_file)
+    args = sys.argv[1:]
+    if args and args[0] == "append":
+        append_to_vector_database(args[1], args[2] if len(args) > 2 else output_file)
+    elif args and args[0] == "build":
+        build_vector_database(args[1], args[2] if len(args) > 2 else output_file)
+    else:
+        build_vector_database(json_file, output_file)
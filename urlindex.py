@@ -0,0 +1,83 @@
+import bisect
+from urllib.parse import urlparse
+
+def _url_key(url):
+    return (url or "").lower()
+
+def _section(parsed):
+    """First path segment of a parsed URL ("" for the site root)."""
+    return parsed.path.strip("/").split("/", 1)[0]
+
+def build_url_row_index(metadata):
+    """
+    Precompute URL -> row lookups over the store's metadata rows so that
+    filter predicates resolve to row ids without touching every record.
+    """
+    index = {
+        "url_rows": {},
+        "domain_rows": {},
+        "section_rows": {},
+        "sorted_urls": [],
+        "sorted_rows": [],
+        "num_rows": 0
+    }
+    add_to_url_row_index(index, [md.get("url", "") for md in metadata])
+    return index
+
+def add_to_url_row_index(index, urls):
+    """Register urls as new rows appended after the existing ones."""
+    start = index["num_rows"]
+    new_pairs = []
+    for offset, url in enumerate(urls):
+        row = start + offset
+        key = _url_key(url)
+        parsed = urlparse(key)
+        index["url_rows"].setdefault(key, []).append(row)
+        index["domain_rows"].setdefault(parsed.netloc, []).append(row)
+        index["section_rows"].setdefault(_section(parsed), []).append(row)
+        new_pairs.append((key, row))
+    if len(new_pairs) == 1:
+        key, row = new_pairs[0]
+        pos = bisect.bisect_right(index["sorted_urls"], key)
+        index["sorted_urls"].insert(pos, key)
+        index["sorted_rows"].insert(pos, row)
+    elif new_pairs:
+        pairs = sorted(list(zip(index["sorted_urls"], index["sorted_rows"])) + new_pairs)
+        index["sorted_urls"] = [key for key, _ in pairs]
+        index["sorted_rows"] = [row for _, row in pairs]
+    index["num_rows"] = start + len(urls)
+    return index
+
+def _prefix_rows(index, prefix):
+    prefix = _url_key(prefix)
+    lo = bisect.bisect_left(index["sorted_urls"], prefix)
+    hi = bisect.bisect_left(index["sorted_urls"], prefix + "\uffff")
+    return index["sorted_rows"][lo:hi]
+
+def resolve_rows(index, urls=None, prefix=None, section=None, domain=None):
+    """
+    Resolve filter predicates to a sorted list of row ids.
+
+    urls: exact URLs (case-insensitive), prefix: URL prefix such as
+    "https://www.acg-world.com/products", section: first path segment
+    ("products"), domain: host name ("www.acg-world.com"). Predicates are
+    ANDed together. Returns None when no predicate is given, meaning every
+    row is eligible.
+    """
+    row_sets = []
+    if urls is not None:
+        rows = set()
+        for url in urls:
+            rows.update(index["url_rows"].get(_url_key(url), ()))
+        row_sets.append(rows)
+    if prefix is not None:
+        row_sets.append(set(_prefix_rows(index, prefix)))
+    if section is not None:
+        row_sets.append(set(index["section_rows"].get(section.strip("/").lower(), ())))
+    if domain is not None:
+        row_sets.append(set(index["domain_rows"].get(domain.lower(), ())))
+    if not row_sets:
+        return None
+    row_sets.sort(key=len)
+    rows = row_sets[0].intersection(*row_sets[1:])
+    return sorted(rows)
@@ -0,0 +1,194 @@
+import os
+import sys
+import gzip
+import zlib
+import json
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timezone
+from http.client import responses as HTTP_REASONS
+
+# Raw HTTP responses kept in a WARC/1.0 file: every record is its own gzip
+# member appended to <name>.warc.gz, so the file is append-only, a crash can
+# only cut the last record, and any record can be read on its own by seeking
+# to its offset. A JSON-lines index (<name>.warc.gz.idx) maps URL -> offset,
+# length, status and date so that a re-extraction never scans the bodies.
+
+DEFAULT_ARCHIVE = r"C:\Users\surya\Desktop\webcrawling\crawl_archive.warc.gz"
+
+def index_path(archive_path):
+    return archive_path + ".idx"
+
+def _http_block(status, headers, body):
+    reason = HTTP_REASONS.get(status, "")
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    for name, value in headers.items():
+        # requests has already decoded the body; these would no longer be true.
+        if name.lower() in ("content-encoding", "transfer-encoding", "content-length"):
+            continue
+        lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1", "replace") + body
+
+class ArchiveWriter:
+    """Appends response records to a .warc.gz archive and its index. Thread-safe."""
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self._lock = threading.Lock()
+
+    def write_response(self, url, status, headers, body, charset=None):
+        """
+        Append one response. charset is the one the body was decoded with
+        when fetched; it is kept (in WARC-Identified-Payload-Type) so a
+        replay decodes the page the same way.
+        """
+        block = _http_block(status, headers, body or b"")
+        content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+        date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        warc_headers = [
+            "WARC/1.0",
+            "WARC-Type: response",
+            f"WARC-Target-URI: {url}",
+            f"WARC-Date: {date}",
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Payload-Digest: sha1:{hashlib.sha1(body or b'').hexdigest()}",
+            "Content-Type: application/http; msgtype=response",
+            f"Content-Length: {len(block)}"
+        ]
+        if charset:
+            media_type = content_type.split(";")[0].strip() or "text/html"
+            warc_headers.insert(-2, f"WARC-Identified-Payload-Type: {media_type}; charset={charset}")
+        record = ("\r\n".join(warc_headers) + "\r\n\r\n").encode("utf-8") + block + b"\r\n\r\n"
+        member = gzip.compress(record)
+        with self._lock:
+            with open(self.archive_path, "ab") as f:
+                offset = f.tell()
+                f.write(member)
+            entry = {
+                "url": url,
+                "offset": offset,
+                "length": len(member),
+                "status": status,
+                "date": date,
+                "content_type": content_type,
+                "charset": charset
+            }
+            with open(index_path(self.archive_path), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def write(self, response):
+        """Archive a requests.Response."""
+        return self.write_response(response.url, response.status_code, dict(response.headers), response.content,
+                                   charset=response.encoding)
+
+def _payload_charset(payload_type):
+    _, _, charset = payload_type.partition("charset=")
+    return charset.strip() or None
+
+def parse_record(data):
+    """Decompressed record bytes -> {"url", "date", "status", "headers", "body", "charset"}."""
+    warc_part, _, rest = data.partition(b"\r\n\r\n")
+    warc_headers = dict(
+        line.split(": ", 1) for line in warc_part.decode("utf-8").split("\r\n")[1:] if ": " in line
+    )
+    block = rest[:int(warc_headers["Content-Length"])]
+    http_part, _, body = block.partition(b"\r\n\r\n")
+    http_lines = http_part.decode("iso-8859-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in http_lines[1:] if ": " in line)
+    return {
+        "url": warc_headers["WARC-Target-URI"],
+        "date": warc_headers.get("WARC-Date"),
+        "status": int(http_lines[0].split(" ")[1]),
+        "headers": headers,
+        "body": body,
+        # Recorded since the streaming fetch; None for older records.
+        "charset": _payload_charset(warc_headers.get("WARC-Identified-Payload-Type", ""))
+    }
+
+def read_index(archive_path):
+    """Index entries in archive order; rebuilt from the archive if the index is missing."""
+    if not os.path.exists(index_path(archive_path)):
+        rebuild_index(archive_path)
+    entries = []
+    with open(index_path(archive_path), "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+def rebuild_index(archive_path):
+    """Scan the archive member by member and rewrite its index."""
+    count = 0
+    size = os.path.getsize(archive_path)
+    with open(archive_path, "rb") as f, open(index_path(archive_path), "w", encoding="utf-8") as out:
+        offset = 0
+        while offset < size:
+            # One gzip member per record: feed it in chunks until the member
+            # ends; unused_data tells how far past its end the last chunk went.
+            f.seek(offset)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            parts = []
+            consumed = 0
+            try:
+                while not decompressor.eof:
+                    chunk = f.read(1 << 16)
+                    if not chunk:
+                        break
+                    parts.append(decompressor.decompress(chunk))
+                    consumed += len(chunk)
+            except zlib.error:
+                print(f"Stopping at damaged record at offset {offset}")
+                break
+            if not decompressor.eof:
+                print(f"Ignoring truncated record at offset {offset}")
+                break
+            length = consumed - len(decompressor.unused_data)
+            parsed = parse_record(b"".join(parts))
+            out.write(json.dumps({
+                "url": parsed["url"], "offset": offset, "length": length, "status": parsed["status"],
+                "date": parsed["date"], "content_type": parsed["headers"].get("Content-Type", ""),
+                "charset": parsed["charset"]
+            }) + "\n")
+            offset += length
+            count += 1
+    print(f"Indexed {count} records in {archive_path}")
+    return count
+
+def latest_entries(archive_path, status=200):
+    """The newest record per URL (optionally only those with the given status), in archive order."""
+    latest = {}
+    for entry in read_index(archive_path):
+        latest[entry["url"]] = entry
+    entries = [entry for entry in latest.values() if status is None or entry["status"] == status]
+    return sorted(entries, key=lambda entry: entry["offset"])
+
+def iter_records(archive_path, entries=None):
+    """Yield parsed records for entries (default: every record), reading the file front to back."""
+    if entries is None:
+        entries = read_index(archive_path)
+    with open(archive_path, "rb") as f:
+        for entry in sorted(entries, key=lambda e: e["offset"]):
+            f.seek(entry["offset"])
+            yield parse_record(gzip.decompress(f.read(entry["length"])))
+
+def main():
+    # python webarchive.py [archive]: summary of what the archive holds
+    # python webarchive.py reindex [archive]: rebuild the .idx from the records
+    args = sys.argv[1:]
+    if args and args[0] == "reindex":
+        rebuild_index(args[1] if len(args) > 1 else DEFAULT_ARCHIVE)
+        return
+    archive_path = args[0] if args else DEFAULT_ARCHIVE
+    entries = read_index(archive_path)
+    statuses = {}
+    for entry in entries:
+        statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+    print(f"{archive_path}: {len(entries)} records, {len({e['url'] for e in entries})} URLs, "
+          f"{os.path.getsize(archive_path) / 1e6:.1f} MB; by status: {statuses}")
+
+if __name__ == "__main__":
+    main()